@@ -1,14 +0,0 @@
-# declare all globales here so all the module can share them
-global _width, _height, _spaceships, _missiles, _planets, _frame_rate,        \
-    _show_frame_rate, _wall_thickness, _human_enabled, _grav_const
-# one needs to initialize them # TODO smarter way?
-_width = None
-_height = None
-_spaceships = None
-_missiles = None
-_planets = None
-_frame_rate = None
-_show_frame_rate = None
-_wall_thickness = None
-_human_enabled = None
-_grav_const = None
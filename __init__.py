@@ -1,9 +1,42 @@
 __author__ = "Devirm Celik"
 __version__ = "PRE-ALPHA"
 
-from simulation import spaceship_simulation
+import importlib
 
-import logging
-# write log into file only if level exceeds INFO (this is done becuase p5
-# logging, which is a lot of unnecessary stuff, is from level DEBUG)
-logging.basicConfig(filename='simulation.log',level=logging.INFO)
+# nothing is imported up front: the core (World and everything it uses)
+# only needs NumPy, while the interactive sketch pulls in p5 (and OpenGL)
+# and sets up the logging into simulation.log; every name is imported from
+# its module when it is first accessed
+_LAZY = {
+    "spaceship_simulation": "simulation",
+    "replay_simulation": "simulation",
+    "Sketch": "simulation",
+    "World": "world",
+    "step_worlds": "world",
+    "Scenario": "scenario",
+    "load_scenario": "scenario",
+    "VecSpaceshipEnv": "vec_env",
+    "RolloutPool": "rollout_pool",
+    "ObservationBuilder": "observations",
+    "TrajectoryRecorder": "recorder",
+    "TrajectoryReader": "recorder",
+    "DeltaWriter": "delta",
+    "DeltaReader": "delta",
+    "LockstepServer": "server",
+    "LockstepClient": "server",
+}
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(
+            __name__, name))
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
@@ -0,0 +1,229 @@
+__author__ = "Devrim Celik"
+
+import time
+import numpy as np
+from physics import grav_force
+
+
+class BarnesHutTree():
+    """
+    Quadtree over the planets, used to approximate gravity. Every node knows
+    the total mass and the centre of mass of the planets inside of it, so a
+    node which is far away (compared to its size) can pull like one single
+    planet. How far away is far enough is set by the opening angle theta:
+    theta=0 opens every node (exact), larger values are faster but coarser.
+
+    The tree is stored as flat arrays and evaluated for all bodies at once,
+    walking down the tree level by level with a frontier of (body, node)
+    pairs.
+    """
+    def __init__(self, planet_positions, planet_masses, leaf_size=4):
+        """
+        args
+            planet_positions    (ndarray)   (P, 2) positions of the planets
+            planet_masses       (ndarray)   (P,) masses of the planets
+            leaf_size           (int)       maximal number of planets in a
+                                                leaf (unless they share one
+                                                position)
+        """
+        positions = np.asarray(planet_positions, dtype=np.float64)
+        masses = np.asarray(planet_masses, dtype=np.float64)
+
+        com = []
+        mass = []
+        size = []
+        children = []
+        leaf_range = []
+        # planets reordered so every leaf covers a contiguous range
+        order = np.arange(len(positions))
+
+        if len(positions):
+            lo = positions.min(axis=0)
+            side = max(float((positions.max(axis=0) - lo).max()), 1e-9)
+            # (node index, start, stop, corner, side length)
+            stack = [(0, 0, len(positions), lo, side)]
+            self._new_node(com, mass, size, children, leaf_range)
+            while stack:
+                node, start, stop, corner, side = stack.pop()
+                idx = order[start:stop]
+                node_mass = masses[idx].sum()
+                mass[node] = node_mass
+                size[node] = side
+                if node_mass > 0:
+                    com[node] = (positions[idx] * masses[idx, None]).sum(0) \
+                        / node_mass
+                else:
+                    com[node] = positions[idx].mean(axis=0)
+
+                if stop - start <= leaf_size or side < 1e-6:
+                    leaf_range[node] = (start, stop)
+                    continue
+
+                # sort the planets of this node by quadrant
+                half = side / 2
+                right = positions[idx, 0] >= corner[0] + half
+                upper = positions[idx, 1] >= corner[1] + half
+                quadrant = right * 2 + upper
+                sort = np.argsort(quadrant, kind="stable")
+                order[start:stop] = idx[sort]
+                bounds = start + np.searchsorted(quadrant[sort], np.arange(5))
+                for q in range(4):
+                    if bounds[q] == bounds[q + 1]:
+                        continue
+                    child = self._new_node(com, mass, size, children,
+                                            leaf_range)
+                    children[node][q] = child
+                    child_corner = corner + half * np.array([q // 2, q % 2])
+                    stack.append((child, int(bounds[q]), int(bounds[q + 1]),
+                                    child_corner, half))
+
+        self.com = np.array(com, dtype=np.float64).reshape(-1, 2)
+        self.mass = np.array(mass, dtype=np.float64)
+        self.size = np.array(size, dtype=np.float64)
+        self.children = np.array(children, dtype=np.intp).reshape(-1, 4)
+        self.leaf_range = np.array(leaf_range, dtype=np.intp).reshape(-1, 2)
+        self.is_leaf = self.leaf_range[:, 1] > self.leaf_range[:, 0]
+        self.planet_positions = positions[order]
+        self.planet_masses = masses[order]
+
+
+
+    @staticmethod
+    def _new_node(com, mass, size, children, leaf_range):
+        """
+        Append an empty node to the node lists and return its index
+        """
+        com.append((0.0, 0.0))
+        mass.append(0.0)
+        size.append(0.0)
+        children.append([-1, -1, -1, -1])
+        leaf_range.append((0, 0))
+        return len(mass) - 1
+
+
+
+    def __len__(self):
+        return len(self.mass)
+
+
+
+    def grav_force(self, positions, masses, grav_const=1, softening=0.0,
+        theta=0.5):
+        """
+        Approximate the total gravitational force of all planets upon all
+        bodies, see physics.grav_force for the exact version
+        args
+            positions   (ndarray)   (N, 2) positions of the bodies
+            masses      (ndarray)   (N,) masses of the bodies
+            grav_const  (float)     gravitational constant
+            softening   (float)     softening length
+            theta       (float)     opening angle, a node is used as a whole
+                                        if size/distance < theta
+        returns
+            force       (ndarray)   (N, 2) total pull on every body
+        """
+        positions = np.asarray(positions, dtype=np.float64)
+        n_bodies = len(positions)
+        fx = np.zeros(n_bodies)
+        fy = np.zeros(n_bodies)
+        if n_bodies == 0 or len(self) == 0:
+            return np.zeros((n_bodies, 2))
+
+        def pull(bodies, targets, target_mass):
+            # add the pull of point masses onto the bodies
+            d = targets - positions[bodies]
+            dist2 = np.einsum("ij,ij->i", d, d) + softening**2
+            with np.errstate(divide="ignore"):
+                inv_dist3 = np.where(dist2 > 0, dist2, np.inf)**-1.5
+            strength = target_mass * inv_dist3
+            fx[:] += np.bincount(bodies, d[:, 0] * strength,
+                                    minlength=n_bodies)
+            fy[:] += np.bincount(bodies, d[:, 1] * strength,
+                                    minlength=n_bodies)
+
+        bodies = np.arange(n_bodies)
+        nodes = np.zeros(n_bodies, dtype=np.intp)
+        while len(bodies):
+            d = self.com[nodes] - positions[bodies]
+            dist2 = np.einsum("ij,ij->i", d, d)
+            far = self.size[nodes]**2 < theta**2 * dist2
+
+            # far away nodes pull as one point mass
+            pull(bodies[far], self.com[nodes[far]], self.mass[nodes[far]])
+
+            # close leafs are summed up exactly
+            leaf = ~far & self.is_leaf[nodes]
+            leaf_bodies, leaf_nodes = bodies[leaf], nodes[leaf]
+            start = self.leaf_range[leaf_nodes, 0]
+            count = self.leaf_range[leaf_nodes, 1] - start
+            group_start = np.repeat(np.cumsum(count) - count, count)
+            planets = np.repeat(start, count) + \
+                np.arange(int(count.sum())) - group_start
+            pull(np.repeat(leaf_bodies, count), self.planet_positions[planets],
+                    self.planet_masses[planets])
+
+            # all other nodes get opened
+            inner = ~far & ~self.is_leaf[nodes]
+            bodies = np.repeat(bodies[inner], 4)
+            nodes = self.children[nodes[inner]].ravel()
+            bodies, nodes = bodies[nodes >= 0], nodes[nodes >= 0]
+
+        force = np.stack((fx, fy), axis=-1)
+        force *= grav_const * np.asarray(masses)[:, np.newaxis]
+        return force
+
+
+
+
+
+def error_report(positions, masses, planet_positions, planet_masses,
+    thetas=(0.2, 0.4, 0.6, 0.8, 1.0), grav_const=1, softening=0.0,
+    leaf_size=4):
+    """
+    Compare Barnes-Hut gravity against the exact summation for a number of
+    opening angles, to help picking theta for a map
+    args
+        positions           (ndarray)   (N, 2) positions of the bodies
+        masses              (ndarray)   (N,) masses of the bodies
+        planet_positions    (ndarray)   (P, 2) positions of the planets
+        planet_masses       (ndarray)   (P,) masses of the planets
+        thetas              (tuple)     opening angles to evaluate
+        grav_const          (float)     gravitational constant
+        softening           (float)     softening length
+        leaf_size           (int)       maximal number of planets per leaf
+    returns
+        report              (list)      one dict per theta with the median,
+                                            99th percentile and maximum of
+                                            the relative error of the force
+                                            and the time in seconds it took
+                                            (next to the exact time)
+    """
+    start = time.perf_counter()
+    exact = grav_force(positions, masses, planet_positions, planet_masses,
+                        grav_const, softening)
+    exact_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tree = BarnesHutTree(planet_positions, planet_masses, leaf_size)
+    build_time = time.perf_counter() - start
+
+    norm = np.hypot(exact[:, 0], exact[:, 1])
+    norm[norm == 0] = 1
+    report = []
+    for theta in thetas:
+        start = time.perf_counter()
+        approx = tree.grav_force(positions, masses, grav_const, softening,
+                                    theta)
+        approx_time = time.perf_counter() - start
+        error = np.hypot(*(approx - exact).T) / norm
+        report.append({
+            "theta": theta,
+            "median_error": float(np.median(error)) if len(error) else 0.0,
+            "p99_error": float(np.percentile(error, 99))
+                            if len(error) else 0.0,
+            "max_error": float(error.max()) if len(error) else 0.0,
+            "time": approx_time,
+            "build_time": build_time,
+            "exact_time": exact_time,
+        })
+    return report
@@ -0,0 +1,376 @@
+__author__ = "Devrim Celik"
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+from world import World
+from fused import HAVE_NUMBA
+from reference import ReferenceWorld
+from vec_env import VecSpaceshipEnv, N_ACTIONS
+
+# implementations of a single world that can be benchmarked
+IMPLEMENTATIONS = {
+    "world": lambda **kwargs: World(**kwargs),
+    "fused": lambda **kwargs: World(fused=True, **kwargs),
+    "reference": lambda **kwargs: ReferenceWorld(**kwargs),
+}
+
+# (spaceships, missiles, planets, gravity mode) of the world sweeps, the
+# reference implementation only runs exact gravity up to REFERENCE_LIMIT
+# entities and the fused world only exact gravity
+WORLD_SWEEP = [(n, 0, 8, "exact") for n in (10, 100, 1000, 10000)] + \
+    [(10, n, 8, "exact") for n in (100, 1000, 10000)] + \
+    [(100, 0, n, mode) for mode in ("exact", "barnes_hut", "field")
+        for n in (1, 10, 100, 1000)]
+QUICK_WORLD_SWEEP = [(10, 0, 8, "exact"), (100, 0, 8, "exact"),
+                        (10, 1000, 8, "exact"), (100, 0, 100, "exact"),
+                        (100, 0, 100, "barnes_hut"), (100, 0, 100, "field")]
+REFERENCE_LIMIT = 2000
+
+# numbers of parallel environments of the VecSpaceshipEnv sweep
+ENV_SWEEP = [1, 16, 256, 4096]
+QUICK_ENV_SWEEP = [1, 256]
+
+
+def populate(world, n_ships, n_missiles, n_planets, seed=0):
+    """
+    Fill a world with randomly placed entities. Missiles are slow, so most of
+    them stay on the screen during the benchmark.
+    args
+        world           (World)     World or ReferenceWorld
+        n_ships         (int)       number of spaceships
+        n_missiles      (int)       number of missiles
+        n_planets       (int)       number of planets
+        seed            (int)       seed of the placement
+    """
+    rng = np.random.default_rng(seed)
+    margin = world.wall_thickness + 40
+    def place():
+        return (rng.uniform(margin, world.width - margin),
+                rng.uniform(margin, world.height - margin))
+    for _ in range(n_planets):
+        world.add_planet(*place(), mass=float(rng.uniform(10, 40)))
+    for _ in range(n_ships):
+        world.add_spaceship(*place(), direction=float(rng.uniform(0, 6.3)),
+                            mass=float(rng.uniform(5, 15)),
+                            enable_audio=False)
+    for _ in range(n_missiles):
+        world.add_missile(*place(), float(rng.uniform(0, 6.3)),
+                            speed=float(rng.uniform(0.1, 0.5)))
+
+
+
+def _n_entities(world):
+    if isinstance(world, ReferenceWorld):
+        return len(world.spaceships) + len(world.missiles)
+    return world.ship_state.count + world.missile_state.count
+
+
+
+def _measure(build, run, n_steps, min_time, repeats=5):
+    """
+    Time run(build(), steps) repeats times, each time from a freshly built
+    state, so every repeat times the same steps. The first step after
+    building is not timed, it includes one-off work such as baking a
+    gravity field or building a quadtree. The number of steps is
+    taken in batches of n_steps until the first repeat took min_time
+    seconds. A single timing is easily off by tens of percent on a busy
+    machine, the best of several is not.
+    returns
+        best and median seconds per step of the repeats, number of steps
+        per repeat
+    """
+    state = build()
+    run(state, 1)
+    elapsed = 0.0
+    steps = 0
+    while elapsed < min_time or not steps:
+        start = time.perf_counter()
+        run(state, n_steps)
+        elapsed += time.perf_counter() - start
+        steps += n_steps
+    times = [elapsed]
+    for _ in range(repeats - 1):
+        state = build()
+        run(state, 1)
+        start = time.perf_counter()
+        run(state, steps)
+        times.append(time.perf_counter() - start)
+    times = np.array(times) / steps
+    return times.min(), np.median(times), steps
+
+
+
+def _peak_memory(build, run, n_steps):
+    """
+    Peak of the memory allocated while building and stepping, in bytes
+    (numpy allocations are traced as well)
+    """
+    tracemalloc.start()
+    try:
+        run(build(), n_steps)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+
+def bench_world(impl, n_ships, n_missiles, n_planets, gravity_mode="exact",
+    n_steps=10, min_time=0.2, repeats=5, seed=0):
+    """
+    Benchmark the step of a single world
+    args
+        impl            (str)       key of IMPLEMENTATIONS
+        n_ships         (int)       number of spaceships
+        n_missiles      (int)       number of missiles
+        n_planets       (int)       number of planets
+        gravity_mode    (str)       gravity mode of the World, only "exact"
+                                        for the reference implementation
+        n_steps         (int)       steps per timed batch
+        min_time        (float)     minimal seconds to time per repeat
+        repeats         (int)       number of timings, see _measure
+        seed            (int)       seed of the placement
+    returns
+        result          (dict)      steps_per_s is that of the best repeat
+    """
+    kwargs = {} if impl == "reference" else {"gravity_mode": gravity_mode}
+    def build():
+        world = IMPLEMENTATIONS[impl](**kwargs)
+        populate(world, n_ships, n_missiles, n_planets, seed)
+        return world
+
+    # the number of entities changes through hits, take the mean
+    entities = []
+    def run(world, n):
+        entities.append(_n_entities(world))
+        world.step(n)
+        entities.append(_n_entities(world))
+    seconds, median, total_steps = _measure(build, run, n_steps, min_time,
+                                            repeats)
+
+    return {
+        "benchmark": "world",
+        "impl": impl,
+        "params": {"ships": n_ships, "missiles": n_missiles,
+                    "planets": n_planets, "gravity": gravity_mode},
+        "steps": total_steps,
+        "steps_per_s": 1 / seconds,
+        "median_steps_per_s": 1 / median,
+        "ns_per_entity_step": seconds * 1e9 / max(np.mean(entities), 1),
+        "peak_memory_mb": _peak_memory(build, lambda w, n: w.step(n),
+                                        n_steps) / 2**20,
+    }
+
+
+
+def bench_vec_env(num_envs, num_spaceships=2, num_planets=2, n_steps=10,
+    min_time=0.2, repeats=5, seed=0):
+    """
+    Benchmark the step of a VecSpaceshipEnv with random actions
+    args
+        num_envs        (int)       number of parallel environments
+        num_spaceships  (int)       spaceships per environment
+        num_planets     (int)       planets per environment
+        n_steps         (int)       steps per timed batch
+        min_time        (float)     minimal seconds to time per repeat
+        repeats         (int)       number of timings, see _measure
+        seed            (int)       seed of the environments and actions
+    returns
+        result          (dict)      steps_per_s is that of the best repeat
+    """
+    rng = np.random.default_rng(seed)
+    actions = rng.integers(0, N_ACTIONS, (64, num_envs, num_spaceships))
+
+    def build():
+        env = VecSpaceshipEnv(num_envs, num_spaceships, num_planets,
+                                seed=seed)
+        env.reset()
+        return env
+
+    def run(env, n):
+        for i in range(n):
+            env.step(actions[i % len(actions)])
+
+    seconds, median, total_steps = _measure(build, run, n_steps, min_time,
+                                            repeats)
+    return {
+        "benchmark": "vec_env",
+        "impl": "vec_env",
+        "params": {"envs": num_envs, "ships": num_spaceships,
+                    "planets": num_planets},
+        "steps": total_steps,
+        "steps_per_s": 1 / seconds,
+        "median_steps_per_s": 1 / median,
+        "env_steps_per_s": num_envs / seconds,
+        "ns_per_entity_step": seconds * 1e9 / (num_envs * num_spaceships),
+        "peak_memory_mb": _peak_memory(build, run, n_steps) / 2**20,
+    }
+
+
+
+def run_suite(quick=False, reference=True, min_time=0.2, repeats=5,
+    log=None):
+    """
+    Run all sweeps
+    args
+        quick           (bool)      only a few small cases
+        reference       (bool)      also run the reference implementation
+        min_time        (float)     minimal seconds to time per repeat
+        repeats         (int)       number of timings per case
+        log             (function)  called with every result, e.g. print
+    returns
+        results         (list)      of result dicts
+    """
+    results = []
+    def add(result):
+        results.append(result)
+        if log is not None:
+            log(result)
+
+    timing = dict(min_time=min_time, repeats=repeats)
+    for n_ships, n_missiles, n_planets, mode in (QUICK_WORLD_SWEEP if quick
+                                                    else WORLD_SWEEP):
+        add(bench_world("world", n_ships, n_missiles, n_planets, mode,
+                        **timing))
+        if mode != "exact":
+            continue
+        # without numba the fused world runs the same NumPy code
+        if HAVE_NUMBA:
+            add(bench_world("fused", n_ships, n_missiles, n_planets,
+                            **timing))
+        if reference and n_ships + n_missiles <= REFERENCE_LIMIT:
+            add(bench_world("reference", n_ships, n_missiles, n_planets,
+                            n_steps=1, **timing))
+    for num_envs in (QUICK_ENV_SWEEP if quick else ENV_SWEEP):
+        add(bench_vec_env(num_envs, **timing))
+    return results
+
+
+
+def _key(result):
+    return (result["benchmark"], result["impl"],
+            tuple(sorted(result["params"].items())))
+
+
+
+def speedups(results):
+    """
+    Speedup of every world result over the reference implementation with
+    the same parameters
+    args
+        results         (list)      of result dicts
+    returns
+        speedups        (dict)      parameters -> speedup
+    """
+    by_key = {_key(r): r for r in results}
+    out = {}
+    for result in results:
+        if result["impl"] != "world":
+            continue
+        ref = by_key.get(("world", "reference") + _key(result)[2:])
+        if ref is not None:
+            out[_key(result)[2]] = result["steps_per_s"] / ref["steps_per_s"]
+    return out
+
+
+
+def save_baseline(results, path):
+    """
+    Store results as a json baseline
+    args
+        results         (list)      of result dicts
+        path            (str)       file to write
+    """
+    with open(path, "w") as f:
+        json.dump({"python": platform.python_version(),
+                    "numpy": np.__version__,
+                    "machine": platform.machine(),
+                    "results": results}, f, indent=2)
+
+
+
+def compare(results, baseline_path, threshold=0.1):
+    """
+    Find the cases that got slower than in a baseline. Both sides are the
+    best of several repeats (see _measure), so a single slow timing does
+    not count as a regression.
+    args
+        results         (list)      of result dicts
+        baseline_path   (str)       json file written by save_baseline
+        threshold       (float)     allowed relative loss of the best
+                                        steps_per_s
+    returns
+        regressions     (list)      of (result, baseline result, ratio)
+    """
+    with open(baseline_path) as f:
+        baseline = {_key(r): r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        old = baseline.get(_key(result))
+        if old is None:
+            continue
+        ratio = result["steps_per_s"] / old["steps_per_s"]
+        if ratio < 1 - threshold:
+            regressions.append((result, old, ratio))
+    return regressions
+
+
+
+def _label(result):
+    params = " ".join("{}={}".format(k, v)
+                        for k, v in result["params"].items())
+    return "{:<8}{:<10}{:<52}".format(result["benchmark"], result["impl"],
+                                        params)
+
+
+
+def _format(result):
+    return "{}{:>12.1f} steps/s{:>12.1f} ns/entity-step{:>10.1f} MB".format(
+                                _label(result), result["steps_per_s"],
+                                result["ns_per_entity_step"],
+                                result["peak_memory_mb"])
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the headless physics")
+    parser.add_argument("--quick", action="store_true",
+                        help="only run a few small cases")
+    parser.add_argument("--no-reference", action="store_true",
+                        help="skip the object-per-entity implementation")
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="minimal seconds to time per repeat")
+    parser.add_argument("--repeats", type=int, default=5,
+                        help="timings per case, the best counts")
+    parser.add_argument("--save", help="store the results as baseline")
+    parser.add_argument("--baseline", help="compare against this baseline")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="allowed relative slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.quick, not args.no_reference, args.min_time,
+                        args.repeats,
+                        log=lambda result: print(_format(result)))
+    for params, speedup in speedups(results).items():
+        print("speedup over reference {}: {:.1f}x".format(
+            " ".join("{}={}".format(k, v) for k, v in params), speedup))
+    if args.save:
+        save_baseline(results, args.save)
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.threshold)
+        for result, old, ratio in regressions:
+            print("REGRESSION {}: {:.1f} -> {:.1f} steps/s ({:+.0%})".format(
+                _label(result).rstrip(), old["steps_per_s"],
+                result["steps_per_s"], ratio - 1))
+        return 1 if regressions else 0
+    return 0
+
+
+
+if __name__ == "__main__":
+    sys.exit(main())
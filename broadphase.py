@@ -0,0 +1,126 @@
+__author__ = "Devrim Celik"
+
+import numpy as np
+
+# upper limit for the number of cells of a grid, so a tiny cell size in a
+# huge world does not allocate millions of empty cells
+_MAX_CELLS = 1 << 16
+
+
+class UniformGrid():
+    """
+    Broadphase index over a set of points. The world is divided into square
+    cells with a side length of at least the largest interaction distance, so
+    everything a query point can touch lies in the 3x3 cells around it. The
+    grid is a sorted cell list, rebuilding it every step is a handful of
+    vectorized operations.
+    """
+    def __init__(self, width, height):
+        """
+        args
+            width       (float)     width of the world
+            height      (float)     height of the world
+        """
+        self.width = width
+        self.height = height
+        self.cell_size = None
+        self.shape = (0, 0)
+        self.order = np.zeros(0, dtype=np.intp)
+        self.cell_start = np.zeros(1, dtype=np.intp)
+
+
+
+    def _cells(self, positions):
+        """
+        Calculate the (x, y) cell coordinates of positions, points outside of
+        the world are clamped into the border cells
+        """
+        cells = np.floor(positions / self.cell_size).astype(np.intp)
+        np.clip(cells[:, 0], 0, self.shape[0] - 1, out=cells[:, 0])
+        np.clip(cells[:, 1], 0, self.shape[1] - 1, out=cells[:, 1])
+        return cells
+
+
+
+    def build(self, positions, cell_size):
+        """
+        Sort the points into the cells of the grid
+        args
+            positions   (ndarray)   (N, 2) positions of the indexed points
+            cell_size   (float)     minimal side length of a cell, has to be
+                                        at least the largest distance at
+                                        which a query and a point interact
+        """
+        cell_size = max(float(cell_size), 1e-9,
+                        np.sqrt(self.width * self.height / _MAX_CELLS))
+        self.cell_size = cell_size
+        self.shape = (int(self.width // cell_size) + 1,
+                        int(self.height // cell_size) + 1)
+        cells = self._cells(np.asarray(positions, dtype=np.float64))
+        flat = cells[:, 0] * self.shape[1] + cells[:, 1]
+        # points ordered by cell, cell_start[c]:cell_start[c+1] are the
+        # points inside of cell c
+        self.order = np.argsort(flat, kind="stable")
+        counts = np.bincount(flat, minlength=self.shape[0] * self.shape[1])
+        self.cell_start = np.concatenate(([0], np.cumsum(counts)))
+
+
+
+    def query(self, positions):
+        """
+        Find all indexed points in the neighbourhood of query points
+        args
+            positions   (ndarray)   (Q, 2) positions of the query points
+        returns
+            query_rows  (ndarray)   index of the query point of every
+                                        candidate pair
+            point_rows  (ndarray)   index of the indexed point of every
+                                        candidate pair
+        """
+        positions = np.asarray(positions, dtype=np.float64)
+        n_query = len(positions)
+        if n_query == 0 or len(self.order) == 0:
+            empty = np.zeros(0, dtype=np.intp)
+            return empty, empty
+
+        cells = self._cells(positions)
+        offsets = np.array([(dx, dy) for dx in (-1, 0, 1)
+                                        for dy in (-1, 0, 1)])
+        # (Q, 9, 2) neighbour cells of every query point
+        neigh = cells[:, np.newaxis, :] + offsets[np.newaxis, :, :]
+        valid = (neigh[..., 0] >= 0) & (neigh[..., 0] < self.shape[0]) & \
+            (neigh[..., 1] >= 0) & (neigh[..., 1] < self.shape[1])
+        flat = neigh[..., 0] * self.shape[1] + neigh[..., 1]
+        flat = np.where(valid, flat, 0)
+
+        start = self.cell_start[flat]
+        count = np.where(valid, self.cell_start[flat + 1] - start, 0)
+
+        # expand every (query point, cell) into one pair per point in the cell
+        count = count.ravel()
+        total = int(count.sum())
+        query_rows = np.repeat(np.repeat(np.arange(n_query), 9), count)
+        # position of every pair within its cell
+        group_start = np.repeat(np.cumsum(count) - count, count)
+        within = np.arange(total) - group_start
+        point_rows = self.order[np.repeat(start.ravel(), count) + within]
+        return query_rows, point_rows
+
+
+
+
+
+def candidate_pairs(grid, query_positions, positions, reach):
+    """
+    Rebuild grid over positions and return all pairs of query points and
+    points which might be closer than reach
+    args
+        grid                (UniformGrid)   grid to (re)build
+        query_positions     (ndarray)       (Q, 2) positions of query points
+        positions           (ndarray)       (N, 2) positions of the points
+        reach               (float)         largest interaction distance
+    returns
+        (query_rows, point_rows) of the candidate pairs
+    """
+    grid.build(positions, reach)
+    return grid.query(query_positions)
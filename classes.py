@@ -1,45 +1,125 @@
 __author__ = "Devrim Celik"
 
-from p5 import *
-import simpleaudio as sa
-import logging
+from math import cos, sin
+import numpy as np
+from physics import grav_force
 
-class Missile():
+
+class Entity():
     """
-    Missile Class, represented by a small black dot.
+    Thin handle to one row of an EntityStore of a World. A handle holds no
+    state itself, every attribute is read from and written to the arrays of
+    the world, so creating and dropping handles is cheap.
     """
-    def __init__(self, x, y, direction, speed=None, mass=None):
+    # name of the EntityStore attribute of the world, set by the subclasses
+    _store_name = None
+
+    def __init__(self, world, eid):
         """
         args
-            x           (float)     x position of spawning location
-            y           (flaot)     y position of spawning location
-            direction   (float)     angle (in radians) of current direction
-            speed       (float)     magnitude of velocity (speed)
-            radius      (flaot)     radius of missiles circles
+            world       (World)     world the entity lives in
+            eid         (int)       id of the entity in its store
         """
-        self.position = Vector(x,y)
+        self.world = world
+        self.eid = eid
+
+
+
+    @property
+    def _store(self):
+        return getattr(self.world, self._store_name)
+
+
+
+    @property
+    def _row(self):
+        return self._store.row(self.eid)
+
+
+
+    def __eq__(self, other):
+        return type(self) == type(other) and self.world is other.world and \
+            self.eid == other.eid
+
+
+
+    def __hash__(self):
+        return hash((self._store_name, self.eid))
+
+
+
+    def __repr__(self):
+        if not self.alive:
+            return "{}(eid={}, removed)".format(self.__class__.__name__,
+                                                self.eid)
+        return "{}(eid={}, position=({:.2f}, {:.2f}), velocity=({:.2f}, "  \
+            "{:.2f}), mass={})".format(self.__class__.__name__, self.eid,
+                                        *self.position, *self.velocity,
+                                        self.mass)
+
+
+
+    @property
+    def alive(self):
+        store = self._store
+        return self.eid in store and bool(store.alive[store.row(self.eid)])
+
+    @property
+    def position(self):
+        # this is a view, so in place changes are written to the world
+        return self._store.position[self._row]
+
+    @position.setter
+    def position(self, value):
+        self._store.position[self._row] = value
+
+    @property
+    def velocity(self):
+        return self._store.velocity[self._row]
+
+    @velocity.setter
+    def velocity(self, value):
+        self._store.velocity[self._row] = value
+
+    @property
+    def acceleration(self):
+        return self._store.acceleration[self._row]
+
+    @acceleration.setter
+    def acceleration(self, value):
+        self._store.acceleration[self._row] = value
 
-        # calculate the force vector, given the current direction
-        force = Vector(cos(direction),sin(direction))
-        if speed == None:
-            self.velocity = force * 10
-        else:
-            self.velocity = force * speed
+    @property
+    def mass(self):
+        return float(self._store.mass[self._row])
 
-        if mass == None:
-            self.mass = 20
-        else:
-            self.mass = mass
-        self.radius = self.mass/10
+    @mass.setter
+    def mass(self, value):
+        self._store.mass[self._row] = value
+
+    @property
+    def radius(self):
+        return float(self._store.radius[self._row])
+
+    @radius.setter
+    def radius(self, value):
+        self._store.radius[self._row] = value
+
+    @property
+    def direction(self):
+        return float(self._store.direction[self._row])
+
+    @direction.setter
+    def direction(self, value):
+        self._store.direction[self._row] = value
 
-        self.acceleration = Vector(0,0)
 
 
     def addForce(self, boost):
         """
         Apply boost onto acceleration
         args
-            boost                   (Vector)    vector describing where a force
+            boost                   (ndarray)   vector describing where a force
                                                 is pushing and how strong it is
                                                 (depending on its magnitude)
         """
@@ -47,46 +127,37 @@ class Missile():
 
 
 
-    def grav_Force(self, _planets, _grav_const):
+    def grav_Force(self):
         """
-        Given the list of planets, calculate the total gravitation Force
-        upon the missile and add it to the acceleration
-        args
-            _planets        (list)          list of all current Planet objects
-            _grav_const     (float)         gravitational constant of the
+        Calculate the total gravitation Force of all planets of the world
+        upon this entity and add it to the acceleration
         """
-        for p in _planets:
-            # Vector towards planet
-            pull_v = Vector((p.position.x - self.position.x),
-                            (p.position.y - self.position.y))
-            # length between spaceship and planet
-            dist = pull_v.magnitude
-            # normalize vector so we can choose its strength
-            pull_v.normalize()
-            # equation for gravitational force
-            pull_v *= (_grav_const*self.mass*p.mass)/(dist**2)
+        world = self.world
+        planets = world.planet_state
+        row = self._row
+        store = self._store
+        self.addForce(grav_force(store.position[row:row+1],
+                                    store.mass[row:row+1], planets.position,
+                                    planets.mass, world.grav_const,
+                                    world.softening)[0])
 
-            self.addForce(pull_v)
 
 
 
-    def update(self, _planets, _grav_const):
-        """
-        Given the current position velocity and acceleration,
-        calculate new position
-        """
-        self.grav_Force(_planets, _grav_const)
-        self.velocity += self.acceleration
-        self.position += self.velocity
-        self.acceleration *= 0
 
+class Missile(Entity):
+    """
+    Missile Class, represented by a small black dot.
+    """
+    _store_name = "missile_state"
 
     def display(self):
         """
         Draw missile on sketch
         """
-        fill(0)
-        circle(self.position, self.radius, mode="RADIUS")
+        # rendering is imported here, so the physics can run without p5
+        from render import draw_missile
+        draw_missile(self)
 
 
 
@@ -97,34 +168,18 @@ class Missile():
         returns
             (boolean)   true if still on screen, false otherwise
         """
-        return (self.position.x <= width and self.position.x >= 0 and self.position.y <= height and self.position.y >= 0)
+        return (0 <= self.position[0] <= self.world.width and
+                0 <= self.position[1] <= self.world.height)
 
 
 
 
 
-class Planet():
+class Planet(Entity):
     """
-    Missile Class, represented by a small black dot.
+    Planet Class, represented by a blue circle.
     """
-    def __init__(self, x, y, mass=None):
-        """
-        args
-            x           (float)     x position of spawning location
-            y           (flaot)     y position of spawning location
-            mass        (float)     mass of the planet (force calculations)
-        """
-        self.position = Vector(x,y)
-
-        if mass == None:
-            self.mass = 30
-        else:
-            self.mass = mass
-
-        self.radius = self.mass/2
-
-        logging.info("[*] Planet created")
-
+    _store_name = "planet_state"
 
     def is_inside(self, x, y):
         """
@@ -135,8 +190,8 @@ class Planet():
         returns
             bool
         """
-        return (x - self.position.x)**2 +   \
-            (y - self.position.y)**2 < self.radius**2
+        return (x - self.position[0])**2 +   \
+            (y - self.position[1])**2 < self.radius**2
 
 
 
@@ -151,80 +206,45 @@ class Planet():
 
     def display(self):
         """
-        Draw missile on sketch
+        Draw planet on sketch
         """
-        fill(50, 175, 200)
-        circle(self.position, self.radius, mode="RADIUS")
+        from render import draw_planet
+        draw_planet(self)
 
 
 
 
 
-class Spaceship():
+class Spaceship(Entity):
     """
     Spaceship Class, represented by a triangle (spaceship), two rectangles
     (boosters) and a circle (forcefield)
     """
-    def __init__(self, x, y, wall_thickness, direction=None, mass=None,
-        damping=None, max_speed=None, enable_audio=None):
-        """
-        args
-            x               (float)     x value of starting coordinates
-            y               (float)     y value of starting coordinates
-            wall_thickness  (int)       thickness of walls on map
-            direction       (float)     starting direction, in radiant, where
-                                            pointing to the right of the 2D
-                                            plane represents 0
-            mass            (float)     radius of circle of animation and mass
-            damping         (float)     value higher than 0 and maximal 1,
-                                            applied to velocity so it
-                                        reaches 0 if no acceleration is applied
-            max_speed       (float)     maximum speed
-            enable_audio    (bool)      should audio be enabled
+    _store_name = "ship_state"
 
-        """
-        self.alive = True
-        # position
-        self.position = Vector(x,y)
-        # velocity
-        self.velocity = Vector(0,0)
-        # acceleration
-        self.acceleration = Vector(0,0)
-
-        self.wall_thickness = wall_thickness
-
-        if direction is None:
-            self.direction = 0
-        else:
-            self.direction = direction
-
-        if mass is None:
-            self.mass = 30
-        else:
-            self.mass = mass
-        self.radius = self.mass # for collision
-
-        if damping is None:
-            self.damping = 0.99
-        else:
-            self.damping = damping
-
-        if max_speed is None:
-            self.max_speed = 10
-        else:
-            self.max_speed = max_speed
-
-        if enable_audio is None:
-            self.enable_audio = True
-            # if sounds are enable, load all necessary sounds
-            self.sound_laser = sa.WaveObject.from_wave_file("./sound/laser.wav")
-            self.sound_laser.play()
-            self.sound_explosion = sa.WaveObject.from_wave_file("./sound/explosion.wav")
-            self.sound_explosion.play()
-        else:
-            self.enable_audio = False
-
-        logging.info("[*] Spaceship created")
+    @property
+    def damping(self):
+        return float(self._store.damping[self._row])
+
+    @damping.setter
+    def damping(self, value):
+        self._store.damping[self._row] = value
+
+    @property
+    def max_speed(self):
+        return float(self._store.max_speed[self._row])
+
+    @max_speed.setter
+    def max_speed(self, value):
+        self._store.max_speed[self._row] = value
+
+    @property
+    def enable_audio(self):
+        return bool(self._store.audio[self._row])
+
+    @enable_audio.setter
+    def enable_audio(self, value):
+        self._store.audio[self._row] = value
 
 
 
@@ -254,133 +274,17 @@ class Spaceship():
 
 
 
-    def touching_border(self):
-        """
-        Checks if ship is touching the order border
-        returns
-            (boolean, boolean)          represents touching the wall in the x
-                                            value and y value
-        """
-        # TODO add log
-        # check if we touching either a horizontal or vertical wall and if we
-        # do, change the accordint parameter (by reversing its direction via
-        # multiplication with -1)
-        if ((self.position.x + self.mass + self.wall_thickness) >= width) \
-            or ((self.position.x - self.mass - self.wall_thickness) <= 0):
-            self.velocity.x *= -1
-        if ((self.position.y + self.mass + self.wall_thickness) >= height)    \
-        or ((self.position.y - self.mass - self.wall_thickness) <= 0):
-            self.velocity.y *= -1
-
-
-
-    def touch_circle(self, circle): # rename collision of two circles TODO
-        """
-        Checks whether the spaceship touches some other object with a circle
-        shape
-        args
-            circle      (object)        object who has radius property
-        """
-        # TODO add log
-        # calculate vector from spaceship to circle
-        difference_vec = Vector(circle.position.x-self.position.x,
-                                circle.position.y-self.position.y)
-        # check if the distance is smaller than the sum of both radius
-        # (if it is, bounce)
-        # add velocity magnitude, so you can prevent the last step before
-        # bouncing actually being in the circle
-
-        if (difference_vec.magnitude - self.velocity.magnitude) < (self.radius + circle.radius): #3
-            collision_angle = atan2(circle.position.y - self.position.y, circle.position.x - self.position.x)
-
-            self.velocity *= -1 # TODO
-            #MM = self.velocity.magnitude
-
-            #self.velocity.x *= cos(self.heading - collision_angle) * MM
-            #self.velocity.y *= sin(self.heading - collision_angle) * MM
-
-            """
-            self.velocity = (self.velocity * (self.mass - circle.mass)+    \
-                                2*self.mass*circle.mass)*                   \
-                                (1/(self.mass+circle.mass))
-            """
-
-            logging.info("[*] Spaceship bumped into circle of type {}".format(circle.__class__.__name__))
-
-
-
-
-
-    def is_hit(self, list_of_missiles):
-        """
-        Given a list of coordinates, the spaceship checks if it got hit.
-        args
-            list_of_missiles        (list)      List of Missile to check
-        returns
-            index                   (int)       if a missile hit, it return the
-                                                index of the missile in the
-                                                list, otherwise None
-        """
-        for indx, (x,y) in enumerate(list_of_missiles):
-            if ((x - self.position.x)**2 +                    \
-                (y - self.position.y)**2 < self.mass**2):
-                # TODO add log here --> spaceship destroyed
-                self.alive = False
-                # play explosion sound
-                self.sound_explosion.play()
-                logging.info("[*] Spaceship got destroyed")
-                return indx
-        return None
-
-
-
-    def addForce(self, boost):
-        """
-        Apply boost onto acceleration
-        args
-            boost                   (Vector)    vector describing where a force
-                                                is pushing and how strong it is
-                                                (depending on its magnitude)
-        """
-        self.acceleration += boost
-
-
-
-    def grav_Force(self, _planets, _grav_const):
-        """
-        Given the list of planets, calculate the total gravitation Force
-        upon the spaceship and add it to the acceleration
-        args
-            _planets        (list)          list of all current Planet objects
-            _grav_const     (float)         gravitational constant of the
-        """
-        for p in _planets:
-            # Vector towards planet
-            pull_v = Vector((p.position.x - self.position.x),
-                            (p.position.y - self.position.y))
-            # length between spaceship and planet
-            dist = pull_v.magnitude
-            # normalize vector so we can choose its strength
-            pull_v.normalize()
-            # equation for gravitational force
-            pull_v *= (_grav_const*self.mass*p.mass)/(dist**2)
-
-            self.addForce(pull_v)
-
-
-
     def shoot(self):
         """
         Shoots a missile
         returns
-            return the created Missile object
+            return the created Missile object, None if the missile pool
+            of the world is full
         """
-
         # calculate a vector for the direction of the shot, depending on what
         # way the spaceship is looking right now
-        force = Vector(cos(self.direction),sin(self.direction))
-        # set its magnitude to one
-        force.normalize()
+        direction = self.direction
+        force = np.array([cos(direction), sin(direction)])
         # since force will represent the spawning location in relation to the
         # spaceship locaiton, a vector of magnitude self.mass would spawn
         # exactly on the forcefield and thus hit the spaceship itself, thus
@@ -388,10 +292,11 @@ class Spaceship():
         force *= (self.mass+1)
 
         # play laser sound
-        self.sound_laser.play()
+        if self.enable_audio:
+            self.world.sounds.play("laser")
 
-        return Missile(self.position.x + force.x,
-            self.position.y + force.y, self.direction, speed=self.max_speed)
+        return self.world.add_missile(self.position[0] + force[0],
+            self.position[1] + force[1], direction, speed=self.max_speed)
 
 
 
@@ -401,7 +306,7 @@ class Spaceship():
         acceleration
         """
         # calculate direction of force
-        force = Vector(cos(self.direction),sin(self.direction))
+        force = np.array([cos(self.direction), sin(self.direction)])
         # calculate magnitude of force
         force *= speed
         # add it to the spacheships acceleration
@@ -409,86 +314,9 @@ class Spaceship():
 
 
 
-    def update(self, _planets, _grav_const): # TODO include them via import then remove them here
-        """
-        update velocity and position and set acceleration to 0
-        """
-        self.grav_Force(_planets, _grav_const)
-        # apply acceleration to velocity
-        self.velocity += self.acceleration
-        # apply damping, so it the velocity asymptotically reaches 0 if
-        # no acceleration is applied
-        self.velocity *= self.damping
-        # check if our current velocity magnitude (eqv. to speed) is higher
-        # than the spaceships speed limit
-        if self.velocity.magnitude > self.max_speed:
-            self.velocity *= self.max_speed/self.velocity.magnitude
-        # check if touching borders (and bounce if yes)
-        self.touching_border()
-        # apply velocity to position
-        self.position += self.velocity
-        # if there is no external force applying onto an object, the
-        # acceleration is zero by default
-        self.acceleration *= 0
-
-
-
     def display(self):
         """
         drawing spaceship (with forcefield, boosters, etc...) on sketch window
         """
-        # since we have turbines at the rocket, we dont want the rocket to be
-        # in the exact middle of the circle, but to include a small offset
-        # so it has equal distance to the circle to both sides
-        shift = 5
-
-        # local changes
-        push_matrix()
-        # set current position as origin
-        translate(self.position.x, self.position.y)
-        # rotate the matrix by heading, so we will draw in a shifted version
-        rotate(self.direction)
-        # draw force field
-        fill(100)
-        circle((0, 0), (self.mass), mode="RADIUS")
-        # draw spaceship
-        fill(255)
-        triangle((self.mass/2+shift, 0),
-                (-self.mass/2+shift, self.mass/3),
-                (-self.mass/2+shift, -self.mass/3))
-        # draw boosters
-        fill(255, 0, 0)
-        rect((-self.mass/2-5+shift, self.mass/18),
-            (-self.mass/2+shift, 2*self.mass/9),
-            mode="CORNERS")
-        rect((-self.mass/2-5+shift, -self.mass/18),
-            (-self.mass/2+shift, -2*self.mass/9),
-            mode="CORNERS")
-        # reset locally made global matrix changes
-        reset_matrix()
-
-
-
-        # TODO doesnt work, doesnt get called
-        def __str__(self):
-            return "{} with current position={} & current_speed={}".format( \
-                        self.__class__.__name__, self.position.x,
-                        self.position.y, self.velocity.magnitude)
-
-
-
-        # TODO doesnt work, doesnt get called
-        def __repr__(self):
-            return """{}(
-                            position=({}, {}),
-                            velocity=({}, {}),
-                            speed={},
-                            direction={},
-                            mass={},
-                            damping={},
-                            max_speed={}
-                        )""".format(self.__class__.__name__, self.position.x,
-                                    self.position.y, self.velocity.x,
-                                    self.velocity.x, self.velocity.magnitude,
-                                    self.direction, self.mass, self.damping,
-                                    self.max_speed)
+        from render import draw_spaceship
+        draw_spaceship(self)
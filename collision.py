@@ -0,0 +1,84 @@
+__author__ = "Devrim Celik"
+
+import numpy as np
+
+
+def time_of_impact(offset, motion, radius, count_separating=True):
+    """
+    Continuous collision test of two circles moving linearly during a step,
+    expressed relative to the first one: find the earliest time t in [0, 1]
+    at which |offset + t * motion| <= radius.
+    args
+        offset              (ndarray)   (N, 2) centre of the second circle
+                                            minus centre of the first one,
+                                            at the start of the step
+        motion              (ndarray)   (N, 2) displacement of the second
+                                            circle minus displacement of the
+                                            first one during the step
+        radius              (ndarray)   (N,) sum of both radii
+        count_separating    (bool)      whether circles which already
+                                            overlap at the start but move
+                                            apart count as a contact
+    returns
+        toi                 (ndarray)   (N,) time of impact as fraction of
+                                            the step, inf if they do not
+                                            touch during the step
+    """
+    offset = np.asarray(offset, dtype=np.float64)
+    motion = np.asarray(motion, dtype=np.float64)
+    # |offset + t * motion|^2 = radius^2  <=>  a t^2 + b t + c = 0
+    a = np.einsum("ij,ij->i", motion, motion)
+    b = 2 * np.einsum("ij,ij->i", offset, motion)
+    c = np.einsum("ij,ij->i", offset, offset) - np.asarray(radius)**2
+
+    disc = b**2 - 4 * a * c
+    moving = a > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (-b - np.sqrt(np.where(disc >= 0, disc, 0))) / \
+            np.where(moving, 2 * a, 1)
+    hit = moving & (disc >= 0) & (t >= 0) & (t <= 1)
+    toi = np.where(hit, t, np.inf)
+
+    overlap = c <= 0
+    if not count_separating:
+        overlap &= b < 0
+    return np.where(overlap, 0.0, toi)
+
+
+
+def swept_circle_circle(position_a, displacement_a, position_b,
+    displacement_b, radius, count_separating=True):
+    """
+    Time of impact of circles a and b, which move by their displacement
+    during the step
+    args
+        position_a          (ndarray)   (N, 2) centres of a at the start
+        displacement_a      (ndarray)   (N, 2) movement of a during the step
+        position_b          (ndarray)   (N, 2) centres of b at the start
+        displacement_b      (ndarray)   (N, 2) movement of b during the step
+        radius              (ndarray)   (N,) sum of the radii of a and b
+        count_separating    (bool)      see time_of_impact
+    returns
+        toi                 (ndarray)   (N,) see time_of_impact
+    """
+    return time_of_impact(np.asarray(position_b) - position_a,
+                            np.asarray(displacement_b) - displacement_a,
+                            radius, count_separating)
+
+
+
+def segment_circle(start, end, center, radius):
+    """
+    Where a point moving along a segment first enters a (resting) circle
+    args
+        start       (ndarray)   (N, 2) start of the segments
+        end         (ndarray)   (N, 2) end of the segments
+        center      (ndarray)   (N, 2) centres of the circles
+        radius      (ndarray)   (N,) radii of the circles
+    returns
+        toi         (ndarray)   (N,) fraction of the segment at which the
+                                    circle is entered (0 if start lies
+                                    inside), inf if it is not touched
+    """
+    return time_of_impact(np.asarray(center) - start,
+                            np.asarray(start) - end, radius)
@@ -0,0 +1,80 @@
+__author__ = "Devrim Celik"
+
+import numpy as np
+
+
+def resolve_contacts(position, velocity, inv_mass, radius, a, b, dt=1.0,
+    restitution=1.0, iterations=4, correction=0.8, slop=0.01, rest_speed=1.0):
+    """
+    Collision response for a list of contacts between circles, all contacts
+    at once. Every contact is handled once: if the circles approach each
+    other and touch (or will touch during the next step), an impulse along
+    the line through both centres is applied, split by the inverse masses,
+    so the heavier circle changes its velocity less. Afterwards overlapping
+    circles are pushed apart (positional correction), again split by the
+    inverse masses. Contacts approaching slower than rest_speed (e.g. a
+    spaceship pulled onto a planet by gravity) do not bounce, they only stop
+    approaching, so resting circles come to rest instead of bouncing on the
+    spot forever.
+
+    The impulses of all contacts are applied simultaneously; a few iterations
+    let the impulses propagate through circles touching several others.
+    position and velocity are changed in place.
+    args
+        position        (ndarray)   (N, 2) centres of all circles
+        velocity        (ndarray)   (N, 2) velocities
+        inv_mass        (ndarray)   (N,) inverse masses, 0 for circles that
+                                        do not move (planets)
+        radius          (ndarray)   (N,) radii
+        a               (ndarray)   (C,) first circle of every contact
+        b               (ndarray)   (C,) second circle of every contact
+        dt              (float)     length of the next step
+        restitution     (float)     1 is an elastic bounce, 0 lets the
+                                        circles stick together
+        iterations      (int)       number of impulse passes
+        correction      (float)     fraction of the overlap removed
+        slop            (float)     overlap that is tolerated, so resting
+                                        contacts do not jitter
+        rest_speed      (float)     approach speed below which contacts
+                                        do not bounce
+    returns
+        impact          (ndarray)   (C,) whether a contact bounced (it was
+                                        an actual collision, not only a
+                                        resting contact)
+    """
+    impact = np.zeros(len(a), dtype=bool)
+    if not len(a):
+        return impact
+    inv_sum = inv_mass[a] + inv_mass[b]
+    movable = inv_sum > 0
+
+    diff = position[b] - position[a]
+    dist = np.hypot(diff[:, 0], diff[:, 1])
+    # circles on top of each other are separated along x
+    normal = np.where(dist[:, np.newaxis] > 0,
+                        diff / np.maximum(dist, 1e-12)[:, np.newaxis],
+                        np.array([1.0, 0.0]))
+    gap = dist - radius[a] - radius[b]
+
+    for _ in range(iterations):
+        rel = velocity[b] - velocity[a]
+        approach = np.einsum("ij,ij->i", rel, normal)
+        # touching and approaching, or closing the gap within the next step
+        hit = movable & (approach < 0) & (approach * dt <= -gap)
+        if not hit.any():
+            break
+        bounce = hit & (approach <= -rest_speed)
+        impact |= bounce
+        j = np.where(hit, -(1 + np.where(bounce, restitution, 0)) *
+                        approach / np.where(movable, inv_sum, 1), 0)
+        impulse = j[:, np.newaxis] * normal
+        np.add.at(velocity, a, -impulse * inv_mass[a, np.newaxis])
+        np.add.at(velocity, b, impulse * inv_mass[b, np.newaxis])
+
+    overlap = np.maximum(-gap - slop, 0)
+    push = np.where(movable, correction * overlap /
+                    np.where(movable, inv_sum, 1), 0)
+    push = push[:, np.newaxis] * normal
+    np.add.at(position, a, -push * inv_mass[a, np.newaxis])
+    np.add.at(position, b, push * inv_mass[b, np.newaxis])
+    return impact
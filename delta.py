@@ -0,0 +1,435 @@
+__author__ = "Devrim Celik"
+
+import json
+import struct
+import zlib
+import numpy as np
+
+# stores of the world that are encoded, in message order
+KINDS = ("ship_state", "missile_state", "planet_state")
+# encoded columns: (field, component or None) and the default quantization
+# step of the field (the decoded value is off by at most half of it)
+COLUMNS = (("position", 0), ("position", 1), ("velocity", 0),
+            ("velocity", 1), ("direction", None), ("mass", None),
+            ("radius", None), ("alive", None))
+QUANTIZATION = {"position": 1/16, "velocity": 1/256,
+                "direction": 2*np.pi/65536, "mass": 1/16, "radius": 1/16,
+                "alive": 1}
+
+# frame header: flags, frame count of the world, frame count of the
+# keyframe the frame is relative to; keyframes are followed by the
+# quantization step of every column
+_FRAME = struct.Struct("<Bqq")
+_KEYFRAME = 1
+_COMPRESSED = 2
+_STEPS = struct.Struct("<{}d".format(len(COLUMNS)))
+# per kind: number of spawned, removed and changed entities
+_COUNTS = struct.Struct("<III")
+# width of a column: 0 if it is all zero (not written), else the dtype
+_WIDTHS = (None, np.dtype("<i1"), np.dtype("<i2"), np.dtype("<i4"),
+            np.dtype("<i8"))
+
+# delta file: magic, format version, length of the json description,
+# followed by length prefixed frames
+_MAGIC = b"SSDL"
+_VERSION = 1
+_FILE_HEADER = struct.Struct("<4sII")
+_LENGTH = struct.Struct("<I")
+
+
+def _quantize(store, steps):
+    """
+    (N, len(COLUMNS)) int64 quantized columns of a store, directions are
+    wrapped into [0, 2pi) first
+    """
+    out = np.empty((store.count, len(COLUMNS)), dtype=np.int64)
+    for i, (name, component) in enumerate(COLUMNS):
+        values = getattr(store, name)
+        if component is not None:
+            values = values[:, component]
+        if name == "direction":
+            values = np.mod(values, 2 * np.pi)
+        out[:, i] = np.rint(values / steps[i])
+    return out
+
+
+
+def _pack_columns(values):
+    """
+    Columns of integers, each written with the smallest width that fits
+    """
+    widths = bytearray(len(COLUMNS))
+    parts = []
+    for i in range(values.shape[1]):
+        column = values[:, i]
+        if not len(column) or not column.any():
+            continue
+        top = max(-int(column.min()) - 1, int(column.max()))
+        widths[i] = 1 if top < 1 << 7 else 2 if top < 1 << 15 else \
+            3 if top < 1 << 31 else 4
+        parts.append(column.astype(_WIDTHS[widths[i]]).tobytes())
+    return bytes(widths) + b"".join(parts)
+
+
+
+def _unpack_columns(buffer, offset, n):
+    """
+    Read columns written by _pack_columns
+    returns
+        values      (ndarray)   (n, len(COLUMNS)) int64
+        offset      (int)       behind the columns
+    """
+    widths = buffer[offset:offset + len(COLUMNS)]
+    offset += len(COLUMNS)
+    values = np.zeros((n, len(COLUMNS)), dtype=np.int64)
+    for i, width in enumerate(widths):
+        if width:
+            column = np.frombuffer(buffer, _WIDTHS[width], n, offset)
+            values[:, i] = column
+            offset += column.nbytes
+    return values, offset
+
+
+
+
+
+class DeltaEncoder():
+    """
+    Encodes the state of a world frame by frame, as changes against the last
+    keyframe. Positions, velocities, directions, masses and radii are
+    quantized to integers (see QUANTIZATION); a frame holds, per kind of
+    entity, the ids spawned since the keyframe with their values, the ids
+    removed since then and, for the entities whose quantized state differs
+    from the keyframe, the difference. Entities that did not change (e.g.
+    planets) cost nothing, and the differences mostly fit into one or two
+    bytes per column.
+
+    Every keyframe_interval frames a keyframe holds all entities. As every
+    frame only depends on its keyframe, any frame is decoded from two
+    messages, and a late observer only needs the last keyframe.
+    """
+    def __init__(self, keyframe_interval=60, quantization=None,
+        compress=True):
+        """
+        args
+            keyframe_interval   (int)   frames from one keyframe to the next
+            quantization        (dict)  field -> step, overrides QUANTIZATION
+            compress            (bool)  deflate every frame (zlib level 1)
+        """
+        if keyframe_interval < 1:
+            raise ValueError("keyframe interval has to be at least 1")
+        steps = dict(QUANTIZATION, **(quantization or {}))
+        self.keyframe_interval = keyframe_interval
+        self.steps = np.array([steps[name] for name, _ in COLUMNS])
+        self.compress = compress
+        # last keyframe message, its frame count and quantized state
+        self.keyframe = None
+        self._key_frame = None
+        self._key_state = None
+        self._since_key = 0
+
+
+
+    def encode(self, world, keyframe=False):
+        """
+        Encode the current state of a world
+        args
+            world       (World)     world to encode
+            keyframe    (bool)      force a keyframe
+        returns
+            message     (bytes)
+        """
+        keyframe = keyframe or self._key_state is None or \
+            self._since_key >= self.keyframe_interval
+        state = []
+        for kind in KINDS:
+            store = getattr(world, kind)
+            ids = np.asarray(store.ids, dtype=np.int64)
+            order = np.argsort(ids, kind="stable")
+            state.append((ids[order], _quantize(store, self.steps)[order]))
+
+        if keyframe:
+            self._key_state = [(np.zeros(0, dtype=np.int64),
+                                np.zeros((0, len(COLUMNS)), dtype=np.int64))
+                                for _ in KINDS]
+            self._key_frame = world.frame_count
+        parts = [_FRAME.pack(_KEYFRAME if keyframe else 0, world.frame_count,
+                                self._key_frame)]
+        if keyframe:
+            parts.append(_STEPS.pack(*self.steps))
+        for (ids, values), (key_ids, key_values) in zip(state,
+                                                        self._key_state):
+            indx = np.searchsorted(key_ids, ids)
+            known = indx < len(key_ids)
+            known[known] = key_ids[indx[known]] == ids[known]
+            removed = np.setdiff1d(key_ids, ids, assume_unique=True)
+            diff = values[known] - key_values[indx[known]]
+            changed = diff.any(axis=1)
+            parts += [_COUNTS.pack((~known).sum(), len(removed),
+                                    changed.sum()),
+                        ids[~known].tobytes(), removed.tobytes(),
+                        indx[known][changed].astype("<u4").tobytes(),
+                        _pack_columns(values[~known]),
+                        _pack_columns(diff[changed])]
+
+        if keyframe:
+            self._key_state = state
+            self._since_key = 0
+        self._since_key += 1
+
+        message = b"".join(parts)
+        if self.compress:
+            message = bytes([message[0] | _COMPRESSED]) + \
+                zlib.compress(message[1:], 1)
+        if keyframe:
+            self.keyframe = message
+        return message
+
+
+
+
+
+class DeltaDecoder():
+    """
+    Rebuilds the full state from the messages of a DeltaEncoder. Keyframes
+    are kept, every other message is decoded against the last one.
+    """
+    def __init__(self):
+        self.key_frame = None
+        self._steps = None
+        self._key_state = None
+
+
+
+    def decode(self, message):
+        """
+        args
+            message     (bytes)     frame of a DeltaEncoder
+        returns
+            state       (dict)      frame_count, and per kind of entity a
+                                        dict of ids (sorted) and the decoded
+                                        fields of COLUMNS
+        """
+        flags = message[0]
+        if flags & _COMPRESSED:
+            message = message[:1] + zlib.decompress(message[1:])
+        _, frame_count, key_frame = _FRAME.unpack_from(message)
+        offset = _FRAME.size
+        if flags & _KEYFRAME:
+            self._steps = np.array(_STEPS.unpack_from(message, offset))
+            offset += _STEPS.size
+            key_state = [(np.zeros(0, dtype=np.int64),
+                            np.zeros((0, len(COLUMNS)), dtype=np.int64))
+                            for _ in KINDS]
+        elif self._key_state is None or key_frame != self.key_frame:
+            raise ValueError("frame {} needs keyframe {}".format(frame_count,
+                                                                key_frame))
+        else:
+            key_state = self._key_state
+
+        state = {"frame_count": frame_count}
+        decoded = []
+        for kind, (key_ids, key_values) in zip(KINDS, key_state):
+            n_spawned, n_removed, n_changed = _COUNTS.unpack_from(message,
+                                                                    offset)
+            offset += _COUNTS.size
+            spawned = np.frombuffer(message, "<i8", n_spawned, offset)
+            offset += spawned.nbytes
+            removed = np.frombuffer(message, "<i8", n_removed, offset)
+            offset += removed.nbytes
+            changed = np.frombuffer(message, "<u4", n_changed, offset)
+            offset += changed.nbytes
+            spawned_values, offset = _unpack_columns(message, offset,
+                                                        n_spawned)
+            diff, offset = _unpack_columns(message, offset, n_changed)
+
+            values = key_values.copy()
+            values[changed] += diff
+            keep = ~np.isin(key_ids, removed)
+            ids = np.concatenate((key_ids[keep], spawned))
+            values = np.concatenate((values[keep], spawned_values))
+            order = np.argsort(ids, kind="stable")
+            ids, values = ids[order], values[order]
+            decoded.append((ids, values))
+            state[kind] = self._fields(ids, values)
+
+        if flags & _KEYFRAME:
+            self._key_state = decoded
+            self.key_frame = frame_count
+        return state
+
+
+
+    def _fields(self, ids, values):
+        values = values * self._steps
+        fields = {"ids": ids}
+        for i, (name, component) in enumerate(COLUMNS):
+            if component is None:
+                fields[name] = values[:, i]
+            elif component == 0:
+                fields[name] = values[:, i:i + 2]
+        fields["alive"] = fields["alive"].astype(bool)
+        return fields
+
+
+
+
+
+def apply_state(state, world):
+    """
+    Put a decoded state into a world, so it can be drawn (nothing is
+    simulated)
+    args
+        state       (dict)      decoded by DeltaDecoder
+        world       (World)     world to overwrite
+    """
+    for kind in KINDS:
+        values = dict(state[kind])
+        values["previous_position"] = values["position"]
+        getattr(world, kind).assign(values.pop("ids"), **values)
+    world.frame_count = state["frame_count"]
+
+
+
+
+
+class DeltaWriter():
+    """
+    Archives a world as a stream of delta frames, one per call of record(),
+    see DeltaEncoder. Much smaller than a TrajectoryRecorder file, at the
+    cost of the quantization.
+    """
+    def __init__(self, path, world, keyframe_interval=60, quantization=None):
+        """
+        args
+            path                (str)       file to write, is overwritten
+            world               (World)     world to record
+            keyframe_interval   (int)       see DeltaEncoder
+            quantization        (dict)      see DeltaEncoder
+        """
+        self.world = world
+        self.encoder = DeltaEncoder(keyframe_interval, quantization)
+        self.n_frames = 0
+        description = json.dumps({
+            "world": {"width": world.width, "height": world.height,
+                        "wall_thickness": world.wall_thickness,
+                        "dt": world.dt},
+            "keyframe_interval": keyframe_interval}).encode()
+        self._file = open(path, "wb")
+        self._file.write(_FILE_HEADER.pack(_MAGIC, _VERSION,
+                                            len(description)))
+        self._file.write(description)
+
+
+
+    def record(self):
+        """
+        Append the current state of the world
+        """
+        message = self.encoder.encode(self.world)
+        self._file.write(_LENGTH.pack(len(message)) + message)
+        self.n_frames += 1
+
+
+
+    def close(self):
+        self._file.close()
+
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+
+
+
+class DeltaReader():
+    """
+    Random access to a file of a DeltaWriter, a frame is decoded from its
+    keyframe and itself. A file that was cut off is read up to its last
+    complete frame.
+    """
+    def __init__(self, path):
+        """
+        args
+            path        (str)       file written by a DeltaWriter
+        """
+        with open(path, "rb") as f:
+            self._data = f.read()
+        magic, version, n_description = _FILE_HEADER.unpack_from(self._data)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("not a delta file (version {})".format(_VERSION))
+        offset = _FILE_HEADER.size
+        description = json.loads(self._data[offset:offset + n_description])
+        self.world = description["world"]
+        offset += n_description
+
+        # start and end of every frame and the frame of its keyframe
+        self._bounds = []
+        self._keys = []
+        key = None
+        while offset + _LENGTH.size <= len(self._data):
+            length, = _LENGTH.unpack_from(self._data, offset)
+            start = offset + _LENGTH.size
+            if start + length > len(self._data):
+                break
+            if self._data[start] & _KEYFRAME:
+                key = len(self._bounds)
+            self._bounds.append((start, start + length))
+            self._keys.append(key)
+            offset = start + length
+        self.n_frames = len(self._bounds)
+        self._decoder = DeltaDecoder()
+        self._decoded_key = None
+
+
+
+    def _message(self, indx):
+        start, stop = self._bounds[indx]
+        return self._data[start:stop]
+
+
+
+    def frame(self, indx):
+        """
+        Decode one frame
+        returns
+            state       (dict)      see DeltaDecoder.decode
+        """
+        if not -self.n_frames <= indx < self.n_frames:
+            raise IndexError("frame {} out of range".format(indx))
+        indx %= self.n_frames
+        key = self._keys[indx]
+        if key is None:
+            raise ValueError("frame {} has no keyframe".format(indx))
+        if key != self._decoded_key or key == indx:
+            state = self._decoder.decode(self._message(key))
+            self._decoded_key = key
+            if key == indx:
+                return state
+        return self._decoder.decode(self._message(indx))
+
+
+
+    def apply(self, indx, world):
+        """
+        Put the entities of a frame into a world, see apply_state
+        """
+        apply_state(self.frame(indx), world)
+
+
+
+    def replay(self, world, start=0, stop=None, step=1):
+        """
+        Go through the recording frame by frame
+        yields
+            indx        (int)       number of the frame now in the world
+        """
+        stop = self.n_frames if stop is None else stop
+        for indx in range(start, stop, step):
+            self.apply(indx, world)
+            yield indx
@@ -0,0 +1,268 @@
+__author__ = "Devrim Celik"
+
+import logging
+import logging.handlers
+import queue
+import time
+import numpy as np
+
+# kinds of events, every event is a record of (kind, frame, id, other id)
+#   EVENT_HIT               spaceship id, id of the missile that destroyed it
+#   EVENT_SHIP_BOUNCE       spaceship id, id of the spaceship it bumped into
+#   EVENT_PLANET_BOUNCE     spaceship id, id of the planet it bumped into
+#   EVENT_ABSORBED          missile id, id of the planet that absorbed it
+#   EVENT_SHIP_CREATED      spaceship id, -1
+#   EVENT_PLANET_CREATED    planet id, -1
+#   EVENT_INPUT             spaceship id, index of the key in INPUT_KEYS
+EVENT_HIT = 0
+EVENT_SHIP_BOUNCE = 1
+EVENT_PLANET_BOUNCE = 2
+EVENT_ABSORBED = 3
+EVENT_SHIP_CREATED = 4
+EVENT_PLANET_CREATED = 5
+EVENT_INPUT = 6
+N_EVENT_KINDS = 7
+
+# keys a human player can press
+INPUT_KEYS = ("UP", "LEFT", "RIGHT", "DOWN", "SPACE")
+
+# log line of every kind of event, filled with the id and the other id
+EVENT_MESSAGES = (
+    "[*] Spaceship {} got destroyed by missile {}",
+    "[*] Spaceship {} bumped into circle of type Spaceship ({})",
+    "[*] Spaceship {} bumped into circle of type Planet ({})",
+    "[*] Missile {} got absorbed by planet {}",
+    "[*] Spaceship {} created",
+    "[*] Planet {} created",
+    "[*] User Input: {1} (spaceship {0})",
+)
+
+_RECORD = np.dtype([("kind", np.int8), ("frame", np.int64), ("id", np.int64),
+                    ("other", np.int64)])
+
+
+class EventBatch():
+    """
+    Message of a log record carrying many events. It is only turned into
+    text when a handler formats it, which happens in the listener thread.
+    """
+    def __init__(self, records):
+        """
+        args
+            records     (ndarray)   event records, owned by the batch
+        """
+        self.records = records
+
+
+
+    def __len__(self):
+        return len(self.records)
+
+
+
+    def __str__(self):
+        lines = []
+        for kind, frame, eid, other in self.records.tolist():
+            if kind == EVENT_INPUT:
+                other = INPUT_KEYS[other] if 0 <= other < len(INPUT_KEYS) \
+                    else other
+            lines.append("frame {}: ".format(frame) +
+                            EVENT_MESSAGES[kind].format(eid, other))
+        return "\n".join(lines)
+
+
+
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that hands the record over unformatted, the EventBatch is
+    immutable so formatting can wait for the listener thread
+    """
+    def prepare(self, record):
+        return record
+
+
+
+
+
+class _ForwardHandler(logging.Handler):
+    """
+    Passes records from the listener thread on to a logger (and with it to
+    e.g. the file handler of simulation.log)
+    """
+    def __init__(self, logger):
+        super().__init__()
+        self.logger = logger
+
+    def emit(self, record):
+        self.logger.handle(record)
+
+
+
+
+
+class EventBus():
+    """
+    Collects the events of a world. Counting them is always done and costs a
+    few array operations per step. If logging is enabled the events are also
+    written into a ring buffer as structured records; once enough records
+    are collected (or enough time passed) they are handed to a background
+    thread (logging QueueHandler and QueueListener) as one log record, which
+    is only formatted and written there.
+
+    Per kind of event, records can be sampled (only every n-th is logged) and
+    throttled (at most n per second are logged). Events that do not fit into
+    the ring buffer before the next flush are dropped and counted.
+    """
+    def __init__(self, log=False, logger="spaceship.events", capacity=4096,
+        batch_size=1024, flush_interval=1.0, sample=None, throttle=None):
+        """
+        args
+            log             (bool)      log the events at all
+            logger          (str)       name of the logger the batches are
+                                            written to
+            capacity        (int)       size of the ring buffer
+            batch_size      (int)       records that trigger a flush
+            flush_interval  (float)     seconds after which collected
+                                            records are flushed anyway
+            sample          (dict)      kind -> only every n-th is logged
+            throttle        (dict)      kind -> at most n per second logged
+        """
+        self.log = log
+        self.logger = logging.getLogger(logger)
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sample = dict(sample or {})
+        self.throttle = dict(throttle or {})
+
+        # number of events per kind, whether they are logged or not
+        self.counts = np.zeros(N_EVENT_KINDS, dtype=np.int64)
+        # number of logged records lost because the ring buffer was full
+        self.dropped = 0
+
+        self._ring = np.zeros(capacity, dtype=_RECORD)
+        # index of the oldest record and number of records in the ring
+        self._start = 0
+        self._size = 0
+        self._last_flush = time.monotonic()
+        # start of the current second and records logged in it, per kind
+        self._window = np.zeros(N_EVENT_KINDS)
+        self._in_window = np.zeros(N_EVENT_KINDS, dtype=np.int64)
+
+        self._queue = None
+        self._handler = None
+        self._listener = None
+
+
+
+    def emit(self, kind, frame, ids, other_ids=-1):
+        """
+        Publish events of one kind
+        args
+            kind        (int)       one of the EVENT_* constants
+            frame       (int)       frame the events happened in
+            ids         (ndarray)   (E,) id of the entity of every event
+            other_ids   (ndarray)   (E,) id of the other entity, or one for
+                                        all
+        """
+        ids = np.atleast_1d(ids)
+        n = len(ids)
+        if not n:
+            return
+        before = self.counts[kind]
+        self.counts[kind] += n
+        if not self.log:
+            return
+
+        keep = np.ones(n, dtype=bool)
+        every = self.sample.get(kind)
+        if every is not None and every > 1:
+            keep = (before + np.arange(n)) % every == 0
+        limit = self.throttle.get(kind)
+        if limit is not None:
+            now = time.monotonic()
+            if now - self._window[kind] >= 1:
+                self._window[kind] = now
+                self._in_window[kind] = 0
+            allowed = max(limit - int(self._in_window[kind]), 0)
+            # of the sampled events, only the first allowed ones are logged
+            keep[np.flatnonzero(keep)[allowed:]] = False
+            self._in_window[kind] += int(keep.sum())
+
+        ids = ids[keep]
+        other_ids = np.broadcast_to(other_ids, (n,))[keep]
+        self._push(kind, frame, ids, other_ids)
+
+
+
+    def _push(self, kind, frame, ids, other_ids):
+        """
+        Write records into the ring buffer, overwriting the oldest ones if it
+        is full
+        """
+        n = len(ids)
+        if not n:
+            return
+        if n > self.capacity:
+            self.dropped += n - self.capacity
+            ids, other_ids = ids[-self.capacity:], other_ids[-self.capacity:]
+            n = self.capacity
+        overflow = max(self._size + n - self.capacity, 0)
+        self.dropped += overflow
+        self._start = (self._start + overflow) % self.capacity
+        self._size -= overflow
+
+        rows = (self._start + self._size + np.arange(n)) % self.capacity
+        self._ring["kind"][rows] = kind
+        self._ring["frame"][rows] = frame
+        self._ring["id"][rows] = ids
+        self._ring["other"][rows] = other_ids
+        self._size += n
+
+
+
+    def maybe_flush(self):
+        """
+        Flush if enough records are collected or enough time passed, cheap
+        to call every step
+        """
+        if self._size >= self.batch_size or (self._size and
+            time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+
+
+    def flush(self):
+        """
+        Hand all collected records to the background thread
+        """
+        self._last_flush = time.monotonic()
+        if not self._size:
+            return
+        rows = (self._start + np.arange(self._size)) % self.capacity
+        batch = EventBatch(self._ring[rows])
+        self._start = 0
+        self._size = 0
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        if self._listener is None:
+            self._queue = queue.SimpleQueue()
+            self._handler = _DeferredQueueHandler(self._queue)
+            self._listener = logging.handlers.QueueListener(
+                self._queue, _ForwardHandler(self.logger))
+            self._listener.start()
+        self._handler.handle(self.logger.makeRecord(
+            self.logger.name, logging.INFO, __file__, 0, batch, None, None))
+
+
+
+    def close(self):
+        """
+        Flush and wait for the background thread to write everything
+        """
+        self.flush()
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
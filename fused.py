@@ -0,0 +1,276 @@
+__author__ = "Devrim Celik"
+
+import numpy as np
+from physics import grav_force
+from integrators import SCHEMES, integrate_missiles, integrate_spaceships
+
+# numba is optional: without it the same update is done with the NumPy
+# functions of physics.py and integrators.py
+try:
+    import numba
+except ImportError:
+    numba = None
+
+if numba is not None:
+    _jit = numba.njit(cache=True, fastmath=False)
+    _jit_parallel = numba.njit(parallel=True, cache=True, fastmath=False)
+    prange = numba.prange
+else:
+    _jit = _jit_parallel = lambda function: function
+    prange = range
+
+HAVE_NUMBA = numba is not None
+
+
+@_jit
+def _pull(x, y, planet_position, planet_mass, softening2):
+    """
+    Pull of all planets on a unit mass at (x, y), summed up planet by planet
+    """
+    ax = 0.0
+    ay = 0.0
+    for p in range(len(planet_mass)):
+        dx = planet_position[p, 0] - x
+        dy = planet_position[p, 1] - y
+        dist2 = dx * dx + dy * dy + softening2
+        # a body sitting exactly on a planet centre is not pulled by it
+        if dist2 > 0:
+            strength = planet_mass[p] / (dist2 * np.sqrt(dist2))
+            ax += strength * dx
+            ay += strength * dy
+    return ax, ay
+
+
+
+@_jit_parallel
+def _fused_step(position, velocity, thrust, mass, planet_position,
+    planet_mass, grav_const, softening2, dt, verlet, ship, damping,
+    max_speed, width, height, wall_thickness, start_gravity, known,
+    end_gravity, offscreen):
+    """
+    The whole update of every body in one loop: gravity, thrust, damping,
+    speed limit, bouncing off the walls (spaceships), drift and the second
+    kick of verlet, and whether the body left the world (missiles). verlet
+    takes the gravity at the start from start_gravity where known and
+    writes that at the end into end_gravity.
+    """
+    for i in prange(len(mass)):
+        x = position[i, 0]
+        y = position[i, 1]
+        vx = velocity[i, 0]
+        vy = velocity[i, 1]
+        if verlet and known[i]:
+            ax = thrust[i, 0] + start_gravity[i, 0]
+            ay = thrust[i, 1] + start_gravity[i, 1]
+        else:
+            gx, gy = _pull(x, y, planet_position, planet_mass, softening2)
+            ax = thrust[i, 0] + grav_const * mass[i] * gx
+            ay = thrust[i, 1] + grav_const * mass[i] * gy
+        if verlet:
+            ax *= 0.5
+            ay *= 0.5
+        vx += ax * dt
+        vy += ay * dt
+        if ship:
+            factor = damping[i] ** dt
+            vx *= factor
+            vy *= factor
+            speed = np.hypot(vx, vy)
+            if speed > max_speed[i]:
+                vx *= max_speed[i] / speed
+                vy *= max_speed[i] / speed
+            reach = mass[i] + wall_thickness
+            if x + reach >= width or x - reach <= 0:
+                vx = -vx
+            if y + reach >= height or y - reach <= 0:
+                vy = -vy
+        x += vx * dt
+        y += vy * dt
+        if verlet:
+            gx, gy = _pull(x, y, planet_position, planet_mass, softening2)
+            end_gravity[i, 0] = grav_const * mass[i] * gx
+            end_gravity[i, 1] = grav_const * mass[i] * gy
+            vx += 0.5 * dt * (thrust[i, 0] + end_gravity[i, 0])
+            vy += 0.5 * dt * (thrust[i, 1] + end_gravity[i, 1])
+            # the second half kick may push a spaceship past its limit
+            if ship:
+                speed = np.hypot(vx, vy)
+                if speed > max_speed[i]:
+                    vx *= max_speed[i] / speed
+                    vy *= max_speed[i] / speed
+        position[i, 0] = x
+        position[i, 1] = y
+        velocity[i, 0] = vx
+        velocity[i, 1] = vy
+        offscreen[i] = not (0 <= x <= width and 0 <= y <= height)
+
+
+
+def integrate_fused(position, velocity, thrust, mass, planet_position,
+    planet_mass, grav_const, softening, dt, width, height, scheme="euler",
+    damping=None, max_speed=None, wall_thickness=0, start_gravity=None,
+    known=None, use_numba=None):
+    """
+    Advance bodies by one step with the exact gravity of all planets, like
+    integrate_missiles (damping is None) or integrate_spaceships. With numba
+    all of it is done in one compiled loop over the bodies, run in parallel,
+    instead of one NumPy pass with temporaries per part of the update.
+    Without numba (or with use_numba=False) the NumPy functions are used.
+    position and velocity are changed in place.
+    args
+        position        (ndarray)   (N, 2) positions
+        velocity        (ndarray)   (N, 2) velocities
+        thrust          (ndarray)   (N, 2) acceleration that stays constant
+                                        over the step (e.g. boosts)
+        mass            (ndarray)   (N,) masses
+        planet_position (ndarray)   (P, 2) positions of the planets
+        planet_mass     (ndarray)   (P,) masses of the planets
+        grav_const      (float)     gravitational constant
+        softening       (float)     softening length of gravity
+        dt              (float)     length of the step, 1 is one frame
+        width           (float)     width of the world
+        height          (float)     height of the world
+        scheme          (str)       one of SCHEMES
+        damping         (ndarray)   (N,) damping factors of spaceships, None
+                                        for missiles
+        max_speed       (ndarray)   (N,) speed limits of spaceships
+        wall_thickness  (float)     thickness of the walls
+        start_gravity   (ndarray)   (N, 2) gravity at the current positions
+                                        (verlet only), used where known
+        known           (ndarray)   (N,) whether a row of start_gravity is
+                                        known, None if all are
+        use_numba       (bool)      None uses numba if it is installed
+    returns
+        offscreen       (ndarray)   (N,) whether a body left the world
+        end_gravity     (ndarray)   (N, 2) gravity at the new positions,
+                                        None for euler
+    """
+    if scheme not in SCHEMES:
+        raise ValueError("unknown integration scheme {}".format(scheme))
+    if use_numba is None:
+        use_numba = HAVE_NUMBA
+    ship = damping is not None
+    verlet = scheme == "verlet"
+    n_bodies = len(mass)
+    if start_gravity is None:
+        start_gravity = np.zeros((n_bodies, 2))
+        known = np.zeros(n_bodies, dtype=np.bool_)
+    elif known is None:
+        known = np.ones(n_bodies, dtype=np.bool_)
+
+    if use_numba:
+        offscreen = np.empty(n_bodies, dtype=np.bool_)
+        end_gravity = np.empty((n_bodies, 2))
+        if not ship:
+            damping = max_speed = np.empty(0)
+        _fused_step(position, velocity,
+                    np.ascontiguousarray(thrust, dtype=np.float64),
+                    np.ascontiguousarray(mass, dtype=np.float64),
+                    np.ascontiguousarray(planet_position, dtype=np.float64),
+                    np.ascontiguousarray(planet_mass, dtype=np.float64),
+                    float(grav_const), float(softening)**2, float(dt),
+                    verlet, ship,
+                    np.ascontiguousarray(damping, dtype=np.float64),
+                    np.ascontiguousarray(max_speed, dtype=np.float64),
+                    float(width), float(height), float(wall_thickness),
+                    np.ascontiguousarray(start_gravity, dtype=np.float64),
+                    np.ascontiguousarray(known, dtype=np.bool_),
+                    end_gravity, offscreen)
+        return offscreen, end_gravity if verlet else None
+
+    gravity = lambda p: grav_force(p, mass, planet_position, planet_mass,
+                                    grav_const, softening)
+    if verlet:
+        start_gravity = np.array(start_gravity, dtype=np.float64)
+        stale = ~np.asarray(known)
+        if stale.any():
+            start_gravity[stale] = grav_force(position[stale], mass[stale],
+                                                planet_position, planet_mass,
+                                                grav_const, softening)
+    else:
+        start_gravity = None
+    if ship:
+        end_gravity = integrate_spaceships(position, velocity, thrust,
+                                            gravity, dt, mass, damping,
+                                            max_speed, width, height,
+                                            wall_thickness, scheme=scheme,
+                                            start_gravity=start_gravity)
+    else:
+        end_gravity = integrate_missiles(position, velocity, thrust, gravity,
+                                            dt, scheme=scheme,
+                                            start_gravity=start_gravity)
+    x, y = position[:, 0], position[:, 1]
+    return ~((x >= 0) & (x <= width) & (y >= 0) & (y <= height)), \
+        end_gravity
+
+
+
+def check_equivalence(n_bodies=500, n_planets=8, steps=10, seed=0,
+    rtol=1e-9):
+    """
+    Advance the same random spaceships and missiles with the fused loop and
+    with the NumPy functions, for both schemes, and compare the results. The
+    loop is compiled if numba is installed and runs as plain Python
+    otherwise (keep n_bodies small then).
+    returns
+        error       (dict)      (kind, scheme) -> largest relative
+                                    difference of positions and velocities
+    raises
+        AssertionError if a difference exceeds rtol
+    """
+    rng = np.random.default_rng(seed)
+    width, height, wall = 1080, 720, 10
+    planet_position = rng.uniform((0, 0), (width, height), (n_planets, 2))
+    planet_mass = rng.uniform(10, 60, n_planets)
+    position = rng.uniform((50, 50), (width - 50, height - 50),
+                            (n_bodies, 2))
+    velocity = rng.normal(0, 3, (n_bodies, 2))
+    thrust = rng.normal(0, 1, (n_bodies, 2))
+    mass = rng.uniform(10, 40, n_bodies)
+    damping = rng.uniform(0.9, 1, n_bodies)
+    max_speed = rng.uniform(5, 15, n_bodies)
+
+    error = {}
+    for kind in ("spaceship", "missile"):
+        limits = dict(damping=damping, max_speed=max_speed,
+                        wall_thickness=wall) if kind == "spaceship" else {}
+        for scheme in SCHEMES:
+            results = []
+            for use_numba in (True, False):
+                p, v = position.copy(), velocity.copy()
+                for _ in range(steps):
+                    if use_numba:
+                        # the loop itself, compiled or not
+                        offscreen = np.empty(n_bodies, dtype=np.bool_)
+                        ship = kind == "spaceship"
+                        _fused_step(p, v, thrust, mass, planet_position,
+                                    planet_mass, 1.0, 0.0, 0.5,
+                                    scheme == "verlet", ship,
+                                    damping if ship else np.empty(0),
+                                    max_speed if ship else np.empty(0),
+                                    float(width), float(height), float(wall),
+                                    np.zeros((n_bodies, 2)),
+                                    np.zeros(n_bodies, dtype=np.bool_),
+                                    np.empty((n_bodies, 2)), offscreen)
+                    else:
+                        offscreen, _ = integrate_fused(p, v, thrust, mass,
+                            planet_position, planet_mass, 1.0, 0.0, 0.5,
+                            width, height, scheme, use_numba=False, **limits)
+                results.append((p, v, offscreen))
+            (p0, v0, o0), (p1, v1, o1) = results
+            diff = max(np.max(np.abs(p0 - p1) / np.maximum(np.abs(p1), 1)),
+                        np.max(np.abs(v0 - v1) / np.maximum(np.abs(v1), 1)))
+            error[kind, scheme] = diff
+            if diff > rtol or (o0 != o1).any():
+                raise AssertionError("fused {} {} differs by {}".format(
+                    kind, scheme, diff))
+    return error
+
+
+
+if __name__ == "__main__":
+    print("numba", "available" if HAVE_NUMBA else "not installed")
+    for (kind, scheme), diff in check_equivalence(
+        n_bodies=2000 if HAVE_NUMBA else 200).items():
+        print("{:>9} {:>6}: largest relative difference {:.1e}".format(
+            kind, scheme, diff))
@@ -0,0 +1,181 @@
+__author__ = "Devrim Celik"
+
+import collections
+import hashlib
+import os
+import numpy as np
+from physics import grav_force
+
+# version of the cached files, part of their key
+_CACHE_VERSION = 1
+
+
+class GravityField():
+    """
+    Gravity of a static set of planets, baked onto a grid. Every node holds
+    the pull of all planets on a body of mass 1, so the pull on any body is
+    a bilinear interpolation of the four nodes around it times its mass, no
+    matter how many planets there are.
+
+    The field is linear in the planets: if a planet is added, removed or
+    changes its mass (make_bigger), only the pull of that planet is added to
+    or subtracted from the grid instead of baking it again. Baked grids can
+    be cached on disk, keyed by the planet set and the grid parameters, so
+    loading the same scenario again does not bake anything.
+
+    Close to a planet centre the pull changes faster than the grid can
+    resolve; there (within a cell or two) the sampled pull is too weak,
+    softening or a smaller cell size help.
+    """
+    def __init__(self, width, height, cell_size=4, grav_const=1,
+        softening=0.0, cache_dir=None):
+        """
+        args
+            width       (float)     width of the covered area in pixel
+            height      (float)     height of the covered area in pixel
+            cell_size   (float)     distance in between grid nodes
+            grav_const  (float)     gravitational constant
+            softening   (float)     softening length, see physics.grav_force
+            cache_dir   (str)       directory baked grids are cached in, None
+                                        disables the cache
+        """
+        if cell_size <= 0:
+            raise ValueError("cell size has to be positive")
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.grav_const = grav_const
+        self.softening = softening
+        self.cache_dir = cache_dir
+        self.shape = (int(np.ceil(height / cell_size)) + 1,
+                        int(np.ceil(width / cell_size)) + 1)
+        # (ny, nx, 2) pull per unit mass at every node, node (i, j) sits at
+        # (j * cell_size, i * cell_size)
+        self.grid = np.zeros(self.shape + (2,))
+        ys, xs = np.mgrid[:self.shape[0], :self.shape[1]] * cell_size
+        self._nodes = np.stack((xs.ravel(), ys.ravel()), axis=-1) \
+            .astype(np.float64)
+        # planets the grid currently holds, (x, y, mass) -> multiplicity
+        self._planets = collections.Counter()
+        self._key = None
+        # number of planets baked into the grid from scratch / incrementally
+        self.baked = 0
+        self.updated = 0
+
+
+
+    def _contribution(self, planets):
+        """
+        Pull of the given planets on a unit mass at every node
+        args
+            planets     (ndarray)   (P, 3) rows of x, y, mass
+        returns
+            pull        (ndarray)   (ny, nx, 2)
+        """
+        pull = grav_force(self._nodes, 1.0, planets[:, :2], planets[:, 2],
+                            self.grav_const, self.softening)
+        return pull.reshape(self.shape + (2,))
+
+
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, "field_{}.npy".format(key))
+
+
+
+    def _hash(self, planets):
+        """
+        Key of a planet set (independent of the order of the planets) for the
+        grid parameters
+        """
+        planets = planets[np.lexsort(planets.T[::-1])]
+        digest = hashlib.sha1(np.array(
+            [_CACHE_VERSION, self.width, self.height, self.cell_size,
+                self.grav_const, self.softening], dtype=np.float64).tobytes())
+        digest.update(np.ascontiguousarray(planets).tobytes())
+        return digest.hexdigest()
+
+
+
+    def update(self, positions, masses):
+        """
+        Bring the grid up to date with the given planets. Nothing is done if
+        they did not change; otherwise the grid is loaded from the cache or,
+        if only a few planets differ, updated with their pull, or baked
+        again.
+        args
+            positions   (ndarray)   (P, 2) planet positions
+            masses      (ndarray)   (P,) planet masses
+        """
+        planets = np.column_stack((np.asarray(positions, dtype=np.float64),
+                                    np.asarray(masses, dtype=np.float64))) \
+            if len(masses) else np.zeros((0, 3))
+        key = self._hash(planets)
+        if key == self._key:
+            return
+
+        if self.cache_dir is not None and os.path.exists(
+            self._cache_path(key)):
+            grid = np.load(self._cache_path(key))
+            if grid.shape == self.grid.shape:
+                self.grid = grid
+                self._set(planets, key)
+                return
+
+        new = collections.Counter(map(tuple, planets.tolist()))
+        added = list((new - self._planets).elements())
+        removed = list((self._planets - new).elements())
+        if len(added) + len(removed) < len(planets):
+            if added:
+                self.grid += self._contribution(np.array(added))
+            if removed:
+                self.grid -= self._contribution(np.array(removed))
+            self.updated += len(added) + len(removed)
+        else:
+            self.grid = self._contribution(planets)
+            self.baked += len(planets)
+        self._set(planets, key)
+
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # write and rename, so a reader never sees half a file
+            tmp = self._cache_path(key) + ".tmp.npy"
+            np.save(tmp, self.grid)
+            os.replace(tmp, self._cache_path(key))
+
+
+
+    def _set(self, planets, key):
+        self._planets = collections.Counter(map(tuple, planets.tolist()))
+        self._key = key
+
+
+
+    def sample(self, positions, masses):
+        """
+        Pull of the planets on bodies, interpolated bilinearly in between the
+        four surrounding nodes; positions outside of the grid use its border
+        args
+            positions   (ndarray)   (N, 2) positions of the bodies
+            masses      (ndarray)   (N,) masses of the bodies
+        returns
+            force       (ndarray)   (N, 2) added to the acceleration, like
+                                        physics.grav_force
+        """
+        positions = np.asarray(positions, dtype=np.float64)
+        ny, nx = self.shape
+        gx = np.clip(positions[:, 0] / self.cell_size, 0, nx - 1)
+        gy = np.clip(positions[:, 1] / self.cell_size, 0, ny - 1)
+        x0 = np.minimum(gx.astype(np.intp), nx - 2) if nx > 1 else \
+            np.zeros(len(gx), dtype=np.intp)
+        y0 = np.minimum(gy.astype(np.intp), ny - 2) if ny > 1 else \
+            np.zeros(len(gy), dtype=np.intp)
+        fx = (gx - x0)[:, np.newaxis]
+        fy = (gy - y0)[:, np.newaxis]
+        x1 = np.minimum(x0 + 1, nx - 1)
+        y1 = np.minimum(y0 + 1, ny - 1)
+        g = self.grid
+        force = (g[y0, x0] * (1 - fx) + g[y0, x1] * fx) * (1 - fy) + \
+            (g[y1, x0] * (1 - fx) + g[y1, x1] * fx) * fy
+        force *= np.asarray(masses)[:, np.newaxis]
+        return force
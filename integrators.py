@@ -0,0 +1,137 @@
+__author__ = "Devrim Celik"
+
+import numpy as np
+from physics import limit_speed, update_missiles, update_spaceships
+
+# available integration schemes
+#   euler       semi-implicit (symplectic) Euler, one gravity evaluation per
+#                   step, with dt=1 exactly the original frame update
+#   verlet      velocity Verlet (kick-drift-kick leapfrog), second order
+#                   accurate; the gravity at the end of a step is that at the
+#                   start of the next one, so passing it on (see start_gravity
+#                   below) leaves one gravity evaluation per step
+SCHEMES = ("euler", "verlet")
+
+# largest number of body-planet pairs evaluated at once in substep_counts
+_PAIR_CHUNK = 1 << 18
+
+
+def integrate_missiles(position, velocity, thrust, gravity, dt,
+    scheme="euler", start_gravity=None):
+    """
+    Advance missiles by one step of length dt. position and velocity are
+    changed in place.
+    args
+        position        (ndarray)   (N, 2) positions
+        velocity        (ndarray)   (N, 2) velocities
+        thrust          (ndarray)   (N, 2) acceleration that stays constant
+                                        over the step (e.g. boosts)
+        gravity         (function)  maps (N, 2) positions onto the (N, 2)
+                                        acceleration caused by the planets
+        dt              (float)     length of the step, 1 is one frame
+        scheme          (str)       one of SCHEMES
+        start_gravity   (ndarray)   (N, 2) gravity at the current positions
+                                        if already known (verlet only)
+    returns
+        end_gravity     (ndarray)   (N, 2) gravity at the new positions,
+                                        None for euler
+    """
+    if scheme == "euler":
+        update_missiles(position, velocity, thrust + gravity(position), dt)
+        return None
+    if scheme == "verlet":
+        if start_gravity is None:
+            start_gravity = gravity(position)
+        # the first half kick is done by the euler update with half the
+        # acceleration, it drifts with the new velocity afterwards
+        update_missiles(position, velocity, 0.5 * (thrust + start_gravity),
+                        dt)
+        end_gravity = gravity(position)
+        velocity += 0.5 * dt * (thrust + end_gravity)
+        return end_gravity
+    raise ValueError("unknown integration scheme {}".format(scheme))
+
+
+
+def integrate_spaceships(position, velocity, thrust, gravity, dt, mass,
+    damping, max_speed, width, height, wall_thickness, scheme="euler",
+    start_gravity=None):
+    """
+    Advance spaceships by one step of length dt, including damping, the speed
+    limit and bouncing off the walls. position and velocity are changed in
+    place.
+    args
+        position        (ndarray)   (N, 2) positions
+        velocity        (ndarray)   (N, 2) velocities
+        thrust          (ndarray)   (N, 2) acceleration that stays constant
+                                        over the step (e.g. boosts)
+        gravity         (function)  maps (N, 2) positions onto the (N, 2)
+                                        acceleration caused by the planets
+        dt              (float)     length of the step, 1 is one frame
+        mass            (ndarray)   (N,) masses (and radii)
+        damping         (ndarray)   (N,) damping factors per frame
+        max_speed       (ndarray)   (N,) speed limits
+        width           (float)     width of the world
+        height          (float)     height of the world
+        wall_thickness  (float)     thickness of the walls
+        scheme          (str)       one of SCHEMES
+        start_gravity   (ndarray)   see integrate_missiles
+    returns
+        end_gravity     (ndarray)   see integrate_missiles
+    """
+    limits = (mass, damping, max_speed, width, height, wall_thickness)
+    if scheme == "euler":
+        update_spaceships(position, velocity, thrust + gravity(position),
+                            *limits, dt=dt)
+        return None
+    if scheme == "verlet":
+        if start_gravity is None:
+            start_gravity = gravity(position)
+        update_spaceships(position, velocity, 0.5 * (thrust + start_gravity),
+                            *limits, dt=dt)
+        end_gravity = gravity(position)
+        velocity += 0.5 * dt * (thrust + end_gravity)
+        # the second half kick may push a spaceship past its speed limit
+        limit_speed(velocity, max_speed)
+        return end_gravity
+    raise ValueError("unknown integration scheme {}".format(scheme))
+
+
+
+def substep_counts(position, velocity, planet_position, planet_radius, dt,
+    max_substeps, courant=0.25):
+    """
+    Decide how many substeps every body needs, so that no substep moves it
+    further than a fraction (courant) of its distance to the surface of the
+    closest planet. Bodies far away from planets take a single step.
+    args
+        position        (ndarray)   (N, 2) positions
+        velocity        (ndarray)   (N, 2) velocities
+        planet_position (ndarray)   (P, 2) positions of the planets
+        planet_radius   (ndarray)   (P,) radii of the planets
+        dt              (float)     length of the whole step
+        max_substeps    (int)       upper limit of substeps
+        courant         (float)     fraction of the clearance a substep may
+                                        cover
+    returns
+        counts          (ndarray)   (N,) number of substeps per body
+    """
+    n_bodies = len(position)
+    counts = np.ones(n_bodies, dtype=np.intp)
+    if max_substeps <= 1 or n_bodies == 0 or len(planet_position) == 0:
+        return counts
+
+    clearance = np.empty(n_bodies)
+    chunk = max(1, _PAIR_CHUNK // len(planet_position))
+    for start in range(0, n_bodies, chunk):
+        stop = min(start + chunk, n_bodies)
+        diff = planet_position[np.newaxis, :, :] - \
+            position[start:stop, np.newaxis, :]
+        dist = np.hypot(diff[..., 0], diff[..., 1]) - planet_radius
+        clearance[start:stop] = dist.min(axis=1)
+    # bodies touching a planet get the finest resolution
+    clearance = np.maximum(clearance, 1e-6)
+
+    travel = np.hypot(velocity[:, 0], velocity[:, 1]) * dt
+    counts = np.ceil(travel / (courant * clearance))
+    return np.clip(counts, 1, max_substeps).astype(np.intp)
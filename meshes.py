@@ -0,0 +1,139 @@
+__author__ = "Devrim Celik"
+
+import numpy as np
+
+# distance the spaceship is drawn in front of the centre of its force field
+# (so it has equal distance to the circle to both sides with its boosters)
+SHIP_SHIFT = 5
+# length of the boosters
+BOOSTER_LENGTH = 5
+
+
+def _circle_template(segments):
+    """
+    Triangle fan of a unit circle, as independent triangles
+    returns
+        (segments * 3, 2) vertices
+    """
+    angles = np.linspace(0, 2 * np.pi, segments + 1)
+    rim = np.column_stack((np.cos(angles), np.sin(angles)))
+    triangles = np.zeros((segments, 3, 2))
+    triangles[:, 1] = rim[:-1]
+    triangles[:, 2] = rim[1:]
+    return triangles.reshape(-1, 2)
+
+
+
+def _rect_triangles(corner_a, corner_b):
+    """
+    Two triangles covering the rectangle in between two corners
+    """
+    (x0, y0), (x1, y1) = corner_a, corner_b
+    return [(x0, y0), (x1, y0), (x1, y1), (x0, y0), (x1, y1), (x0, y1)]
+
+
+
+# in its own frame, a spaceship of mass m has the vertices
+# m * template + offset, for the hull and both boosters
+_HULL_TEMPLATE = np.array([(1/2, 0), (-1/2, 1/3), (-1/2, -1/3)])
+_HULL_OFFSET = np.array([(SHIP_SHIFT, 0)] * 3)
+_BOOSTER_TEMPLATE = np.array(_rect_triangles((-1/2, 1/18), (-1/2, 2/9)) +
+                                _rect_triangles((-1/2, -1/18), (-1/2, -2/9)))
+_BOOSTER_OFFSET = np.array(_rect_triangles((SHIP_SHIFT - BOOSTER_LENGTH, 0),
+                                            (SHIP_SHIFT, 0)) * 2)
+
+
+def instances(template, position, scale, direction=None, offset=None):
+    """
+    Place copies of a template: scale it, rotate it by the direction and move
+    it to the position of every instance
+    args
+        template    (ndarray)   (V, 2) vertices of an instance of scale 1
+        position    (ndarray)   (N, 2) positions
+        scale       (ndarray)   (N,) scales
+        direction   (ndarray)   (N,) rotations in radians, None for none
+        offset      (ndarray)   (V, 2) added to the vertices after scaling
+                                    and before rotating
+    returns
+        vertices    (ndarray)   (N * V, 2) vertices of all instances
+    """
+    local = np.asarray(scale)[:, np.newaxis, np.newaxis] * template
+    if offset is not None:
+        local = local + offset
+    if direction is not None:
+        cos, sin = np.cos(direction), np.sin(direction)
+        x, y = local[..., 0], local[..., 1]
+        local = np.stack((cos[:, np.newaxis] * x - sin[:, np.newaxis] * y,
+                            sin[:, np.newaxis] * x + cos[:, np.newaxis] * y),
+                            axis=-1)
+    return (local + np.asarray(position)[:, np.newaxis, :]).reshape(-1, 2)
+
+
+
+def circle_mesh(position, radius, segments=16, max_edge=None):
+    """
+    Triangles of many circles. With max_edge, small circles get fewer
+    triangles: segments is halved (down to 4) as long as the edges of a
+    circle stay at most max_edge long
+    args
+        position    (ndarray)   (N, 2) centres
+        radius      (ndarray)   (N,) radii
+        segments    (int)       most triangles per circle
+        max_edge    (float)     longest edge of a circle, None to give every
+                                    circle all segments
+    returns
+        vertices    (ndarray)   (3 * sum of the segments of all circles, 2)
+    """
+    if max_edge is None:
+        return instances(_circle_template(segments), position, radius)
+    radius = np.asarray(radius, dtype=np.float64)
+    # halving the segments doubles the edges, 2 pi r / n
+    needed = 2 * np.pi * radius / max_edge
+    halvings = np.floor(np.log2(segments / np.maximum(needed, 4)))
+    halvings = np.clip(halvings, 0, max(int(np.log2(segments / 4)), 0))
+    meshes = [instances(_circle_template(segments >> h),
+                        position[halvings == h], radius[halvings == h])
+                for h in np.unique(halvings).astype(int)]
+    if not meshes:
+        return np.empty((0, 2))
+    return np.concatenate(meshes)
+
+
+
+def spaceship_meshes(position, direction, mass, segments=16, max_edge=None):
+    """
+    Triangles of many spaceships, one mesh per colour
+    args
+        position    (ndarray)   (N, 2) centres
+        direction   (ndarray)   (N,) headings in radians
+        mass        (ndarray)   (N,) masses (radius of the force field)
+        segments    (int)       triangles of the force field
+        max_edge    (float)     see circle_mesh
+    returns
+        field, hull, boosters   (ndarray)   (M, 2) vertices each
+    """
+    field = circle_mesh(position, mass, segments, max_edge)
+    hull = instances(_HULL_TEMPLATE, position, mass, direction,
+                        _HULL_OFFSET)
+    boosters = instances(_BOOSTER_TEMPLATE, position, mass, direction,
+                            _BOOSTER_OFFSET)
+    return field, hull, boosters
+
+
+
+def border_mesh(width, height, wall_thickness):
+    """
+    Triangles of the walls around the field
+    args
+        width           (float)     width of the world
+        height          (float)     height of the world
+        wall_thickness  (float)     thickness of the walls
+    returns
+        vertices        (ndarray)   (24, 2)
+    """
+    t = wall_thickness
+    return np.array(_rect_triangles((0, 0), (width, t)) +
+                    _rect_triangles((0, height - t), (width, height)) +
+                    _rect_triangles((0, t), (t, height - t)) +
+                    _rect_triangles((width - t, t), (width, height - t)),
+                    dtype=np.float64)
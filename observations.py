@@ -0,0 +1,191 @@
+__author__ = "Devrim Celik"
+
+import numpy as np
+from broadphase import UniformGrid, candidate_pairs
+from collision import segment_circle
+
+# features of the spaceship itself: x, y (divided by the world size),
+# velocity x, y (divided by the speed limit), cos and sin of the direction
+# and alive
+OWN_SIZE = 7
+# features per neighbour (nearest targets and threats): offset x, y and
+# distance (divided by the sensor range), velocity x, y relative to the
+# spaceship (divided by its speed limit); a missing neighbour is (0, 0, 1,
+# 0, 0)
+NEIGHBOUR_SIZE = 5
+# features per ray: distance to the first spaceship and to the first planet
+# along the ray, as fraction of the sensor range (1 if nothing is hit)
+RAY_SIZE = 2
+_NO_NEIGHBOUR = (0, 0, 1, 0, 0)
+
+
+class ObservationBuilder():
+    """
+    Builds the state of every spaceship of a world in one batched pass:
+    its own state, the k nearest other spaceships (targets), the k nearest
+    missiles (threats) and the distances along rays cast around its
+    direction ("is someone in front of me, how far away"). Everything
+    further away than the sensor range is not seen.
+
+    Neighbours are searched with a uniform grid with cells of the sensor
+    range, so only the 3x3 cells around a spaceship are looked at, and the
+    rays are tested against the circles of those cells all at once. The
+    result is written into an array that is kept in between calls.
+
+    The features of a spaceship are, in this order: OWN_SIZE own features,
+    k * NEIGHBOUR_SIZE for the targets, k * NEIGHBOUR_SIZE for the threats
+    and n_rays * RAY_SIZE for the rays.
+    """
+    def __init__(self, world, k=1, n_rays=5, fov=np.pi/2, sensor_range=300):
+        """
+        args
+            world           (World)     world to observe
+            k               (int)       number of targets and of threats
+            n_rays          (int)       number of rays, 0 for none
+            fov             (float)     angle in radians the rays are spread
+                                            over, centred on the direction
+            sensor_range    (float)     how far a spaceship can see
+        """
+        self.world = world
+        self.k = k
+        self.n_rays = n_rays
+        self.fov = fov
+        self.sensor_range = sensor_range
+        self.size = OWN_SIZE + 2 * k * NEIGHBOUR_SIZE + n_rays * RAY_SIZE
+        self.ray_angles = np.linspace(-fov/2, fov/2, n_rays) if n_rays > 1 \
+            else np.zeros(n_rays)
+        self._target_grid = UniformGrid(world.width, world.height)
+        self._threat_grid = UniformGrid(world.width, world.height)
+        self._planet_grid = UniformGrid(world.width, world.height)
+        self._out = np.zeros((0, self.size), dtype=np.float32)
+
+
+
+    def build(self):
+        """
+        Observe every spaceship of the world
+        returns
+            observations    (ndarray)   (S, size) float32, only valid until
+                                            the next call
+        """
+        s = self.world.ship_state
+        if len(self._out) < s.count:
+            self._out = np.zeros((max(s.count, 2 * len(self._out)),
+                                    self.size), dtype=np.float32)
+        out = self._out[:s.count]
+        if not s.count:
+            return out
+
+        out[:, 0] = s.position[:, 0] / self.world.width
+        out[:, 1] = s.position[:, 1] / self.world.height
+        out[:, 2:4] = s.velocity / s.max_speed[:, np.newaxis]
+        out[:, 4] = np.cos(s.direction)
+        out[:, 5] = np.sin(s.direction)
+        out[:, 6] = s.alive
+
+        block = NEIGHBOUR_SIZE * self.k
+        targets = out[:, OWN_SIZE:OWN_SIZE + block]
+        threats = out[:, OWN_SIZE + block:OWN_SIZE + 2 * block]
+        rays = out[:, OWN_SIZE + 2 * block:]
+        self._nearest(targets, self._target_grid, s.position, s.velocity,
+                        exclude_self=True)
+        m = self.world.missile_state
+        self._nearest(threats, self._threat_grid, m.position, m.velocity)
+        self._cast(rays)
+        return out
+
+
+
+    def _nearest(self, out, grid, position, velocity, exclude_self=False):
+        """
+        Write the k nearest points within the sensor range of every
+        spaceship into out
+        args
+            out             (ndarray)   (S, k * NEIGHBOUR_SIZE) to fill
+            grid            (UniformGrid)   grid to index the points with
+            position        (ndarray)   (N, 2) positions of the points
+            velocity        (ndarray)   (N, 2) velocities of the points
+            exclude_self    (bool)      the points are the spaceships
+        """
+        s = self.world.ship_state
+        out = out.reshape(len(out), self.k, NEIGHBOUR_SIZE)
+        out[...] = _NO_NEIGHBOUR
+        if not len(position):
+            return
+
+        rows, cols = candidate_pairs(grid, s.position, position,
+                                        self.sensor_range)
+        if exclude_self:
+            rows, cols = rows[rows != cols], cols[rows != cols]
+        diff = position[cols] - s.position[rows]
+        dist = np.hypot(diff[:, 0], diff[:, 1])
+        seen = dist <= self.sensor_range
+        rows, cols, diff, dist = rows[seen], cols[seen], diff[seen], \
+            dist[seen]
+
+        # rank the points of every spaceship by distance, keep the first k;
+        # dist is below the sensor range, so sorting rows + a fraction of
+        # it orders by spaceship first and distance second
+        order = np.argsort(rows + dist / (2 * self.sensor_range))
+        rows, cols, diff, dist = rows[order], cols[order], diff[order], \
+            dist[order]
+        rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        keep = rank < self.k
+        rows, cols, rank = rows[keep], cols[keep], rank[keep]
+
+        out[rows, rank, 0:2] = diff[keep] / self.sensor_range
+        out[rows, rank, 2] = dist[keep] / self.sensor_range
+        out[rows, rank, 3:5] = (velocity[cols] - s.velocity[rows]) / \
+            s.max_speed[rows, np.newaxis]
+
+
+
+    def _cast(self, out):
+        """
+        Write the distances along the rays of every spaceship into out
+        args
+            out             (ndarray)   (S, n_rays * RAY_SIZE) to fill
+        """
+        out = out.reshape(len(out), self.n_rays, RAY_SIZE)
+        out[...] = 1
+        if not self.n_rays:
+            return
+        s = self.world.ship_state
+        p = self.world.planet_state
+        angles = s.direction[:, np.newaxis] + self.ray_angles
+        ends = s.position[:, np.newaxis, :] + self.sensor_range * \
+            np.stack((np.cos(angles), np.sin(angles)), axis=-1)
+
+        for channel, grid, store, exclude_self in (
+            (0, self._target_grid, s, True),
+            (1, self._planet_grid, p, False)):
+            if not store.count:
+                continue
+            # a circle is only hit if its centre is within reach
+            reach = self.sensor_range + store.radius.max()
+            rows, cols = candidate_pairs(grid, s.position, store.position,
+                                            reach)
+            if exclude_self:
+                rows, cols = rows[rows != cols], cols[rows != cols]
+            # drop the circles out of reach and those outside of the fan of
+            # rays (unless the spaceship is inside of them), before testing
+            # them with every ray
+            diff = store.position[cols] - s.position[rows]
+            dist = np.hypot(diff[:, 0], diff[:, 1])
+            radius = store.radius[cols]
+            heading = np.arctan2(diff[:, 1], diff[:, 0]) - s.direction[rows]
+            heading = np.abs((heading + np.pi) % (2 * np.pi) - np.pi)
+            spread = np.arcsin(np.clip(radius / np.maximum(dist, 1e-12),
+                                        0, 1))
+            near = (dist <= self.sensor_range + radius) & \
+                ((heading <= self.fov / 2 + spread) | (dist <= radius))
+            rows, cols = rows[near], cols[near]
+            # every pair is tested with every ray
+            rays = np.tile(np.arange(self.n_rays), len(rows))
+            rows = np.repeat(rows, self.n_rays)
+            cols = np.repeat(cols, self.n_rays)
+            toi = segment_circle(s.position[rows], ends[rows, rays],
+                                    store.position[cols], store.radius[cols])
+            hit = toi <= 1
+            np.minimum.at(out[..., channel], (rows[hit], rays[hit]),
+                            toi[hit])
@@ -0,0 +1,133 @@
+__author__ = "Devrim Celik"
+
+import numpy as np
+
+# maximal number of body-planet pairs evaluated at once, bounds the size of
+# the temporary arrays when there are many bodies and planets
+_PAIR_CHUNK = 1 << 18
+
+
+def grav_force(positions, masses, planet_positions, planet_masses,
+    grav_const=1, softening=0.0):
+    """
+    Batched gravity kernel: calculate the total gravitational force of all
+    planets upon all bodies in one broadcast, instead of looping over every
+    body and planet pair. As in the rest of the simulation, this force is
+    directly added to the acceleration of a body.
+
+    Leading dimensions are broadcast, so stacked worlds of shape (K, N, 2)
+    and (K, P, 2) work as well.
+    args
+        positions           (ndarray)   (..., N, 2) positions of the bodies
+        masses              (ndarray)   (..., N) masses of the bodies
+        planet_positions    (ndarray)   (..., P, 2) positions of the planets
+        planet_masses       (ndarray)   (..., P) masses of the planets
+        grav_const          (float)     gravitational constant
+        softening           (float)     softening length, added to every
+                                            distance (in quadrature) so close
+                                            passes can not blow up
+    returns
+        force               (ndarray)   (..., N, 2) total pull on every body
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    planet_positions = np.asarray(planet_positions, dtype=np.float64)
+    planet_masses = np.asarray(planet_masses, dtype=np.float64)
+    n_bodies = positions.shape[-2]
+    n_planets = planet_positions.shape[-2]
+
+    force = np.zeros(np.broadcast_shapes(positions.shape,
+                                            planet_positions.shape[:-2] +
+                                            (1, 2)))
+    if n_bodies == 0 or n_planets == 0:
+        return force
+
+    chunk = max(1, _PAIR_CHUNK // n_planets)
+    for start in range(0, n_bodies, chunk):
+        stop = min(start + chunk, n_bodies)
+        # vectors from every body towards every planet, (..., n, P, 2)
+        pull_v = planet_positions[..., np.newaxis, :, :] - \
+            positions[..., start:stop, np.newaxis, :]
+        dist2 = np.einsum("...k,...k->...", pull_v, pull_v) + softening**2
+        # 1/dist**3 (the additional 1/dist normalizes pull_v), a body
+        # sitting exactly on a planet centre is not pulled by it
+        with np.errstate(divide="ignore"):
+            inv_dist3 = np.where(dist2 > 0, dist2, np.inf)**-1.5
+        strength = planet_masses[..., np.newaxis, :] * inv_dist3
+        force[..., start:stop, :] = np.einsum("...np,...npk->...nk",
+                                                strength, pull_v)
+
+    force *= grav_const * np.asarray(masses)[..., np.newaxis]
+    return force
+
+
+
+def update_missiles(position, velocity, acceleration, dt=1):
+    """
+    Given the current position velocity and acceleration, calculate the new
+    position of missiles (one semi-implicit Euler step). All arrays are
+    changed in place and may have any number of leading dimensions.
+    args
+        position        (ndarray)   (..., 2) positions
+        velocity        (ndarray)   (..., 2) velocities
+        acceleration    (ndarray)   (..., 2) accelerations, reset to 0
+        dt              (float)     length of the step, 1 is one frame
+    """
+    velocity += acceleration * dt
+    position += velocity * dt
+    acceleration[...] = 0
+
+
+
+def limit_speed(velocity, max_speed):
+    """
+    Scale velocities down to the speed limit where they exceed it, in place
+    args
+        velocity        (ndarray)   (..., 2) velocities
+        max_speed       (ndarray)   (...) speed limits
+    """
+    # check if our current velocity magnitude (eqv. to speed) is higher
+    # than the spaceships speed limit
+    speed = np.hypot(velocity[..., 0], velocity[..., 1])
+    too_fast = speed > max_speed
+    velocity *= np.where(too_fast, max_speed / np.where(too_fast, speed, 1),
+                            1)[..., np.newaxis]
+
+
+
+def update_spaceships(position, velocity, acceleration, mass, damping,
+    max_speed, width, height, wall_thickness, dt=1):
+    """
+    update velocity and position of spaceships (one semi-implicit Euler
+    step) and set acceleration to 0. All arrays are changed in place and may
+    have any number of leading dimensions.
+    args
+        position        (ndarray)   (..., 2) positions
+        velocity        (ndarray)   (..., 2) velocities
+        acceleration    (ndarray)   (..., 2) accelerations, reset to 0
+        mass            (ndarray)   (...) masses (and radii)
+        damping         (ndarray)   (...) damping factors
+        max_speed       (ndarray)   (...) speed limits
+        width           (float)     width of the world
+        height          (float)     height of the world
+        wall_thickness  (float)     thickness of the walls
+        dt              (float)     length of the step, 1 is one frame
+    """
+    # apply acceleration to velocity
+    velocity += acceleration * dt
+    # apply damping, so it the velocity asymptotically reaches 0 if
+    # no acceleration is applied (damping is given per frame)
+    velocity *= (np.asarray(damping)**dt)[..., np.newaxis]
+    limit_speed(velocity, max_speed)
+    # check if touching borders and bounce (by reversing the according
+    # velocity component) if yes
+    reach = mass + wall_thickness
+    x, y = position[..., 0], position[..., 1]
+    velocity[..., 0] *= np.where((x + reach >= width) | (x - reach <= 0),
+                                    -1, 1)
+    velocity[..., 1] *= np.where((y + reach >= height) | (y - reach <= 0),
+                                    -1, 1)
+    # apply velocity to position
+    position += velocity * dt
+    # if there is no external force applying onto an object, the
+    # acceleration is zero by default
+    acceleration[...] = 0
@@ -0,0 +1,189 @@
+__author__ = "Devrim Celik"
+
+import json
+import time
+import numpy as np
+
+
+class _NoStage():
+    """
+    Stand-in for a stage of a disabled profiler, does nothing
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+# shared by all disabled profilers, so timing a stage allocates nothing
+_NO_STAGE = _NoStage()
+
+
+
+class _Stage():
+    """
+    Times one execution of a stage, see Profiler.stage
+    """
+    __slots__ = ("profiler", "name")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._stack.append([time.perf_counter(), 0.0])
+        return self
+
+    def __exit__(self, *exc):
+        stack = self.profiler._stack
+        start, nested = stack.pop()
+        elapsed = time.perf_counter() - start
+        current = self.profiler._current
+        # stages only count their own time, not the time of nested stages
+        current[self.name] = current.get(self.name, 0.0) + elapsed - nested
+        if stack:
+            stack[-1][1] += elapsed
+        return False
+
+
+
+
+
+class Profiler():
+    """
+    Measures how long every stage of a frame takes. Stages are timed with
+
+        with profiler.stage("gravity"):
+            ...
+
+    and may be nested, a stage only counts the time not spent in the stages
+    nested inside it. A stage can run several times per frame, end_frame()
+    adds them up and keeps the totals of the last window frames, from which
+    report() takes the percentiles.
+
+    A disabled profiler hands out one shared object that does nothing, so
+    the instrumentation can stay in the hot path.
+    """
+    def __init__(self, enabled=False, window=300):
+        """
+        args
+            enabled     (bool)      measure at all
+            window      (int)       number of frames the statistics are
+                                        taken over
+        """
+        self.enabled = enabled
+        self.window = window
+        # number of finished frames
+        self.frames = 0
+        # seconds per stage of the last window frames, as ring buffers
+        self._samples = {}
+        # seconds in between the ends of the last window frames
+        self._intervals = np.zeros(window)
+        self._last_end = None
+        # seconds per stage of the running frame
+        self._current = {}
+        # [start, time of nested stages] of the running stages
+        self._stack = []
+
+
+
+    def stage(self, name):
+        """
+        Context manager timing a stage
+        args
+            name        (str)       name of the stage
+        """
+        if not self.enabled:
+            return _NO_STAGE
+        return _Stage(self, name)
+
+
+
+    def wrap(self, name, function):
+        """
+        Time every call of a function as a stage
+        args
+            name        (str)       name of the stage
+            function    (function)  function to time
+        returns
+            function, unchanged if the profiler is disabled
+        """
+        if not self.enabled:
+            return function
+
+        def timed(*args, **kwargs):
+            with _Stage(self, name):
+                return function(*args, **kwargs)
+        return timed
+
+
+
+    def end_frame(self):
+        """
+        Finish the running frame
+        """
+        if not self.enabled:
+            return
+        indx = self.frames % self.window
+        for name in self._current.keys() - self._samples.keys():
+            self._samples[name] = np.zeros(self.window)
+        for name, samples in self._samples.items():
+            samples[indx] = self._current.get(name, 0.0)
+        now = time.perf_counter()
+        if self._last_end is not None:
+            self._intervals[indx] = now - self._last_end
+        self._last_end = now
+        self.frames += 1
+        self._current = {}
+
+
+
+    def report(self):
+        """
+        Statistics of the last window frames, all times in milliseconds
+        returns
+            report      (dict)      "frames", "fps" and per stage "p50",
+                                        "p95", "p99" and "mean" in "stages"
+        """
+        n = min(self.frames, self.window)
+        stages = {}
+        for name, samples in sorted(self._samples.items()):
+            samples = samples[:n] * 1e3
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            stages[name] = {"p50": p50, "p95": p95, "p99": p99,
+                            "mean": samples.mean()}
+        # the interval of the very first frame is unknown
+        intervals = self._intervals[:n][self._intervals[:n] > 0]
+        fps = 1 / intervals.mean() if len(intervals) else 0.0
+        return {"frames": self.frames, "fps": fps, "stages": stages}
+
+
+
+    def lines(self):
+        """
+        The report as short text lines, e.g. for an on-screen overlay
+        returns
+            lines       (list)      of str
+        """
+        report = self.report()
+        lines = ["{:.1f} fps".format(report["fps"]),
+                    "{:<15}{:>7}{:>7}{:>7}".format("ms", "p50", "p95",
+                                                    "p99")]
+        for name, stats in report["stages"].items():
+            lines.append("{:<15}{:>7.2f}{:>7.2f}{:>7.2f}".format(
+                name, stats["p50"], stats["p95"], stats["p99"]))
+        return lines
+
+
+
+    def dump(self, path):
+        """
+        Write the report as json
+        args
+            path        (str)       file to write
+        """
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
@@ -0,0 +1,358 @@
+__author__ = "Devrim Celik"
+
+import json
+import struct
+import numpy as np
+
+# entity fields written for every frame (the ids are always written)
+RECORD_FIELDS = ("position", "velocity", "direction", "alive", "mass",
+                    "radius")
+# stores of the world that are recorded, in file order
+KINDS = ("ship_state", "missile_state", "planet_state")
+
+# file header: magic, format version, length of the json description
+_MAGIC = b"SSTR"
+_VERSION = 1
+_FILE_HEADER = struct.Struct("<4sII")
+# chunk header: magic, number of frames, index of the first frame, number of
+# bytes of the chunk body
+_CHUNK_MAGIC = b"CHNK"
+_CHUNK_HEADER = struct.Struct("<4sIqq")
+# every array in a chunk starts at a multiple of this
+_ALIGN = 8
+
+
+def _padding(n):
+    return -n % _ALIGN
+
+
+
+class TrajectoryRecorder():
+    """
+    Streams the state of a world into an append-only binary file, one frame
+    per call of record(). Frames are collected in memory and written as one
+    chunk every chunk_frames frames. Inside a chunk the data is columnar: per
+    kind of entity the number of entities of every frame, followed by one
+    array per field holding the rows of all frames back to back, followed by
+    the events of all frames.
+
+    A chunk is written with a single write, so a recording that is cut off
+    (e.g. by a crash) loses at most its last, incomplete chunk.
+    """
+    def __init__(self, path, world, fields=RECORD_FIELDS, chunk_frames=256):
+        """
+        args
+            path            (str)       file to write, is overwritten
+            world           (World)     world to record
+            fields          (tuple)     fields of the entities to record
+            chunk_frames    (int)       number of frames per chunk
+        """
+        self.world = world
+        self.chunk_frames = chunk_frames
+        self.n_frames = 0
+        # (name, shape, dtype) of the recorded fields per kind
+        self._layout = {}
+        for kind in KINDS:
+            store = getattr(world, kind)
+            described = {name: (shape, dtype)
+                            for name, shape, dtype in store.fields}
+            self._layout[kind] = [("ids", (), np.dtype(np.int64))] + \
+                [(name, described[name][0], np.dtype(described[name][1]))
+                    for name in fields]
+
+        description = json.dumps({
+            "world": {"width": world.width, "height": world.height,
+                        "wall_thickness": world.wall_thickness,
+                        "dt": world.dt},
+            "fields": {kind: [[name, list(shape), dtype.str]
+                                for name, shape, dtype in layout]
+                        for kind, layout in self._layout.items()},
+        }).encode()
+        description += b" " * _padding(_FILE_HEADER.size + len(description))
+        self._file = open(path, "wb")
+        self._file.write(_FILE_HEADER.pack(_MAGIC, _VERSION,
+                                            len(description)))
+        self._file.write(description)
+        self._clear()
+
+
+
+    def _clear(self):
+        """
+        Start collecting a new chunk
+        """
+        self._frame_counts = []
+        self._columns = {kind: {name: [] for name, _, _ in layout}
+                            for kind, layout in self._layout.items()}
+        self._events = []
+
+
+
+    def record(self):
+        """
+        Copy the current state and the events of the last step of the world
+        """
+        for kind, columns in self._columns.items():
+            store = getattr(self.world, kind)
+            for name, column in columns.items():
+                column.append(getattr(store, name).copy())
+        self._events.append(self.world.events)
+        self._frame_counts.append(self.world.frame_count)
+        if len(self._frame_counts) >= self.chunk_frames:
+            self.flush()
+
+
+
+    def flush(self):
+        """
+        Write the collected frames as one chunk
+        """
+        n_frames = len(self._frame_counts)
+        if not n_frames:
+            return
+        parts = [np.array(self._frame_counts, dtype=np.int64)]
+        for kind, columns in self._columns.items():
+            parts.append(np.array([len(rows) for rows in columns["ids"]],
+                                    dtype=np.int64))
+            for name, shape, dtype in self._layout[kind]:
+                parts.append(np.concatenate(columns[name]).astype(dtype,
+                                                                copy=False))
+        parts.append(np.array([len(e) for e in self._events],
+                                dtype=np.int64))
+        parts.append(np.concatenate(self._events).astype(np.int64,
+                                                            copy=False))
+
+        body = []
+        for part in parts:
+            data = part.tobytes()
+            body += [data, b"\0" * _padding(len(data))]
+        body = b"".join(body)
+        self._file.write(_CHUNK_HEADER.pack(_CHUNK_MAGIC, n_frames,
+                                            self.n_frames, len(body)) + body)
+        self._file.flush()
+        self.n_frames += n_frames
+        self._clear()
+
+
+
+    def close(self):
+        """
+        Write the remaining frames and close the file
+        """
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+
+    def __enter__(self):
+        return self
+
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+
+
+
+class TrajectoryReader():
+    """
+    Random access to every frame of a recording. The file is memory-mapped,
+    so opening it only reads the chunk headers and a frame is read from disk
+    when it is accessed; all arrays handed out are read-only views into the
+    file.
+    """
+    def __init__(self, path):
+        """
+        args
+            path        (str)       file written by a TrajectoryRecorder
+        """
+        self._data = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version, length = _FILE_HEADER.unpack_from(self._data, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("{} is not a trajectory (version {})".format(
+                path, _VERSION))
+        offset = _FILE_HEADER.size
+        description = json.loads(bytes(self._data[offset:offset + length]))
+        offset += length
+        self.world = description["world"]
+        self._layout = {kind: [(name, tuple(shape), np.dtype(dtype))
+                                for name, shape, dtype in layout]
+                        for kind, layout in description["fields"].items()}
+
+        # find all complete chunks
+        self._chunk_offsets = []
+        self._chunk_frames = []
+        starts = []
+        while offset + _CHUNK_HEADER.size <= len(self._data):
+            magic, n_frames, first, size = _CHUNK_HEADER.unpack_from(
+                self._data, offset)
+            body = offset + _CHUNK_HEADER.size
+            if magic != _CHUNK_MAGIC or body + size > len(self._data):
+                break
+            self._chunk_offsets.append(body)
+            self._chunk_frames.append(n_frames)
+            starts.append(first)
+            offset = body + size
+            self.n_frames = first + n_frames
+        if not starts:
+            self.n_frames = 0
+        self._starts = np.array(starts, dtype=np.int64)
+        # the last parsed chunk, consecutive frames mostly share it
+        self._cached = (None, None)
+
+
+
+    def __len__(self):
+        return self.n_frames
+
+
+
+    def _chunk(self, indx):
+        """
+        Views of all arrays of a chunk
+        args
+            indx        (int)       number of the chunk
+        returns
+            chunk       (dict)      "frame_count", "events", per kind the
+                                        row offsets ("offsets") and fields
+        """
+        if self._cached[0] == indx:
+            return self._cached[1]
+        offset = self._chunk_offsets[indx]
+        n_frames = self._chunk_frames[indx]
+
+        def take(dtype, shape):
+            nonlocal offset
+            n = int(np.prod(shape, dtype=np.int64))
+            arr = np.frombuffer(self._data, dtype, n, offset).reshape(shape)
+            offset += arr.nbytes + _padding(arr.nbytes)
+            return arr
+
+        chunk = {"frame_count": take(np.int64, (n_frames,))}
+        for kind, layout in self._layout.items():
+            counts = take(np.int64, (n_frames,))
+            columns = {"offsets": np.concatenate(([0], np.cumsum(counts)))}
+            for name, shape, dtype in layout:
+                columns[name] = take(dtype, (columns["offsets"][-1],) + shape)
+            chunk[kind] = columns
+        counts = take(np.int64, (n_frames,))
+        chunk["event_offsets"] = np.concatenate(([0], np.cumsum(counts)))
+        chunk["events"] = take(np.int64, (chunk["event_offsets"][-1], 3))
+        self._cached = (indx, chunk)
+        return chunk
+
+
+
+    def frame(self, indx):
+        """
+        Everything recorded for one frame
+        args
+            indx        (int)       number of the frame, negative counts
+                                        from the end
+        returns
+            frame       (dict)      "frame_count" of the world, "events"
+                                        (E, 3) and per kind a dict of fields
+        """
+        if indx < 0:
+            indx += self.n_frames
+        if not 0 <= indx < self.n_frames:
+            raise IndexError("frame {} not recorded".format(indx))
+        c = int(np.searchsorted(self._starts, indx, side="right")) - 1
+        chunk = self._chunk(c)
+        i = indx - self._starts[c]
+        frame = {"frame_count": int(chunk["frame_count"][i]),
+                    "events": chunk["events"][chunk["event_offsets"][i]:
+                                                chunk["event_offsets"][i + 1]]}
+        for kind in self._layout:
+            columns = chunk[kind]
+            rows = slice(columns["offsets"][i], columns["offsets"][i + 1])
+            frame[kind] = {name: columns[name][rows]
+                            for name, _, _ in self._layout[kind]}
+        return frame
+
+
+
+    def apply(self, indx, world):
+        """
+        Put the entities of a frame into a world, so it can be drawn with the
+        usual display() methods (nothing is simulated)
+        args
+            indx        (int)       number of the frame
+            world       (World)     world to overwrite
+        """
+        frame = self.frame(indx)
+        for kind in self._layout:
+            values = dict(frame[kind])
+            if "position" in values:
+                # nothing to interpolate in between recorded frames
+                values["previous_position"] = values["position"]
+            getattr(world, kind).assign(values.pop("ids"), **values)
+        world.frame_count = frame["frame_count"]
+
+
+
+    def replay(self, world, start=0, stop=None, step=1):
+        """
+        Go through the recording frame by frame
+        args
+            world       (World)     world every frame is applied to
+            start       (int)       first frame
+            stop        (int)       frame to stop before, the end if None
+            step        (int)       distance of the frames
+        yields
+            indx        (int)       number of the frame now in the world
+        """
+        stop = self.n_frames if stop is None else stop
+        for indx in range(start, stop, step):
+            self.apply(indx, world)
+            yield indx
+
+
+
+    def export(self, path, start=0, stop=None):
+        """
+        Headless export of a range of frames into a numpy .npz archive with
+        one flat array per kind and field ("<kind>/<field>"), a "<kind>/frame"
+        array holding the frame of every row and the "events" of all frames
+        args
+            path        (str)       file to write
+            start       (int)       first frame
+            stop        (int)       frame to stop before, the end if None
+        """
+        stop = self.n_frames if stop is None else stop
+        arrays = {}
+        for kind, layout in self._layout.items():
+            for name, shape, dtype in layout:
+                arrays["{}/{}".format(kind, name)] = []
+            arrays["{}/frame".format(kind)] = []
+        arrays["events"] = []
+        arrays["events/frame"] = []
+
+        # copy whole chunks at once, only cut the first and the last one
+        c = max(int(np.searchsorted(self._starts, start, side="right")) - 1,
+                0)
+        while c < len(self._starts) and self._starts[c] < stop:
+            chunk = self._chunk(c)
+            first = self._starts[c]
+            lo = max(start - first, 0)
+            hi = min(stop - first, len(chunk["frame_count"]))
+            frames = np.arange(first + lo, first + hi)
+            for kind, layout in self._layout.items():
+                offsets = chunk[kind]["offsets"]
+                rows = slice(offsets[lo], offsets[hi])
+                for name, _, _ in layout:
+                    arrays["{}/{}".format(kind, name)].append(
+                        chunk[kind][name][rows])
+                arrays["{}/frame".format(kind)].append(
+                    np.repeat(frames, np.diff(offsets[lo:hi + 1])))
+            offsets = chunk["event_offsets"]
+            arrays["events"].append(chunk["events"][offsets[lo]:offsets[hi]])
+            arrays["events/frame"].append(
+                np.repeat(frames, np.diff(offsets[lo:hi + 1])))
+            c += 1
+
+        np.savez(path, **{name: np.concatenate(parts) if parts else
+                            np.zeros(0) for name, parts in arrays.items()})
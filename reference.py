@@ -0,0 +1,191 @@
+__author__ = "Devrim Celik"
+
+import math
+
+
+class RefMissile():
+    """
+    Missile of the reference implementation, one object per missile
+    """
+    def __init__(self, x, y, direction, speed=None, mass=None):
+        self.position = [x, y]
+        speed = 10 if speed is None else speed
+        self.velocity = [math.cos(direction) * speed,
+                            math.sin(direction) * speed]
+        self.acceleration = [0.0, 0.0]
+        self.mass = 20 if mass is None else mass
+        self.radius = self.mass/10
+
+
+
+    def grav_Force(self, planets, grav_const):
+        for p in planets:
+            dx = p.position[0] - self.position[0]
+            dy = p.position[1] - self.position[1]
+            dist = math.hypot(dx, dy)
+            pull = grav_const * self.mass * p.mass / dist**2 / dist
+            self.acceleration[0] += dx * pull
+            self.acceleration[1] += dy * pull
+
+
+
+    def update(self, planets, grav_const):
+        self.grav_Force(planets, grav_const)
+        for i in range(2):
+            self.velocity[i] += self.acceleration[i]
+            self.position[i] += self.velocity[i]
+            self.acceleration[i] = 0.0
+
+
+
+    def on_screen(self, width, height):
+        return 0 <= self.position[0] <= width and \
+            0 <= self.position[1] <= height
+
+
+
+
+
+class RefPlanet():
+    """
+    Planet of the reference implementation
+    """
+    def __init__(self, x, y, mass=None):
+        self.position = [x, y]
+        self.mass = 30 if mass is None else mass
+        self.radius = self.mass/2
+
+
+
+
+
+class RefSpaceship(RefMissile):
+    """
+    Spaceship of the reference implementation
+    """
+    def __init__(self, x, y, wall_thickness, direction=None, mass=None,
+        damping=None, max_speed=None):
+        self.position = [x, y]
+        self.velocity = [0.0, 0.0]
+        self.acceleration = [0.0, 0.0]
+        self.wall_thickness = wall_thickness
+        self.direction = 0 if direction is None else direction
+        self.mass = 30 if mass is None else mass
+        self.radius = self.mass
+        self.damping = 0.99 if damping is None else damping
+        self.max_speed = 10 if max_speed is None else max_speed
+        self.alive = True
+
+
+
+    def update(self, planets, grav_const, width, height):
+        self.grav_Force(planets, grav_const)
+        for i in range(2):
+            self.velocity[i] += self.acceleration[i]
+            self.velocity[i] *= self.damping
+        speed = math.hypot(*self.velocity)
+        if speed > self.max_speed:
+            self.velocity[0] *= self.max_speed / speed
+            self.velocity[1] *= self.max_speed / speed
+        for i, size in enumerate((width, height)):
+            if self.position[i] + self.mass + self.wall_thickness >= size or \
+                self.position[i] - self.mass - self.wall_thickness <= 0:
+                self.velocity[i] *= -1
+            self.position[i] += self.velocity[i]
+            self.acceleration[i] = 0.0
+
+
+
+    def touch_circle(self, circle):
+        dist = math.hypot(circle.position[0] - self.position[0],
+                            circle.position[1] - self.position[1])
+        if dist - math.hypot(*self.velocity) < self.radius + circle.radius:
+            self.velocity[0] *= -1
+            self.velocity[1] *= -1
+
+
+
+    def is_hit(self, missile_positions):
+        for indx, (x, y) in enumerate(missile_positions):
+            if (x - self.position[0])**2 + (y - self.position[1])**2 < \
+                self.mass**2:
+                self.alive = False
+                return indx
+        return None
+
+
+
+
+
+class ReferenceWorld():
+    """
+    Pure Python re-implementation of the original frame update, where every
+    entity is an object and every interaction a Python loop (gravity per
+    body and planet, hit test per spaceship and missile, bounce test per pair
+    of circles). It has no p5 dependency and draws nothing, its only purpose
+    is to be the baseline the vectorized World is benchmarked against; it
+    offers the part of the World interface the benchmarks use.
+    """
+    def __init__(self, width=1080, height=720, wall_thickness=10,
+        grav_const=1):
+        self.width = width
+        self.height = height
+        self.wall_thickness = wall_thickness
+        self.grav_const = grav_const
+        self.spaceships = []
+        self.missiles = []
+        self.planets = []
+        self.frame_count = 0
+
+
+
+    def add_spaceship(self, x, y, direction=None, mass=None, damping=None,
+        max_speed=None, enable_audio=None):
+        self.spaceships.append(RefSpaceship(x, y, self.wall_thickness,
+                                            direction, mass, damping,
+                                            max_speed))
+
+
+
+    def add_missile(self, x, y, direction, speed=None, mass=None):
+        self.missiles.append(RefMissile(x, y, direction, speed, mass))
+
+
+
+    def add_planet(self, x, y, mass=None):
+        self.planets.append(RefPlanet(x, y, mass))
+
+
+
+    def remove_objects(self):
+        self.missiles = [m for m in self.missiles
+                            if m.on_screen(self.width, self.height)]
+        missile_positions = [tuple(m.position) for m in self.missiles]
+        survivors = []
+        for s in self.spaceships:
+            indx = s.is_hit(missile_positions)
+            if indx is None:
+                survivors.append(s)
+            else:
+                # the missile is gone, but keeps its place in the list of
+                # positions the other spaceships test against
+                self.missiles[indx] = None
+        self.spaceships = survivors
+        self.missiles = [m for m in self.missiles if m is not None]
+
+
+
+    def step(self, n=1):
+        for _ in range(n):
+            self.remove_objects()
+            for m in self.missiles:
+                m.update(self.planets, self.grav_const)
+            for s in self.spaceships:
+                s.update(self.planets, self.grav_const, self.width,
+                            self.height)
+                for s2 in self.spaceships:
+                    if s is not s2:
+                        s.touch_circle(s2)
+                for p in self.planets:
+                    s.touch_circle(p)
+            self.frame_count += 1
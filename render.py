@@ -0,0 +1,237 @@
+__author__ = "Devrim Celik"
+
+import numpy as np
+from p5 import *
+from meshes import border_mesh, circle_mesh, spaceship_meshes
+
+
+def draw_borders(wall_thickness):
+    """
+    Draw the screen borders
+    args
+        wall_thickness      (int)   Width of borders in pixel
+    """
+    # color of the border
+    stroke(0)
+    # color of the field
+    fill(255)
+    for i in range(wall_thickness):
+        rect((i,i), (width-i, height-i), mode="CORNERS")
+        # TODO why are there white points that I have to fill like this
+        point(i,i)
+        point(width-i, height-i)
+
+
+
+def draw_missile(missile, position=None):
+    """
+    Draw missile on sketch, represented by a small black dot
+    args
+        missile     (Missile)   missile to draw
+        position    (ndarray)   where to draw it, its position if None
+    """
+    if position is None:
+        position = missile.position
+    fill(0)
+    circle(tuple(position), missile.radius, mode="RADIUS")
+
+
+
+def draw_planet(planet, position=None):
+    """
+    Draw planet on sketch
+    args
+        planet      (Planet)    planet to draw
+        position    (ndarray)   where to draw it, its position if None
+    """
+    if position is None:
+        position = planet.position
+    fill(50, 175, 200)
+    circle(tuple(position), planet.radius, mode="RADIUS")
+
+
+
+def draw_spaceship(spaceship, position=None):
+    """
+    drawing spaceship (with forcefield, boosters, etc...) on sketch window
+    args
+        spaceship   (Spaceship) spaceship to draw
+        position    (ndarray)   where to draw it, its position if None
+    """
+    if position is None:
+        position = spaceship.position
+    mass = spaceship.mass
+    # since we have turbines at the rocket, we dont want the rocket to be
+    # in the exact middle of the circle, but to include a small offset
+    # so it has equal distance to the circle to both sides
+    shift = 5
+
+    # local changes
+    push_matrix()
+    # set current position as origin
+    translate(position[0], position[1])
+    # rotate the matrix by heading, so we will draw in a shifted version
+    rotate(spaceship.direction)
+    # draw force field
+    fill(100)
+    circle((0, 0), (mass), mode="RADIUS")
+    # draw spaceship
+    fill(255)
+    triangle((mass/2+shift, 0),
+            (-mass/2+shift, mass/3),
+            (-mass/2+shift, -mass/3))
+    # draw boosters
+    fill(255, 0, 0)
+    rect((-mass/2-5+shift, mass/18),
+        (-mass/2+shift, 2*mass/9),
+        mode="CORNERS")
+    rect((-mass/2-5+shift, -mass/18),
+        (-mass/2+shift, -2*mass/9),
+        mode="CORNERS")
+    # reset locally made global matrix changes
+    reset_matrix()
+
+
+
+def draw_world(world, alpha=1.0):
+    """
+    Draw every object the world currently holds
+    args
+        world       (World)     world to render
+        alpha       (float)     how far in between the previous (0) and the
+                                    current (1) step to draw moving objects
+    """
+    for p in world.planets:
+        draw_planet(p)
+    for m, position in zip(world.missiles,
+                            world.interpolate(world.missile_state, alpha)):
+        draw_missile(m, position)
+    for s, position in zip(world.spaceships,
+                            world.interpolate(world.ship_state, alpha)):
+        draw_spaceship(s, position)
+
+
+
+def draw_profile(profiler, position=(20, 30), line_height=15):
+    """
+    Overlay the frame rate and the stage timings of a profiler
+    args
+        profiler    (Profiler)  profiler to show
+        position    (tuple)     top left corner of the text
+        line_height (int)       distance of the lines in pixel
+    """
+    fill(0)
+    for i, line in enumerate(profiler.lines()):
+        text(line, (position[0], position[1] + i * line_height))
+
+
+
+def triangle_shape(vertices, color):
+    """
+    Build a shape of many triangles, which draw_shape hands to p5 in one
+    call. Its colours are fixed here: a shape would otherwise keep the fill
+    and stroke that were active while it was built, and it has no stroke as
+    long as no_stroke() is active.
+    args
+        vertices    (ndarray)   (3 * T, 2) corners of T triangles
+        color       (tuple)     fill colour
+    returns
+        shape       (PShape)    None for an empty mesh
+    """
+    if not len(vertices):
+        return None
+    # p5 0.7 only transforms vertices with a z coordinate
+    vertices = np.column_stack((vertices, np.zeros(len(vertices))))
+    return PShape(fill_color=Color(*color), stroke_color=None,
+                    vertices=vertices, shape_type=TRIANGLES)
+
+
+
+def draw_triangles(shape):
+    """
+    Draw a shape built by triangle_shape
+    args
+        shape       (PShape)    shape to draw, may be None
+    """
+    if shape is not None:
+        draw_shape(shape)
+
+
+
+
+
+class BatchRenderer():
+    """
+    Draws a whole world with a few shapes instead of several p5 calls per
+    entity: the vertices of every kind of entity are built at once from the
+    state arrays (see meshes.py) and handed to p5 as one prebuilt shape per
+    colour, so the number of p5 calls per frame does not depend on the
+    number of entities.
+
+    The walls and the planets only change when a planet is added or grows,
+    so their shapes are kept and only rebuilt if the planet state changed.
+    Small circles get fewer segments, so a missile costs a few triangles.
+    """
+    def __init__(self, segments=16, max_edge=4):
+        """
+        args
+            segments    (int)       most triangles per circle
+            max_edge    (float)     circles get the fewest segments (down to
+                                        4) whose edges are at most this long
+        """
+        self.segments = segments
+        self.max_edge = max_edge
+        self._static = None
+        self._static_key = None
+
+
+
+    def _static_layer(self, world):
+        """
+        Meshes of the walls and the planets, rebuilt only on changes
+        """
+        planets = world.planet_state
+        key = (world.width, world.height, world.wall_thickness,
+                planets.ids.tobytes(), planets.position.tobytes(),
+                planets.radius.tobytes())
+        if key != self._static_key:
+            self._static = (triangle_shape(border_mesh(
+                                world.width, world.height,
+                                world.wall_thickness), (0,)),
+                            triangle_shape(circle_mesh(
+                                planets.position, planets.radius,
+                                self.segments, self.max_edge),
+                                (50, 175, 200)))
+            self._static_key = key
+        return self._static
+
+
+
+    def draw(self, world, alpha=1.0):
+        """
+        Draw the walls and every object of the world
+        args
+            world       (World)     world to render
+            alpha       (float)     see draw_world
+        """
+        # shapes are built without stroke, see triangle_shape
+        no_stroke()
+        background(255)
+        borders, planets = self._static_layer(world)
+        draw_triangles(borders)
+        draw_triangles(planets)
+
+        missiles = world.missile_state
+        draw_triangles(triangle_shape(circle_mesh(
+            world.interpolate(missiles, alpha), missiles.radius,
+            self.segments, self.max_edge), (0,)))
+
+        ships = world.ship_state
+        field, hull, boosters = spaceship_meshes(
+            world.interpolate(ships, alpha), ships.direction, ships.mass,
+            self.segments, self.max_edge)
+        draw_triangles(triangle_shape(field, (100,)))
+        draw_triangles(triangle_shape(hull, (255,)))
+        draw_triangles(triangle_shape(boosters, (255, 0, 0)))
+        # the other drawing functions expect the default stroke
+        stroke(0)
@@ -0,0 +1,234 @@
+__author__ = "Devrim Celik"
+
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from vec_env import VecSpaceshipEnv, OBS_SIZE
+
+# control commands sent from the pool to its workers
+_STEP = "step"
+_RESET = "reset"
+_CLOSE = "close"
+
+
+def _buffer_layout(num_envs, num_spaceships):
+    """
+    Shapes and dtypes of the shared buffers for num_envs environments
+    """
+    return {
+        "observations": ((num_envs, num_spaceships, OBS_SIZE), np.float32),
+        "terminal_observations": ((num_envs, num_spaceships, OBS_SIZE),
+                                    np.float32),
+        "rewards": ((num_envs, num_spaceships), np.float32),
+        "dones": ((num_envs,), np.bool_),
+        "actions": ((num_envs, num_spaceships), np.int64),
+    }
+
+
+
+def _attach(names, layout):
+    """
+    Attach to shared memory blocks and wrap them into arrays
+    returns
+        (list of SharedMemory, dict of ndarray)
+    """
+    blocks = []
+    arrays = {}
+    for key, (shape, dtype) in layout.items():
+        block = shared_memory.SharedMemory(name=names[key])
+        blocks.append(block)
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    return blocks, arrays
+
+
+
+def _worker(conn, names, layout, start, stop, env_kwargs, seed):
+    """
+    Worker process: owns the environments [start, stop) of the pool and
+    writes their results directly into the shared buffers. Only the short
+    command strings and acknowledgements go through the pipe.
+    """
+    blocks, arrays = _attach(names, layout)
+    obs = arrays["observations"][start:stop]
+    terminal = arrays["terminal_observations"][start:stop]
+    rewards = arrays["rewards"][start:stop]
+    dones = arrays["dones"][start:stop]
+    actions = arrays["actions"][start:stop]
+    env = VecSpaceshipEnv(num_envs=stop - start, seed=seed, **env_kwargs)
+    try:
+        while True:
+            command = conn.recv()
+            if command == _STEP:
+                o, r, d, infos = env.step(actions)
+                obs[:] = o
+                rewards[:] = r
+                dones[:] = d
+                terminal[d] = infos["terminal_observation"]
+            elif command == _RESET:
+                obs[:] = env.reset()
+                rewards[:] = 0
+                dones[:] = False
+            elif command == _CLOSE:
+                break
+            conn.send(None)
+    finally:
+        # the arrays have to be dropped before the blocks can be closed
+        del obs, terminal, rewards, dones, actions, arrays
+        for block in blocks:
+            block.close()
+        conn.close()
+
+
+
+
+
+class RolloutPool():
+    """
+    Runs VecSpaceshipEnv shards in num_workers processes, to use every core
+    of a machine. Observations, rewards, done flags and actions live in
+    multiprocessing shared memory, so stepping only sends a short command to
+    every worker instead of pickling arrays back and forth.
+
+    The arrays returned by step() and reset() are views of the shared
+    buffers, they are overwritten by the next call (copy them to keep them).
+    """
+    def __init__(self, num_workers, envs_per_worker=64, num_spaceships=2,
+        seed=0, start_method=None, **env_kwargs):
+        """
+        args
+            num_workers     (int)       number of worker processes
+            envs_per_worker (int)       environments simulated per worker
+            num_spaceships  (int)       spaceships per environment
+            seed            (int)       base seed, worker i uses seed + i
+            start_method    (str)       multiprocessing start method, the
+                                            platform default if None
+            **env_kwargs                passed on to VecSpaceshipEnv
+        """
+        self.num_workers = num_workers
+        self.num_envs = num_workers * envs_per_worker
+        self.num_spaceships = num_spaceships
+        env_kwargs["num_spaceships"] = num_spaceships
+
+        layout = _buffer_layout(self.num_envs, num_spaceships)
+        self._blocks = []
+        self._arrays = {}
+        names = {}
+        for key, (shape, dtype) in layout.items():
+            size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            block = shared_memory.SharedMemory(create=True, size=size)
+            self._blocks.append(block)
+            names[key] = block.name
+            self._arrays[key] = np.ndarray(shape, dtype=dtype,
+                                            buffer=block.buf)
+            self._arrays[key][...] = 0
+
+        ctx = mp.get_context(start_method)
+        self._conns = []
+        self._processes = []
+        for i in range(num_workers):
+            parent, child = ctx.Pipe()
+            process = ctx.Process(target=_worker, daemon=True,
+                args=(child, names, layout, i * envs_per_worker,
+                        (i + 1) * envs_per_worker, env_kwargs, seed + i))
+            process.start()
+            child.close()
+            self._conns.append(parent)
+            self._processes.append(process)
+        self.closed = False
+
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+
+    def _broadcast(self, command):
+        """
+        Send a command to all workers and wait until all of them are done
+        """
+        for conn in self._conns:
+            conn.send(command)
+        for conn in self._conns:
+            conn.recv()
+
+
+
+    def reset(self):
+        """
+        Reset all environments
+        returns
+            observations    (ndarray)   (N, S, OBS_SIZE) shared buffer
+        """
+        self._broadcast(_RESET)
+        return self._arrays["observations"]
+
+
+
+    def step_async(self, actions):
+        """
+        Hand out actions and let the workers start stepping, without waiting
+        args
+            actions         (ndarray)   (N, S) integer action per spaceship
+        """
+        self._arrays["actions"][...] = actions
+        for conn in self._conns:
+            conn.send(_STEP)
+
+
+
+    def step_wait(self):
+        """
+        Wait for the workers started by step_async
+        returns
+            observations, rewards, dones, infos as VecSpaceshipEnv.step,
+            infos["terminal_observation"] holds the last observations of all
+            environments, only valid where dones is set
+        """
+        for conn in self._conns:
+            conn.recv()
+        return (self._arrays["observations"], self._arrays["rewards"],
+                self._arrays["dones"],
+                {"terminal_observation":
+                    self._arrays["terminal_observations"]})
+
+
+
+    def step(self, actions):
+        """
+        Advance all environments of all workers by one step
+        args
+            actions         (ndarray)   (N, S) integer action per spaceship
+        returns
+            see step_wait
+        """
+        self.step_async(actions)
+        return self.step_wait()
+
+
+
+    def close(self):
+        """
+        Stop all workers and free the shared memory
+        """
+        if self.closed:
+            return
+        self.closed = True
+        for conn in self._conns:
+            try:
+                conn.send(_CLOSE)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for conn in self._conns:
+            conn.close()
+        self._arrays = {}
+        for block in self._blocks:
+            block.close()
+            block.unlink()
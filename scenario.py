@@ -0,0 +1,178 @@
+__author__ = "Devrim Celik"
+
+import json
+import os
+import numpy as np
+from world import World
+
+# keys of the world table that are passed on to World
+WORLD_KEYS = ("width", "height", "wall_thickness", "grav_const", "softening",
+                "gravity_mode", "theta", "dt", "integrator", "max_substeps",
+                "courant", "missile_capacity", "seed", "restitution",
+                "contact_iterations", "field_cell", "field_cache")
+# keys of a planet, a spaceship and a spawn rule
+PLANET_KEYS = ("x", "y", "mass")
+SHIP_KEYS = ("x", "y", "direction", "mass", "damping", "max_speed",
+                "enable_audio")
+SPAWN_KEYS = ("kind", "every", "start", "max", "region", "mass")
+SPAWN_KINDS = ("spaceship", "planet")
+
+
+class Scenario():
+    """
+    Declarative description of a world: its size and walls (and any other
+    World argument), the planets and spaceships it starts with and rules
+    spawning further ones while it runs. Scenarios are written in JSON or
+    TOML, e.g.
+
+        [world]
+        width = 1080
+        height = 720
+        gravity_mode = "field"
+
+        [[planets]]
+        x = 540
+        y = 360
+        mass = 60
+
+        [[spaceships]]
+        x = 200
+        y = 200
+
+        [[spawn]]
+        kind = "planet"
+        every = 300         # steps in between two spawns
+        start = 300         # first step a spawn happens
+        max = 5             # no spawn while there are this many
+        region = [100, 100, 980, 620]
+
+    A spawn rule places the new entity uniformly inside its region (default:
+    inside the walls), using the random generator of the world, so runs are
+    reproducible with a seed.
+    """
+    def __init__(self, description):
+        """
+        args
+            description (dict)      parsed scenario, with the optional
+                                        tables world, planets, spaceships and
+                                        spawn
+        """
+        unknown = set(description) - {"world", "planets", "spaceships",
+                                        "spawn"}
+        if unknown:
+            raise ValueError("unknown scenario tables {}".format(
+                sorted(unknown)))
+        self.world = dict(description.get("world", {}))
+        self.planets = [dict(p) for p in description.get("planets", [])]
+        self.spaceships = [dict(s) for s in description.get("spaceships",
+                                                            [])]
+        self.spawn_rules = [dict(r) for r in description.get("spawn", [])]
+
+        _check_keys(self.world, WORLD_KEYS, "world")
+        for planet in self.planets:
+            _check_keys(planet, PLANET_KEYS, "planet", ("x", "y"))
+        for ship in self.spaceships:
+            _check_keys(ship, SHIP_KEYS, "spaceship", ("x", "y"))
+        for rule in self.spawn_rules:
+            _check_keys(rule, SPAWN_KEYS, "spawn rule", ("kind", "every"))
+            if rule["kind"] not in SPAWN_KINDS:
+                raise ValueError("unknown kind to spawn {}".format(
+                    rule["kind"]))
+            if rule["every"] < 1:
+                raise ValueError("spawn interval has to be at least 1")
+            if "region" in rule and len(rule["region"]) != 4:
+                raise ValueError("a spawn region is [x0, y0, x1, y1]")
+
+
+
+    def build(self, **kwargs):
+        """
+        Create the world of the scenario with its planets and spaceships
+        args
+            kwargs                  further World arguments, override the
+                                        world table
+        returns
+            world       (World)
+        """
+        world = World(**dict(self.world, **kwargs))
+        # all planets first, so a baked field is built once for all of them
+        for planet in self.planets:
+            world.add_planet(**planet)
+        for ship in self.spaceships:
+            world.add_spaceship(**ship)
+        return world
+
+
+
+    def spawn(self, world):
+        """
+        Apply the spawn rules for the current step of the world, call after
+        every step
+        args
+            world       (World)     world built from this scenario
+        """
+        step = world.frame_count
+        for rule in self.spawn_rules:
+            start = rule.get("start", 0)
+            if step < start or (step - start) % rule["every"]:
+                continue
+            store = world.ship_state if rule["kind"] == "spaceship" else \
+                world.planet_state
+            if "max" in rule and store.count >= rule["max"]:
+                continue
+            wall = world.wall_thickness
+            x0, y0, x1, y1 = rule.get("region", (wall, wall,
+                                                    world.width - wall,
+                                                    world.height - wall))
+            x, y = world.rng.uniform((x0, y0), (x1, y1))
+            if rule["kind"] == "spaceship":
+                world.add_spaceship(x, y, direction=world.rng.uniform(
+                                    0, 2 * np.pi), mass=rule.get("mass"))
+            else:
+                world.add_planet(x, y, mass=rule.get("mass"))
+
+
+
+    def step(self, world, n=1):
+        """
+        Advance the world by n steps, applying the spawn rules after each
+        """
+        for _ in range(n):
+            world.step()
+            self.spawn(world)
+
+
+
+
+
+def _check_keys(table, allowed, name, required=()):
+    unknown = set(table) - set(allowed)
+    if unknown:
+        raise ValueError("unknown {} keys {}".format(name, sorted(unknown)))
+    missing = set(required) - set(table)
+    if missing:
+        raise ValueError("{} is missing {}".format(name, sorted(missing)))
+
+
+
+def load_scenario(path):
+    """
+    Read a scenario from a .json or .toml file
+    args
+        path        (str)       scenario file
+    returns
+        scenario    (Scenario)
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json":
+        with open(path) as f:
+            return Scenario(json.load(f))
+    if extension == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            raise ImportError("reading TOML scenarios needs Python 3.11 "
+                                "(tomllib), use JSON instead")
+        with open(path, "rb") as f:
+            return Scenario(tomllib.load(f))
+    raise ValueError("unknown scenario format {}".format(extension))
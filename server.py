@@ -0,0 +1,655 @@
+__author__ = "Devrim Celik"
+
+import argparse
+import asyncio
+import collections
+import struct
+import sys
+import time
+import numpy as np
+from delta import DeltaEncoder, DeltaDecoder
+from events import INPUT_KEYS
+from snapshot import take_snapshot, restore_snapshot
+
+# every message is a length prefixed frame: number of bytes of the payload,
+# followed by the payload, whose first byte is the type of the message
+_LENGTH = struct.Struct("<I")
+# client -> server
+#   JOIN        id of the spaceship to control, -1 for any free one
+#   ACTION      tick the action is meant for, INPUT_KEYS bit mask, client
+#                   time (time.monotonic) it was sent at
+_JOIN = b"J"
+_JOIN_BODY = struct.Struct("<q")
+_ACTION = b"A"
+_ACTION_BODY = struct.Struct("<qBd")
+# server -> client
+#   WELCOME     id of the controlled spaceship (-1 if none was free), current
+#                   tick; followed by the last keyframe STATE and the last
+#                   STATE
+#   STATE       tick, followed by a frame of a DeltaEncoder
+_WELCOME = b"W"
+_WELCOME_BODY = struct.Struct("<qq")
+_STATE = b"S"
+_STATE_HEADER = struct.Struct("<q")
+
+# input log: magic, format version, number of ticks (written on close),
+# length of the initial world snapshot; followed by the snapshot and the
+# input records
+_LOG_MAGIC = b"SSIN"
+_LOG_VERSION = 1
+_LOG_HEADER = struct.Struct("<4sIqq")
+INPUT_RECORD = np.dtype([("tick", "<i8"), ("id", "<i8"), ("mask", "u1")])
+
+
+def action_mask(*keys):
+    """
+    Bit mask of pressed keys
+    args
+        keys        (str)       names out of INPUT_KEYS
+    returns
+        mask        (int)
+    """
+    mask = 0
+    for key in keys:
+        mask |= 1 << INPUT_KEYS.index(key)
+    return mask
+
+
+
+def _frame(payload):
+    return _LENGTH.pack(len(payload)) + payload
+
+
+
+async def _read_frame(reader):
+    """
+    Read one message, None once the connection is closed
+    """
+    try:
+        length, = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+        return await reader.readexactly(length)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+
+
+class InputLog():
+    """
+    Append-only file of all inputs of a match, together with the world state
+    it started from, so the match can be replayed bit-exactly with
+    replay_inputs. The log is written in chunks; a log that was cut off
+    loses at most its last chunk.
+    """
+    def __init__(self, path, world, chunk=4096):
+        """
+        args
+            path        (str)       file to write, is overwritten
+            world       (World)     world at the start of the match
+            chunk       (int)       records collected before writing
+        """
+        self.chunk = chunk
+        self.n_ticks = 0
+        snapshot = take_snapshot(world)
+        self._n_snapshot = len(snapshot)
+        self._file = open(path, "wb")
+        self._file.write(_LOG_HEADER.pack(_LOG_MAGIC, _LOG_VERSION, -1,
+                                            len(snapshot)))
+        self._file.write(snapshot)
+        self._records = []
+
+
+
+    def record(self, tick, eids, masks):
+        """
+        Append the inputs applied before the given tick
+        """
+        if len(eids):
+            rec = np.empty(len(eids), dtype=INPUT_RECORD)
+            rec["tick"] = tick
+            rec["id"] = eids
+            rec["mask"] = masks
+            self._records.append(rec)
+        self.n_ticks = tick + 1
+        if sum(map(len, self._records)) >= self.chunk:
+            self.flush()
+
+
+
+    def flush(self):
+        if self._records:
+            self._file.write(np.concatenate(self._records).tobytes())
+            self._records = []
+        self._file.flush()
+
+
+
+    def close(self):
+        """
+        Write the remaining records and the number of ticks
+        """
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.seek(0)
+        self._file.write(_LOG_HEADER.pack(_LOG_MAGIC, _LOG_VERSION,
+                                            self.n_ticks, self._n_snapshot))
+        self._file.close()
+
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+
+
+
+def read_input_log(path):
+    """
+    Read an InputLog file
+    returns
+        snapshot    (bytes)     world state the match started from
+        records     (ndarray)   INPUT_RECORD array in order of the ticks
+        n_ticks     (int)       number of ticks of the match
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, n_ticks, n_snapshot = _LOG_HEADER.unpack_from(data)
+    if magic != _LOG_MAGIC or version != _LOG_VERSION:
+        raise ValueError("not an input log (version {})".format(_LOG_VERSION))
+    offset = _LOG_HEADER.size + n_snapshot
+    n_records = (len(data) - offset) // INPUT_RECORD.itemsize
+    records = np.frombuffer(data, INPUT_RECORD, n_records, offset)
+    if n_ticks < 0:
+        # not closed, replay up to the last logged input
+        n_ticks = int(records["tick"][-1]) + 1 if n_records else 0
+    return data[_LOG_HEADER.size:offset], records, n_ticks
+
+
+
+def replay_inputs(path, world, scenario=None):
+    """
+    Replay a match: restore the world it started from and apply the logged
+    inputs on the same ticks. The world has to be configured like the one of
+    the match (e.g. built from the same scenario).
+    args
+        path        (str)       InputLog file
+        world       (World)     world to replay in, is overwritten
+        scenario    (Scenario)  its spawn rules are applied after every tick
+    yields
+        tick        (int)       after every tick
+    """
+    snapshot, records, n_ticks = read_input_log(path)
+    restore_snapshot(world, snapshot)
+    bounds = np.searchsorted(records["tick"], np.arange(n_ticks + 1))
+    for tick in range(n_ticks):
+        rec = records[bounds[tick]:bounds[tick + 1]]
+        world.apply_actions(rec["id"], rec["mask"])
+        world.step()
+        if scenario is not None:
+            scenario.spawn(world)
+        yield tick
+
+
+
+
+
+class TickStats():
+    """
+    Timings of the last ticks of a server: how long stepping the world and
+    broadcasting the state took, how long after the client sent them inputs
+    were applied and how many bytes were sent
+    """
+    def __init__(self, window=1000):
+        self.window = window
+        self.step = collections.deque(maxlen=window)
+        self.broadcast = collections.deque(maxlen=window)
+        self.latency = collections.deque(maxlen=window)
+        self.bytes = collections.deque(maxlen=window)
+        self.ticks = 0
+        self._start = time.perf_counter()
+
+
+
+    def report(self):
+        """
+        returns
+            report      (dict)      ticks per second, mean and 99th
+                                        percentile of the step, broadcast
+                                        and input latency in milliseconds and
+                                        the mean bytes broadcast per tick
+        """
+        report = {"ticks": self.ticks, "ticks_per_s": self.ticks /
+                    max(time.perf_counter() - self._start, 1e-9)}
+        for name in ("step", "broadcast", "latency"):
+            values = np.array(getattr(self, name)) * 1000
+            report[name + "_ms"] = float(values.mean()) if len(values) \
+                else 0.0
+            report[name + "_p99_ms"] = float(np.percentile(values, 99)) \
+                if len(values) else 0.0
+        report["bytes_per_tick"] = float(np.mean(self.bytes)) \
+            if self.bytes else 0.0
+        return report
+
+
+
+
+
+class LockstepServer():
+    """
+    Authoritative, headless match server. Clients (on a Unix socket or on
+    loopback) each take control of one spaceship of the world and send
+    actions for ticks; the server advances the world tick by tick and
+    applies all actions of a tick at its boundary, in order of the spaceship
+    ids, so the result does not depend on when or in which order they
+    arrived. After every tick the changes of the state are broadcast to all
+    clients.
+
+    With lockstep the server waits for the action of every client before it
+    advances a tick (at most tick_timeout seconds), otherwise it ticks at the
+    fixed tick_rate and actions arriving late are applied on the next tick.
+    All applied inputs can be written into an InputLog.
+
+    The state is broadcast as DeltaEncoder frames, so a client joining late
+    gets the last keyframe and the last frame.
+    """
+    def __init__(self, world, tick_rate=30, lockstep=True, tick_timeout=1.0,
+        input_log=None, scenario=None, max_ticks=None, keyframe_interval=60):
+        """
+        args
+            world           (World)     world of the match
+            tick_rate       (float)     ticks per second, None ticks as fast
+                                            as the clients send (lockstep)
+            lockstep        (bool)      wait for the action of every client
+            tick_timeout    (float)     longest wait for actions in lockstep
+            input_log       (str)       file the inputs are logged into
+            scenario        (Scenario)  its spawn rules are applied after
+                                            every tick
+            max_ticks       (int)       stop after this many ticks
+            keyframe_interval (int)     ticks in between two keyframes of
+                                            the broadcast state
+        """
+        if tick_rate is None and not lockstep:
+            raise ValueError("without lockstep a tick rate is needed")
+        self.world = world
+        self.tick_rate = tick_rate
+        self.lockstep = lockstep
+        self.tick_timeout = tick_timeout
+        self.scenario = scenario
+        self.max_ticks = max_ticks
+        self.tick = 0
+        self.stats = TickStats()
+        self.log = InputLog(input_log, world) if input_log else None
+
+        # writer -> controlled spaceship id
+        self._clients = {}
+        # tick -> list of (spaceship id, mask, time the client sent it)
+        self._pending = collections.defaultdict(list)
+        # clients whose action for the current tick arrived
+        self._ready = set()
+        self._arrived = asyncio.Event()
+        self._encoder = DeltaEncoder(keyframe_interval)
+        # last broadcast STATE and last keyframe STATE
+        self._state = None
+        self._keyframe = None
+        self._server = None
+        self._stopped = False
+        # set once the server listens (see self.address)
+        self.ready = asyncio.Event()
+
+
+
+    def _free_ship(self, wanted):
+        ships = self.world.ship_state
+        taken = set(self._clients.values())
+        free = [eid for eid in ships.ids[ships.alive].tolist()
+                if eid not in taken]
+        if wanted >= 0:
+            return wanted if wanted in free else -1
+        return free[0] if free else -1
+
+
+
+    async def _handle(self, reader, writer):
+        """
+        Serve one client until it disconnects
+        """
+        eid = -1
+        try:
+            while True:
+                message = await _read_frame(reader)
+                if message is None:
+                    break
+                kind = message[:1]
+                if kind == _JOIN and writer not in self._clients:
+                    wanted, = _JOIN_BODY.unpack_from(message, 1)
+                    eid = self._free_ship(wanted)
+                    if eid >= 0:
+                        self._clients[writer] = eid
+                    if self._state is None:
+                        self._state = self._encode()
+                    writer.write(_frame(_WELCOME + _WELCOME_BODY.pack(
+                        eid, self.tick)))
+                    if self._keyframe is not self._state:
+                        writer.write(_frame(self._keyframe))
+                    writer.write(_frame(self._state))
+                    await writer.drain()
+                elif kind == _ACTION and writer in self._clients:
+                    tick, mask, sent = _ACTION_BODY.unpack_from(message, 1)
+                    # actions for past ticks are applied on the next one
+                    tick = max(tick, self.tick)
+                    self._pending[tick].append((eid, mask, sent))
+                    if tick == self.tick:
+                        self._ready.add(writer)
+                        self._arrived.set()
+        finally:
+            self._clients.pop(writer, None)
+            self._ready.discard(writer)
+            self._arrived.set()
+            writer.close()
+
+
+
+    async def _wait_for_actions(self):
+        deadline = time.perf_counter() + self.tick_timeout
+        while self._clients and not self._ready >= set(self._clients):
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+
+
+
+    def _advance(self):
+        """
+        Apply the actions of the current tick and step the world
+        """
+        start = time.perf_counter()
+        actions = self._pending.pop(self.tick, [])
+        actions.sort(key=lambda action: action[0])
+        eids = np.array([a[0] for a in actions], dtype=np.int64)
+        masks = np.array([a[1] for a in actions], dtype=np.int64)
+        # clients run on this host, so their send times are on the same
+        # monotonic clock
+        now = time.monotonic()
+        self.stats.latency.extend(now - a[2] for a in actions)
+        if self.log is not None:
+            self.log.record(self.tick, eids, masks)
+        self.world.apply_actions(eids, masks)
+        self.world.step()
+        if self.scenario is not None:
+            self.scenario.spawn(self.world)
+        self.tick += 1
+        self._ready = set(writer for writer, eid in self._clients.items()
+                            if any(a[0] == eid for a in
+                                    self._pending.get(self.tick, ())))
+        self.stats.step.append(time.perf_counter() - start)
+
+
+
+    def _encode(self):
+        """
+        STATE of the current tick
+        """
+        frame = self._encoder.encode(self.world)
+        state = _STATE + _STATE_HEADER.pack(self.tick) + frame
+        if frame is self._encoder.keyframe:
+            self._keyframe = state
+        return state
+
+
+
+    def _broadcast(self):
+        start = time.perf_counter()
+        self._state = self._encode()
+        message = _frame(self._state)
+        for writer in list(self._clients):
+            writer.write(message)
+        self.stats.bytes.append(len(message) * len(self._clients))
+        self.stats.broadcast.append(time.perf_counter() - start)
+
+
+
+    async def run(self, path=None, host="127.0.0.1", port=0, clients=0):
+        """
+        Serve the match until max_ticks or stop()
+        args
+            path        (str)       Unix socket to listen on, if None
+                                        loopback is used
+            host        (str)       address to listen on
+            port        (int)       port to listen on, 0 picks a free one
+                                        (see self.address)
+            clients     (int)       clients to wait for before the first
+                                        tick
+        """
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._handle,
+                                                            path)
+        else:
+            self._server = await asyncio.start_server(self._handle, host,
+                                                        port)
+        self.address = path if path is not None else \
+            self._server.sockets[0].getsockname()[:2]
+        self.ready.set()
+        try:
+            while len(self._clients) < clients and not self._stopped:
+                await asyncio.sleep(0.001)
+            interval = 1 / self.tick_rate if self.tick_rate else 0
+            next_tick = time.perf_counter()
+            while not self._stopped and (self.max_ticks is None or
+                                            self.tick < self.max_ticks):
+                if self.lockstep:
+                    await self._wait_for_actions()
+                if interval:
+                    next_tick += interval
+                    await asyncio.sleep(max(next_tick - time.perf_counter(),
+                                            0))
+                self._advance()
+                self._broadcast()
+                self.stats.ticks += 1
+                # let the connections send and receive
+                await asyncio.sleep(0)
+        finally:
+            self._server.close()
+            for writer in list(self._clients):
+                writer.close()
+            await self._server.wait_closed()
+            if self.log is not None:
+                self.log.close()
+
+
+
+    def stop(self):
+        self._stopped = True
+        self._arrived.set()
+
+
+
+
+
+class LockstepClient():
+    """
+    Connection of one player (human or bot) to a LockstepServer
+    """
+    def __init__(self):
+        self.eid = -1
+        self.tick = 0
+        # last state, see DeltaDecoder.decode
+        self.state = None
+        self._decoder = DeltaDecoder()
+        self._reader = None
+        self._writer = None
+
+
+
+    async def connect(self, path=None, host="127.0.0.1", port=None,
+        eid=-1):
+        """
+        Connect and take control of a spaceship
+        args
+            path        (str)       Unix socket of the server
+            host, port              loopback address, if path is None
+            eid         (int)       spaceship to control, -1 for any
+        returns
+            eid         (int)       controlled spaceship, -1 if none was
+                                        free (the client only observes)
+        """
+        if path is not None:
+            self._reader, self._writer = await asyncio.open_unix_connection(
+                path)
+        else:
+            self._reader, self._writer = await asyncio.open_connection(host,
+                                                                        port)
+        self._writer.write(_frame(_JOIN + _JOIN_BODY.pack(eid)))
+        await self._writer.drain()
+        message = await _read_frame(self._reader)
+        self.eid, welcome_tick = _WELCOME_BODY.unpack_from(message, 1)
+        # the last keyframe, if the last state is not one itself
+        while await self.receive() is not None and \
+            self.tick < welcome_tick:
+            pass
+        return self.eid
+
+
+
+    async def act(self, mask, tick=None):
+        """
+        Send the action for a tick (the current one by default)
+        """
+        tick = self.tick if tick is None else tick
+        self._writer.write(_frame(_ACTION + _ACTION_BODY.pack(
+            tick, mask, time.monotonic())))
+        await self._writer.drain()
+
+
+
+    async def receive(self):
+        """
+        Wait for the next state
+        returns
+            state       (dict)      see DeltaDecoder.decode, None once the
+                                        server is gone
+        """
+        message = await _read_frame(self._reader)
+        if message is None:
+            return None
+        self.tick, = _STATE_HEADER.unpack_from(message, 1)
+        self.state = self._decoder.decode(message[1 + _STATE_HEADER.size:])
+        return self.state
+
+
+
+    async def close(self):
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+
+
+
+async def run_bot(policy, path=None, host="127.0.0.1", port=None):
+    """
+    Play a match with a policy until the server closes it
+    args
+        policy      (function)  maps (client, state) onto an action mask
+        path, host, port        address of the server, see
+                                    LockstepClient.connect
+    """
+    client = LockstepClient()
+    await client.connect(path, host, port)
+    state = client.state
+    try:
+        while state is not None:
+            if client.eid >= 0:
+                await client.act(policy(client, state))
+            state = await client.receive()
+    finally:
+        await client.close()
+
+
+
+def random_policy(rng):
+    """
+    Policy pressing random keys, for bot matches
+    """
+    return lambda client, state: int(rng.integers(1 << len(INPUT_KEYS)))
+
+
+
+async def bot_match(world, n_bots, ticks, path=None, input_log=None,
+    tick_rate=None, seed=None, scenario=None):
+    """
+    Run one match of random bots against each other on this host
+    returns
+        report      (dict)      see TickStats.report
+    """
+    server = LockstepServer(world, tick_rate, lockstep=True,
+                            input_log=input_log, scenario=scenario,
+                            max_ticks=ticks)
+    serving = asyncio.ensure_future(server.run(path, clients=n_bots))
+    ready = asyncio.ensure_future(server.ready.wait())
+    await asyncio.wait((serving, ready), return_when=asyncio.FIRST_COMPLETED)
+    if not ready.done():
+        # the server stopped before it listened, raise what went wrong
+        ready.cancel()
+        serving.result()
+        raise RuntimeError("server stopped before it listened")
+    host, port = (None, None) if path is not None else server.address
+    rngs = np.random.default_rng(seed).spawn(n_bots)
+    bots = [asyncio.ensure_future(run_bot(random_policy(rng), path, host,
+                                            port)) for rng in rngs]
+    await serving
+    await asyncio.gather(*bots, return_exceptions=True)
+    return server.stats.report()
+
+
+
+def main(argv=None):
+    from world import World
+    from scenario import load_scenario
+
+    parser = argparse.ArgumentParser(
+        description="Run a match of random bots on a lockstep server")
+    parser.add_argument("--scenario", help="scenario to build the world from")
+    parser.add_argument("--bots", type=int, default=2)
+    parser.add_argument("--ticks", type=int, default=1000)
+    parser.add_argument("--tick-rate", type=float,
+                        help="ticks per second, as fast as possible if unset")
+    parser.add_argument("--socket", help="Unix socket instead of loopback")
+    parser.add_argument("--log", help="write the inputs into this file")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    scenario = None
+    if args.scenario:
+        scenario = load_scenario(args.scenario)
+        world = scenario.build(seed=args.seed)
+    else:
+        world = World(seed=args.seed)
+    rng = np.random.default_rng(args.seed)
+    while world.ship_state.count < args.bots:
+        wall = world.wall_thickness
+        world.add_spaceship(*rng.uniform((wall + 30, wall + 30),
+                                            (world.width - wall - 30,
+                                            world.height - wall - 30)))
+    report = asyncio.run(bot_match(world, args.bots, args.ticks, args.socket,
+                                    args.log, args.tick_rate, args.seed,
+                                    scenario))
+    for key, value in report.items():
+        print("{:>20} {:.3f}".format(key, value))
+    return 0
+
+
+
+if __name__ == "__main__":
+    sys.exit(main())
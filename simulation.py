@@ -1,170 +1,262 @@
 __author__ = "Devrim Celik"
 
 import datetime
+import time
 from p5 import *
-from classes import Spaceship, Planet
-from __global_var__ import *
+from world import World
+from render import draw_borders, draw_world, draw_profile, BatchRenderer
+from recorder import TrajectoryRecorder, TrajectoryReader
+from events import EVENT_INPUT, INPUT_KEYS
+from scenario import load_scenario
 import logging
 
 
-def setup():
+class Sketch():
     """
-    Setup for sketch
+    Interactive p5 window showing one world. Everything the sketch needs is
+    held by the instance and handed to p5 as bound methods, so the world
+    itself stays an ordinary object that can be created, stepped and tested
+    without a window.
     """
-    logging.info("[*] Simulation started")
-
-    global _width, _height
-    # size of window
-    size(_width, _height)
-    title("SPACE SIMULATOR")
-
-
-
-def draw_borders():
-    """
-    Draw the screen borders
-    args
-        WALL_THICKNESS      (int)   Width of borders in pixel
-    """
-    global _wall_thickness
-
-    # color of the border
-    stroke(0)
-    # color of the field
-    fill(255)
-    for i in range(_wall_thickness):
-        rect((i,i), (width-i, height-i), mode="CORNERS")
-        # TODO why are there white points that I have to fill like this
-        point(i,i)
-        point(width-i, height-i)
-
-
-
-def remove_objects(spaceships=[], missiles=[]):
-    """
-    Given lists of all objects, will remove some (depending on the context):
-        * spaceship will be removed, if they get hits by a missile
-        * missile will be removed, if it hits a spacheship
-        * missile will be removed, if it leaves the screen
-    args
-        spaceships      (list)      list of all spaceship objects
-        missiles        (list)      list of all missile objects
-    """
-
-    # NOTE: after deleting the object from the list (only reference in the
-    # script) python garbage collector will take care of the rest
-
-    # list to save the coordinates of every missile
-    # note: it will reset every time
-    missile_positions = []
-
-    for indx_m, m in enumerate(missiles):
-        # append position to list
-        missile_positions.append((m.position.x, m.position.y))
-        # check if missile is stick on the screen
-        if not m.on_screen():
-            del missiles[indx_m]
-
-    for indx_s, s in enumerate(spaceships):
-        # check if spaceship got hit by any of the missiles
-        indx_m = s.is_hit(missile_positions)
-        # if it did, s.is_hit() will return a int
-        if indx_m is not None:
-            del spaceships[indx_s]
-            del missiles[indx_m]
-
-def draw():
-    """
-    Calculation steps and draw on sketch
-    """
-    global _spaceships, _missiles, _planets, _wall_thickness, _grav_const
-
-    # draw borders
-    draw_borders()
-    # remove objects
-    remove_objects(_spaceships, _missiles)
-
-    for p in _planets:
-        p.display()
-
-    for m in _missiles:
-        m.update(_planets, _grav_const)
-        m.display()
+    def __init__(self, world, frame_rate=30, human_enabled=True,
+        show_frame_rate=True, recorder=None, replay=None, batched=True,
+        scenario=None):
+        """
+        args
+            world           (World)     world to show
+            frame_rate      (int)       frames per second
+            human_enabled   (bool)      the first spaceship is controlled
+                                            with the arrow keys and space
+            show_frame_rate (bool)      overlay the frame rate and the time
+                                            of every stage
+            recorder        (TrajectoryRecorder)    records every step
+            replay          (generator)     TrajectoryReader.replay of the
+                                            world, shows a recording instead
+                                            of simulating
+            batched         (bool)      draw with the BatchRenderer
+            scenario        (Scenario)  its spawn rules are applied after
+                                            every step
+        """
+        self.world = world
+        self.frame_rate = frame_rate
+        self.human_enabled = human_enabled
+        self.show_frame_rate = show_frame_rate
+        self.recorder = recorder
+        self.replay = replay
+        self.scenario = scenario
+        self.renderer = BatchRenderer() if batched else None
+        # wall clock time of the last frame and physics time not simulated
+        # yet, in steps
+        self._last_frame = None
+        self._accumulator = 0
+
+
+
+    def setup(self):
+        """
+        Setup for sketch
+        """
+        logging.info("[*] Simulation started")
+        # size of window
+        size(self.world.width, self.world.height)
+        title("SPACE SIMULATOR")
+
+
+
+    def _draw_world(self, alpha=1.0):
+        """
+        Draw the world, batched if a renderer is set
+        """
+        if self.renderer is not None:
+            # the batched renderer draws the borders as well
+            self.renderer.draw(self.world, alpha)
+        else:
+            draw_world(self.world, alpha)
+
+
+
+    def draw(self):
+        """
+        Calculation steps and draw on sketch
+        """
+        world = self.world
+        profiler = world.profiler
+
+        # draw borders
+        if self.renderer is None:
+            with profiler.stage("borders"):
+                draw_borders(world.wall_thickness)
+
+        if self.replay is not None:
+            # show the next recorded frame, nothing is simulated
+            next(self.replay, None)
+            self._draw_world()
+            return
 
-    for indx_s, s in enumerate(_spaceships):
-        s.update(_planets, _grav_const)
+        # advance the physics by fixed steps of world.dt, where a time of 1
+        # is one frame at the requested frame rate, independent of the real
+        # rate
+        now = time.perf_counter()
+        if self._last_frame is not None:
+            self._accumulator += (now - self._last_frame) * self.frame_rate
+        else:
+            self._accumulator = world.dt
+        self._last_frame = now
+        # do not try to catch up forever if the physics is slower than
+        # realtime
+        self._accumulator = min(self._accumulator, 5 * max(world.dt, 1))
+        while self._accumulator >= world.dt:
+            world.step()
+            if self.scenario is not None:
+                self.scenario.spawn(world)
+            if self.recorder is not None:
+                self.recorder.record()
+            self._accumulator -= world.dt
+
+        # draw in between the last two physics states
+        with profiler.stage("display"):
+            self._draw_world(self._accumulator / world.dt)
+        profiler.end_frame()
+        if self.show_frame_rate:
+            draw_profile(profiler)
+
+
+
+    def key_pressed(self, event):
+        world = self.world
+        if self.human_enabled and world.ship_state.count:
+            player = world.spaceships[0]
+            key = str(event.key)
+            world.event_bus.emit(EVENT_INPUT, world.frame_count, player.eid,
+                                    INPUT_KEYS.index(key)
+                                    if key in INPUT_KEYS else -1)
+            if event.key == "UP":
+                player.boost()
+            elif event.key == "LEFT":
+                player.turn(-0.4)
+            elif event.key == "RIGHT":
+                player.turn(+0.4)
+            elif event.key == "DOWN":
+                player.breaks()
+            elif event.key == "SPACE":
+                world.shoot(player)
+
+
+
+    def mouse_pressed(self, event):
+        """
+        When mouse is pressed, create a planet # TODO
+        """
+        for p in self.world.planets:
+            if p.is_inside(event.x, event.y):
+                p.make_bigger()
+                return
+        self.world.add_planet(event.x, event.y)
+
+
+
+    def run(self):
+        """
+        Open the window and block until it is closed
+        """
+        global _sketch
+        _sketch = self
+        try:
+            run(sketch_setup=self.setup, sketch_draw=self.draw,
+                frame_rate=self.frame_rate)
+        finally:
+            _sketch = None
+
+
+
+
+
+# p5 shows one window per process and looks up its input handlers by name
+# in the main module, they forward to the sketch that is running
+_sketch = None
 
-        # go through all other spaceships to check if you bounce,
-        # exclude yourself
-        for indx_s2, s2 in enumerate(_spaceships):
-            if indx_s != indx_s2:
-                s.touch_circle(s2)
-        # check if you touch a planet
-        for p in _planets:
-            # TODO should it bounce or die?
-            s.touch_circle(p)
 
-        s.display()
+def key_pressed(event):
+    if _sketch is not None:
+        _sketch.key_pressed(event)
 
 
 
-def key_pressed(event):
-    global _human_enabled, _spaceships, _missiles
-    if _human_enabled:
-        logging.info("[*] User Input: {}".format(event.key))
-        if event.key == "UP":
-            _spaceships[0].boost()
-        elif event.key == "LEFT":
-            _spaceships[0].turn(-0.4)
-        elif event.key == "RIGHT":
-            _spaceships[0].turn(+0.4)
-        elif event.key == "DOWN":
-            _spaceships[0].breaks()
-        elif event.key == "SPACE":
-            _missiles.append(_spaceships[0].shoot())
+def mouse_pressed(event):
+    if _sketch is not None:
+        _sketch.mouse_pressed(event)
 
 
 
-def mouse_pressed(event):
+def _setup_logging():
     """
-    When mouse is pressed, create a planet # TODO
+    Write the log into simulation.log, only if the level exceeds INFO (p5
+    logs a lot of unnecessary stuff on level DEBUG). Done when a simulation
+    starts instead of on import, so importing creates no files, and it does
+    nothing if logging was configured already
     """
-    global _planets
-    for p in _planets:
-        if p.is_inside(event.x, event.y):
-            p.make_bigger()
-            return
-    _planets.append(Planet(event.x, event.y))
+    logging.basicConfig(filename='simulation.log', level=logging.INFO)
 
 
 
 def spaceship_simulation(width=1080, height=720, frame_rate=30,
     wall_thickness=10, human_enabled=True, show_frame_rate = True,
-    grav_const=1):
-    # TODO show_frame rate how? (log/terminal/sketch)
+    grav_const=1, dt=1.0, integrator="euler", max_substeps=1,
+    record_path=None, profile_path=None, batched=True, scenario_path=None):
+    # show_frame_rate: overlay the frame rate and the time of every stage
+    # record_path: if given, every step is recorded into this file
+    # profile_path: if given, the stage timings are written into this json
+    # file at the end
+    # batched: draw all entities with a few shapes, see BatchRenderer
+    # scenario_path: if given, the world is built from this .json or .toml
+    # scenario (see scenario.py) instead of the arguments above
+    _setup_logging()
     logging.info("""
                 ==================================================
                 [*] Simulation started at {:%Y-%m-%d %H:%M:%S}
                 ==================================================
                 """.format(datetime.datetime.now()))
-    global _width, _height, _spaceships, _missiles, _planets, _frame_rate,    \
-        _show_frame_rate, _wall_thickness, _human_enabled, _grav_const
-    _width = width
-    _height = height
-    _frame_rate = frame_rate
-    _wall_thickness = wall_thickness
-    _show_frame_rate = show_frame_rate
-    _human_enabled = True
-    _grav_const = grav_const
-
-    # NOTE first element has the option to be human player if human_enabled
-    _spaceships = [Spaceship(_width/2+100,_height/2+100, _wall_thickness),
-                    Spaceship(_width/2,_height/2, _wall_thickness)]
-    _missiles = []
-    _planets = []
-
-
-    run(frame_rate=_frame_rate)
+    profile = show_frame_rate or profile_path is not None
+    scenario = None
+    if scenario_path is not None:
+        scenario = load_scenario(scenario_path)
+        world = scenario.build(audio=True, profile=profile, log_events=True)
+    else:
+        world = World(width, height, wall_thickness, grav_const, dt=dt,
+                        integrator=integrator, max_substeps=max_substeps,
+                        audio=True, profile=profile, log_events=True)
+        # NOTE first element has the option to be human player if
+        # human_enabled
+        world.add_spaceship(width/2+100, height/2+100)
+        world.add_spaceship(width/2, height/2)
+    recorder = None
+    if record_path is not None:
+        recorder = TrajectoryRecorder(record_path, world)
+
+    Sketch(world, frame_rate, human_enabled, show_frame_rate, recorder,
+            batched=batched, scenario=scenario).run()
+    if recorder is not None:
+        recorder.close()
+    if profile_path is not None:
+        world.profiler.dump(profile_path)
+    world.close()
+
+
+
+def replay_simulation(path, frame_rate=30, batched=True):
+    """
+    Show a recording made with spaceship_simulation(record_path=...)
+    args
+        path        (str)       recorded file
+        frame_rate  (int)       recorded frames shown per second
+        batched     (bool)      draw with the BatchRenderer
+    """
+    _setup_logging()
+    reader = TrajectoryReader(path)
+    world = World(reader.world["width"], reader.world["height"],
+                    reader.world["wall_thickness"])
+    Sketch(world, frame_rate, human_enabled=False, show_frame_rate=False,
+            replay=reader.replay(world), batched=batched).run()
 
 if __name__=="__main__":
     spaceship_simulation()
@@ -0,0 +1,135 @@
+__author__ = "Devrim Celik"
+
+import struct
+
+# header of a world snapshot: magic, format version, frame count and the
+# PCG64 state (128 bit state and increment, has_uint32, uinteger)
+_MAGIC = b"SSWS"
+_VERSION = 2
+_HEADER = struct.Struct("<4sIq16s16sII")
+
+
+def take_snapshot(world):
+    """
+    Copy the complete dynamic state of a world (all entity stores, the frame
+    count and the random generator) into one compact binary buffer. The
+    configuration of the world (size, gravity, integrator, ...) is not part
+    of it, a snapshot is restored into a world with the same configuration.
+    args
+        world       (World)     world to capture
+    returns
+        snapshot    (bytes)
+    """
+    rng = world.rng.bit_generator.state
+    header = _HEADER.pack(_MAGIC, _VERSION, world.frame_count,
+                            rng["state"]["state"].to_bytes(16, "little"),
+                            rng["state"]["inc"].to_bytes(16, "little"),
+                            rng["has_uint32"], rng["uinteger"])
+    parts = [header]
+    for store in (world.ship_state, world.missile_state, world.planet_state):
+        parts += store.snapshot_parts()
+    return b"".join(parts)
+
+
+
+def restore_snapshot(world, snapshot):
+    """
+    Overwrite the dynamic state of a world with a snapshot
+    args
+        world       (World)     world to change
+        snapshot    (bytes)     created by take_snapshot
+    """
+    magic, version, frame_count, state, inc, has_uint32, uinteger = \
+        _HEADER.unpack_from(snapshot, 0)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("not a world snapshot (version {})".format(_VERSION))
+    world.frame_count = frame_count
+    world.rng.bit_generator.state = {
+        "bit_generator": "PCG64",
+        "state": {"state": int.from_bytes(state, "little"),
+                    "inc": int.from_bytes(inc, "little")},
+        "has_uint32": has_uint32,
+        "uinteger": uinteger,
+    }
+    offset = _HEADER.size
+    for store in (world.ship_state, world.missile_state, world.planet_state):
+        offset = store.restore(snapshot, offset)
+
+
+
+
+
+class SnapshotRing():
+    """
+    Ring buffer of the most recent snapshots of a world, to rewind it. Once
+    it is full, every new snapshot replaces the oldest one.
+    """
+    def __init__(self, depth):
+        """
+        args
+            depth       (int)       number of snapshots to keep
+        """
+        self.depth = depth
+        self._snapshots = [None] * depth
+        # index the next snapshot is written to and number of snapshots
+        self._head = 0
+        self._size = 0
+
+
+
+    def __len__(self):
+        return self._size
+
+
+
+    def push(self, snapshot):
+        """
+        Add the newest snapshot
+        args
+            snapshot    (bytes)     created by take_snapshot
+        """
+        self._snapshots[self._head] = snapshot
+        self._head = (self._head + 1) % self.depth
+        self._size = min(self._size + 1, self.depth)
+
+
+
+    def get(self, back=1):
+        """
+        Look at a snapshot without removing it
+        args
+            back        (int)       1 is the newest snapshot, 2 the one
+                                        before it, ...
+        returns
+            snapshot    (bytes)
+        """
+        if not 1 <= back <= self._size:
+            raise IndexError("only {} snapshots kept".format(self._size))
+        return self._snapshots[(self._head - back) % self.depth]
+
+
+
+    def pop(self, back=1):
+        """
+        Remove and return a snapshot together with all newer ones
+        args
+            back        (int)       see get
+        returns
+            snapshot    (bytes)
+        """
+        snapshot = self.get(back)
+        for _ in range(back):
+            self._head = (self._head - 1) % self.depth
+            self._snapshots[self._head] = None
+        self._size -= back
+        return snapshot
+
+
+
+    def clear(self):
+        """
+        Forget all snapshots
+        """
+        self._snapshots = [None] * self.depth
+        self._head = 0
+        self._size = 0
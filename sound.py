@@ -0,0 +1,135 @@
+__author__ = "Devrim Celik"
+
+import logging
+import os
+import queue
+import threading
+import time
+
+# wave files of all sounds, relative to the sound directory
+SOUND_FILES = {
+    "laser": "laser.wav",
+    "explosion": "explosion.wav",
+}
+
+# clips loaded in this process, shared by all sound managers
+_clips = {}
+_clips_lock = threading.Lock()
+
+
+def load_clip(name, sound_dir):
+    """
+    Load a sound once per process, later calls return the cached clip
+    args
+        name        (str)       key of SOUND_FILES
+        sound_dir   (str)       directory holding the wave files
+    returns
+        simpleaudio.WaveObject
+    """
+    path = os.path.join(sound_dir, SOUND_FILES[name])
+    with _clips_lock:
+        clip = _clips.get(path)
+        if clip is None:
+            # only imported once a sound is actually played
+            import simpleaudio as sa
+            clip = sa.WaveObject.from_wave_file(path)
+            _clips[path] = clip
+    return clip
+
+
+
+
+
+class SoundManager():
+    """
+    Plays the sounds of a world without blocking the simulation. play() only
+    puts the name of the sound into a queue, a background thread loads the
+    clips on first use and plays them. Sounds are rate limited per clip and
+    the number of sounds playing at once is capped, everything beyond is
+    dropped.
+
+    A disabled manager does nothing at all and never imports simpleaudio,
+    so it works on machines without audio device.
+    """
+    def __init__(self, enabled=True, sound_dir="./sound", max_voices=8,
+        min_interval=0.05, queue_size=64):
+        """
+        args
+            enabled         (bool)      play sounds at all
+            sound_dir       (str)       directory holding the wave files
+            max_voices      (int)       maximal number of sounds at once
+            min_interval    (float)     minimal seconds in between two
+                                            plays of the same sound
+            queue_size      (int)       maximal number of waiting sounds
+        """
+        self.enabled = enabled
+        self.sound_dir = sound_dir
+        self.max_voices = max_voices
+        self.min_interval = min_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._voices = []
+        self._last_play = {}
+        # number of sounds that were not played, because of the limits
+        self.dropped = 0
+
+
+
+    def play(self, name):
+        """
+        Request a sound, returns immediately
+        args
+            name        (str)       key of SOUND_FILES
+        """
+        if not self.enabled:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name="SoundManager")
+            self._thread.start()
+        try:
+            self._queue.put_nowait(name)
+        except queue.Full:
+            self.dropped += 1
+
+
+
+    def _run(self):
+        """
+        Background thread playing the requested sounds
+        """
+        while True:
+            name = self._queue.get()
+            if name is None:
+                return
+            now = time.monotonic()
+            if now - self._last_play.get(name, -float("inf")) < \
+                self.min_interval:
+                self.dropped += 1
+                continue
+            self._voices = [v for v in self._voices if v.is_playing()]
+            if len(self._voices) >= self.max_voices:
+                self.dropped += 1
+                continue
+            try:
+                clip = load_clip(name, self.sound_dir)
+                self._voices.append(clip.play())
+            except Exception as error:
+                # no audio library or device, stay silent from now on
+                logging.warning("[*] Audio disabled: {}".format(error))
+                self.enabled = False
+                return
+            self._last_play[name] = now
+
+
+
+    def close(self):
+        """
+        Stop the background thread (sounds already playing continue)
+        """
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass
+        self._thread = None
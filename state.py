@@ -0,0 +1,475 @@
+__author__ = "Devrim Celik"
+
+import numpy as np
+
+# fields every kind of entity has, as (name, shape of one row, dtype)
+BODY_FIELDS = (
+    ("position", (2,), np.float64),
+    # position before the last step, for interpolated rendering
+    ("previous_position", (2,), np.float64),
+    ("velocity", (2,), np.float64),
+    ("acceleration", (2,), np.float64),
+    ("mass", (), np.float64),
+    ("radius", (), np.float64),
+    ("direction", (), np.float64),
+    ("alive", (), np.bool_),
+)
+# additional fields only spaceships need
+SHIP_FIELDS = BODY_FIELDS + (
+    ("damping", (), np.float64),
+    ("max_speed", (), np.float64),
+    ("audio", (), np.bool_),
+)
+
+
+class EntityStore():
+    """
+    Struct-of-arrays storage for all entities of one kind. Every field is one
+    contiguous array with a row per entity, so a whole kind can be updated in
+    a single vectorized operation. Only the rows [0, count) are in use;
+    accessing a field (e.g. store.position) returns a view of exactly those.
+
+    Every entity gets an id that is never reused. Removing entities compacts
+    the arrays while keeping the order of rows, so the ids stay sorted and
+    the row of an id can be found by bisection.
+    """
+    def __init__(self, fields=BODY_FIELDS, capacity=16):
+        """
+        args
+            fields      (tuple)     (name, shape, dtype) of every field
+            capacity    (int)       number of rows to allocate up front
+        """
+        self.fields = fields
+        self.count = 0
+        self.capacity = capacity
+        self._next_id = 0
+        self._data = {name: np.zeros((capacity,) + shape, dtype=dtype)
+                        for name, shape, dtype in fields}
+        self._data["ids"] = np.zeros(capacity, dtype=np.int64)
+
+
+
+    def __getattr__(self, name):
+        # only called if normal lookup failed, so this serves the fields
+        data = self.__dict__.get("_data")
+        if data is None or name not in data:
+            raise AttributeError(name)
+        return data[name][:self.count]
+
+
+
+    def __setattr__(self, name, value):
+        # write fields in place, so augmented assignments like
+        # store.position += store.velocity do not replace the array
+        data = self.__dict__.get("_data")
+        if data is not None and name in data:
+            data[name][:self.count] = value
+        else:
+            object.__setattr__(self, name, value)
+
+
+
+    def __len__(self):
+        return self.count
+
+
+
+    def __contains__(self, eid):
+        indx = np.searchsorted(self.ids, eid)
+        return indx < self.count and self.ids[indx] == eid
+
+
+
+    def _grow(self):
+        """
+        Double the capacity of all arrays
+        """
+        self.capacity *= 2
+        for name, arr in self._data.items():
+            new = np.zeros((self.capacity,) + arr.shape[1:], dtype=arr.dtype)
+            new[:self.count] = arr[:self.count]
+            self._data[name] = new
+
+
+
+    def add(self, **values):
+        """
+        Append a new entity
+        args
+            **values                    initial value per field, fields
+                                            that are not given are zero
+        returns
+            eid             (int)       id of the new entity
+        """
+        if self.count == self.capacity:
+            self._grow()
+        row = self.count
+        for name, arr in self._data.items():
+            arr[row] = values.get(name, 0)
+        eid = self._next_id
+        self._next_id += 1
+        self._data["ids"][row] = eid
+        self._data["alive"][row] = True
+        self.count += 1
+        return eid
+
+
+
+    def add_many(self, n, **values):
+        """
+        Append n entities at once
+        args
+            n               (int)       number of entities
+            **values                    initial values per field, either
+                                            one for all or one per entity
+        returns
+            eids            (ndarray)   ids of the new entities
+        """
+        while self.count + n > self.capacity:
+            self._grow()
+        rows = slice(self.count, self.count + n)
+        for name, arr in self._data.items():
+            arr[rows] = values.get(name, 0)
+        eids = np.arange(self._next_id, self._next_id + n)
+        self._next_id += n
+        self._data["ids"][rows] = eids
+        self._data["alive"][rows] = True
+        self.count += n
+        return eids
+
+
+
+    def row(self, eid):
+        """
+        Find the row an entity is currently stored in
+        args
+            eid             (int)       id of the entity
+        returns
+            row             (int)       index into the field arrays
+        """
+        indx = int(np.searchsorted(self.ids, eid))
+        if indx >= self.count or self.ids[indx] != eid:
+            raise KeyError("entity {} does not exist".format(eid))
+        return indx
+
+
+
+    def remove(self, mask):
+        """
+        Remove all entities whose row is set in mask and compact the arrays
+        args
+            mask            (ndarray)   boolean array of length count
+        """
+        keep = ~np.asarray(mask, dtype=bool)
+        n_keep = int(keep.sum())
+        if n_keep == self.count:
+            return
+        for arr in self._data.values():
+            arr[:n_keep] = arr[:self.count][keep]
+        self.count = n_keep
+
+
+
+    def remove_dead(self):
+        """
+        Remove all entities that are not alive anymore
+        """
+        self.remove(~self.alive)
+
+
+
+    def assign(self, ids, **values):
+        """
+        Replace all entities of the store, e.g. with a recorded frame
+        args
+            ids             (ndarray)   ids of the entities, sorted
+            **values                    values per field, either one for all
+                                            or one per entity, fields that
+                                            are not given are zero
+        """
+        count = len(ids)
+        self.count = 0
+        while count > self.capacity:
+            self._grow()
+        for name, arr in self._data.items():
+            arr[:count] = values.get(name, 0)
+        self._data["ids"][:count] = ids
+        self.count = count
+        if count:
+            self._next_id = max(self._next_id, int(ids[-1]) + 1)
+
+
+
+    def snapshot_parts(self):
+        """
+        The complete state of the store as a list of buffers, which are only
+        valid until the store changes (join them to keep them)
+        returns
+            list of bytes-like objects
+        """
+        header = np.array([self.count, self._next_id], dtype=np.int64)
+        return [header] + [arr[:self.count] for arr in self._data.values()]
+
+
+
+    def restore(self, buffer, offset=0):
+        """
+        Overwrite the state of the store with a snapshot
+        args
+            buffer      (bytes)     buffer holding the snapshot_parts
+            offset      (int)       where the snapshot of this store starts
+        returns
+            offset      (int)       where the snapshot of this store ends
+        """
+        count, next_id = np.frombuffer(buffer, np.int64, 2, offset)
+        offset += 16
+        self.count = 0
+        while count > self.capacity:
+            self._grow()
+        for arr in self._data.values():
+            n = int(count) * int(np.prod(arr.shape[1:], dtype=np.int64))
+            arr[:count] = np.frombuffer(buffer, arr.dtype, n, offset) \
+                .reshape((count,) + arr.shape[1:])
+            offset += n * arr.itemsize
+        self.count = int(count)
+        self._next_id = int(next_id)
+        return offset
+
+
+
+
+
+class EntityPool(EntityStore):
+    """
+    Fixed capacity variant of the EntityStore for entities which are spawned
+    and removed all the time (missiles). All arrays are allocated once and
+    never grow; spawning takes the next free row and removing fills the holes
+    with the last rows (swap-remove), so both cost O(1) per entity and no
+    allocation. The order of the rows is not kept.
+
+    An id consists of a slot, which is recycled through a free-list, and the
+    generation of that slot, so stale ids of removed entities never match a
+    new entity that got the same slot.
+    """
+    _SLOT_BITS = 32
+    _SLOT_MASK = (1 << _SLOT_BITS) - 1
+
+    def __init__(self, fields=BODY_FIELDS, capacity=4096):
+        """
+        args
+            fields      (tuple)     (name, shape, dtype) of every field
+            capacity    (int)       maximal number of entities, further
+                                        spawns are dropped
+        """
+        super().__init__(fields, capacity)
+        # row of every slot and generation of every slot
+        self._row_of = np.zeros(capacity, dtype=np.intp)
+        self._generation = np.zeros(capacity, dtype=np.int64)
+        # stack of free slots, the top is at _n_free - 1
+        self._free = np.arange(capacity, dtype=np.int64)[::-1].copy()
+        self._n_free = capacity
+        # slots are taken in increasing order, the slots from _high on were
+        # never used: their generation is 0 and they lie at the bottom of
+        # the free stack in descending order
+        self._high = 0
+        # number of entities that could not be spawned because the pool
+        # was full
+        self.dropped = 0
+
+
+
+    def _grow(self):
+        raise RuntimeError("an EntityPool has a fixed capacity")
+
+
+
+    def __contains__(self, eid):
+        eid = int(eid)
+        slot = eid & self._SLOT_MASK
+        if slot >= self.capacity or \
+            self._generation[slot] != eid >> self._SLOT_BITS:
+            return False
+        row = self._row_of[slot]
+        return row < self.count and self._data["ids"][row] == eid
+
+
+
+    def add(self, **values):
+        """
+        Spawn a new entity in the next free row
+        args
+            **values                    initial value per field, fields
+                                            that are not given are zero
+        returns
+            eid             (int)       id of the new entity, None if the
+                                            pool is full
+        """
+        if self.count == self.capacity:
+            self.dropped += 1
+            return None
+        row = self.count
+        for name, arr in self._data.items():
+            arr[row] = values.get(name, 0)
+        self._n_free -= 1
+        slot = int(self._free[self._n_free])
+        eid = (int(self._generation[slot]) << self._SLOT_BITS) | slot
+        self._data["ids"][row] = eid
+        self._data["alive"][row] = True
+        self._row_of[slot] = row
+        self._high = max(self._high, slot + 1)
+        self.count += 1
+        return eid
+
+
+
+    def add_many(self, n, **values):
+        """
+        Spawn n entities at once
+        args
+            n               (int)       number of entities
+            **values                    initial values per field, either
+                                            one for all or one per entity
+        returns
+            eids            (ndarray)   ids of the spawned entities, shorter
+                                            than n if the pool ran full
+        """
+        n_spawn = min(n, self.capacity - self.count)
+        self.dropped += n - n_spawn
+        rows = slice(self.count, self.count + n_spawn)
+        for name, arr in self._data.items():
+            value = values.get(name, 0)
+            # only values given per entity have to be cut
+            if np.ndim(value) == arr.ndim:
+                value = np.asarray(value)[:n_spawn]
+            arr[rows] = value
+        slots = self._free[self._n_free - n_spawn:self._n_free][::-1]
+        self._n_free -= n_spawn
+        eids = (self._generation[slots] << self._SLOT_BITS) | slots
+        self._data["ids"][rows] = eids
+        self._data["alive"][rows] = True
+        self._row_of[slots] = np.arange(self.count, self.count + n_spawn)
+        if n_spawn:
+            self._high = max(self._high, int(slots.max()) + 1)
+        self.count += n_spawn
+        return eids
+
+
+
+    def row(self, eid):
+        """
+        Find the row an entity is currently stored in
+        args
+            eid             (int)       id of the entity
+        returns
+            row             (int)       index into the field arrays
+        """
+        if eid not in self:
+            raise KeyError("entity {} does not exist".format(eid))
+        return int(self._row_of[int(eid) & self._SLOT_MASK])
+
+
+
+    def remove(self, mask):
+        """
+        Remove all entities whose row is set in mask, the holes are filled
+        with the last rows
+        args
+            mask            (ndarray)   boolean array of length count
+        """
+        mask = np.asarray(mask, dtype=bool)
+        removed = np.flatnonzero(mask)
+        if not len(removed):
+            return
+        new_count = self.count - len(removed)
+
+        # recycle the slots, with a new generation
+        slots = self._data["ids"][removed] & self._SLOT_MASK
+        self._generation[slots] += 1
+        self._free[self._n_free:self._n_free + len(slots)] = slots
+        self._n_free += len(slots)
+
+        # move the surviving rows behind new_count into the holes before it
+        holes = removed[removed < new_count]
+        fillers = new_count + np.flatnonzero(~mask[new_count:])
+        for arr in self._data.values():
+            arr[holes] = arr[fillers]
+        self._row_of[self._data["ids"][holes] & self._SLOT_MASK] = holes
+        self.count = new_count
+
+
+
+    def assign(self, eids, **values):
+        """
+        Replace all entities of the pool, e.g. with a recorded frame, see
+        EntityStore.assign (the ids do not have to be sorted)
+        """
+        count = len(eids)
+        if count > self.capacity:
+            raise ValueError("{} entities do not fit into the pool".format(
+                count))
+        for name, arr in self._data.items():
+            arr[:count] = values.get(name, 0)
+        eids = np.asarray(eids, dtype=np.int64)
+        self._data["ids"][:count] = eids
+        self.count = count
+        # take over the slots and generations of the ids, the other slots
+        # are free
+        slots = eids & self._SLOT_MASK
+        self._generation[slots] = eids >> self._SLOT_BITS
+        self._row_of[slots] = np.arange(count)
+        used = np.zeros(self.capacity, dtype=bool)
+        used[slots] = True
+        free = np.flatnonzero(~used)[::-1]
+        self._free[:len(free)] = free
+        self._n_free = len(free)
+        if count:
+            self._high = max(self._high, int(slots.max()) + 1)
+
+
+
+    def snapshot_parts(self):
+        """
+        The complete state of the pool as a list of buffers, see
+        EntityStore.snapshot_parts. Only the generations of the slots used
+        so far and the part of the free stack above the never used slots
+        are written, the rows of the slots follow from the ids, so the size
+        depends on the number of entities and not on the capacity.
+        """
+        header = np.array([self.capacity, self._n_free, self.dropped,
+                            self._high], dtype=np.int64)
+        return super().snapshot_parts() + [
+            header, self._generation[:self._high],
+            self._free[self.capacity - self._high:self._n_free]]
+
+
+
+    def restore(self, buffer, offset=0):
+        """
+        Overwrite the state of the pool with a snapshot, see
+        EntityStore.restore
+        """
+        count = int(np.frombuffer(buffer, np.int64, 1, offset)[0])
+        if count > self.capacity:
+            raise ValueError("snapshot does not fit into the pool")
+        offset = super().restore(buffer, offset)
+        capacity, n_free, dropped, high = (int(v) for v in
+            np.frombuffer(buffer, np.int64, 4, offset))
+        if capacity != self.capacity:
+            raise ValueError("snapshot of a pool with capacity {}".format(
+                capacity))
+        offset += 32
+        self._generation[:high] = np.frombuffer(buffer, np.int64, high,
+                                                offset)
+        self._generation[high:] = 0
+        offset += high * 8
+        n_top = n_free - (capacity - high)
+        self._free[:capacity - high] = np.arange(capacity - 1, high - 1, -1)
+        self._free[capacity - high:n_free] = np.frombuffer(buffer, np.int64,
+                                                            n_top, offset)
+        offset += n_top * 8
+        ids = self._data["ids"][:count]
+        self._row_of[ids & self._SLOT_MASK] = np.arange(count)
+        self._n_free = n_free
+        self._high = high
+        self.dropped = dropped
+        return offset
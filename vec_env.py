@@ -0,0 +1,357 @@
+__author__ = "Devrim Celik"
+
+import numpy as np
+from physics import grav_force, update_missiles, update_spaceships
+from collision import swept_circle_circle, segment_circle
+from contacts import resolve_contacts
+
+# discrete actions of a spaceship, matching the keys of the sketch
+NOOP = 0
+BOOST = 1       # UP
+LEFT = 2        # LEFT
+RIGHT = 3       # RIGHT
+BRAKE = 4       # DOWN
+SHOOT = 5       # SPACE
+N_ACTIONS = 6
+
+# features per spaceship in an observation: x, y, velocity x, velocity y,
+# cos and sin of the direction, alive
+OBS_SIZE = 7
+
+
+class VecSpaceshipEnv():
+    """
+    K independent worlds, stored in stacked arrays with the environment as
+    the leading dimension, and stepped all at once. Every environment holds a
+    fixed number of spaceships, planets and missile slots, every spaceship is
+    controlled by its own discrete action per step.
+
+    Rewards are +1 for the spaceship whose missile destroyed another
+    spaceship and -1 for the destroyed spaceship. An environment is done when
+    at most one spaceship is left or after max_steps steps, finished
+    environments are reset automatically.
+    """
+    def __init__(self, num_envs=256, num_spaceships=2, num_planets=0,
+        missile_capacity=32, width=1080, height=720, wall_thickness=10,
+        grav_const=1, softening=1.0, max_steps=1000, seed=None, dt=1.0,
+        restitution=1.0, contact_iterations=4):
+        """
+        args
+            num_envs            (int)       number of worlds K
+            num_spaceships      (int)       spaceships per world
+            num_planets         (int)       planets per world, placed randomly
+            missile_capacity    (int)       missile slots per world, a shot
+                                                is dropped if all are in use
+            width               (float)     width of every world
+            height              (float)     height of every world
+            wall_thickness      (int)       thickness of walls
+            grav_const          (float)     gravitational constant
+            softening           (float)     softening length of gravity
+            max_steps           (int)       steps until an episode ends
+            seed                (int)       seed of the random generator
+            dt                  (float)     length of a step (semi-implicit
+                                                Euler), 1 is one frame
+            restitution         (float)     bounciness of collisions, see
+                                                World
+            contact_iterations  (int)       impulse passes of the contact
+                                                solver
+        """
+        self.num_envs = num_envs
+        self.num_spaceships = num_spaceships
+        self.num_planets = num_planets
+        self.missile_capacity = missile_capacity
+        self.width = width
+        self.height = height
+        self.wall_thickness = wall_thickness
+        self.grav_const = grav_const
+        self.softening = softening
+        self.max_steps = max_steps
+        self.rng = np.random.default_rng(seed)
+        self.dt = dt
+        self.restitution = restitution
+        self.contact_iterations = contact_iterations
+
+        K, S, M, P = num_envs, num_spaceships, missile_capacity, num_planets
+        self.ship_position = np.zeros((K, S, 2))
+        # positions before the last step, hits are tested along the way
+        # from there
+        self.ship_previous_position = np.zeros((K, S, 2))
+        self.ship_velocity = np.zeros((K, S, 2))
+        self.ship_acceleration = np.zeros((K, S, 2))
+        self.ship_direction = np.zeros((K, S))
+        self.ship_mass = np.full((K, S), 30.0)
+        self.ship_damping = np.full((K, S), 0.99)
+        self.ship_max_speed = np.full((K, S), 10.0)
+        self.ship_alive = np.zeros((K, S), dtype=bool)
+
+        self.missile_position = np.zeros((K, M, 2))
+        self.missile_previous_position = np.zeros((K, M, 2))
+        self.missile_velocity = np.zeros((K, M, 2))
+        self.missile_acceleration = np.zeros((K, M, 2))
+        self.missile_mass = np.full((K, M), 20.0)
+        self.missile_alive = np.zeros((K, M), dtype=bool)
+        # index of the spaceship that shot the missile
+        self.missile_owner = np.zeros((K, M), dtype=np.intp)
+
+        self.planet_position = np.zeros((K, P, 2))
+        self.planet_mass = np.full((K, P), 30.0)
+
+        self.steps = np.zeros(K, dtype=np.int64)
+
+
+
+    def reset(self, envs=None):
+        """
+        Reset environments to random start states
+        args
+            envs        (ndarray)   boolean mask or indices of the
+                                        environments to reset, all if None
+        returns
+            observations of all environments
+        """
+        envs = np.arange(self.num_envs) if envs is None else np.asarray(envs)
+        if envs.dtype == bool:
+            envs = np.flatnonzero(envs)
+        n = len(envs)
+        if n:
+            margin = self.ship_mass[envs] + self.wall_thickness + 1
+            S = self.num_spaceships
+            self.ship_position[envs, :, 0] = self.rng.uniform(
+                margin, self.width - margin, (n, S))
+            self.ship_position[envs, :, 1] = self.rng.uniform(
+                margin, self.height - margin, (n, S))
+            self.ship_velocity[envs] = 0
+            self.ship_acceleration[envs] = 0
+            self.ship_direction[envs] = self.rng.uniform(0, 2*np.pi, (n, S))
+            self.ship_alive[envs] = True
+
+            self.missile_alive[envs] = False
+            self.missile_acceleration[envs] = 0
+
+            P = self.num_planets
+            self.planet_position[envs, :, 0] = self.rng.uniform(
+                0, self.width, (n, P))
+            self.planet_position[envs, :, 1] = self.rng.uniform(
+                0, self.height, (n, P))
+            self.steps[envs] = 0
+        return self.observe()
+
+
+
+    def observe(self):
+        """
+        returns
+            observations    (ndarray)   (K, S, OBS_SIZE) float32 state of
+                                            every spaceship, positions are
+                                            divided by the world size and
+                                            velocities by the speed limit
+        """
+        obs = np.empty((self.num_envs, self.num_spaceships, OBS_SIZE),
+                        dtype=np.float32)
+        obs[..., 0] = self.ship_position[..., 0] / self.width
+        obs[..., 1] = self.ship_position[..., 1] / self.height
+        obs[..., 2:4] = self.ship_velocity / self.ship_max_speed[..., None]
+        obs[..., 4] = np.cos(self.ship_direction)
+        obs[..., 5] = np.sin(self.ship_direction)
+        obs[..., 6] = self.ship_alive
+        return obs
+
+
+
+    def _apply_actions(self, actions):
+        """
+        Apply the action of every spaceship, see the action constants
+        """
+        alive = self.ship_alive
+        self.ship_direction += np.where(alive & (actions == LEFT), -0.4, 0)
+        self.ship_direction += np.where(alive & (actions == RIGHT), 0.4, 0)
+
+        unit = np.stack((np.cos(self.ship_direction),
+                            np.sin(self.ship_direction)), axis=-1)
+        boost = alive & (actions == BOOST)
+        self.ship_acceleration += np.where(boost[..., None], 3 * unit, 0)
+
+        brake = alive & (actions == BRAKE)
+        self.ship_acceleration[brake] = 0
+        self.ship_velocity[brake] *= 0.5
+
+        shoot = alive & (actions == SHOOT)
+        if not shoot.any():
+            return
+        # the n-th shooting spaceship of an environment gets the n-th free
+        # missile slot of it
+        free_slots = np.argsort(self.missile_alive, axis=1, kind="stable")
+        n_free = (~self.missile_alive).sum(axis=1)
+        rank = np.cumsum(shoot, axis=1) - 1
+        env, ship = np.nonzero(shoot & (rank < n_free[:, None]))
+        slot = free_slots[env, rank[env, ship]]
+
+        self.missile_position[env, slot] = self.ship_position[env, ship] + \
+            unit[env, ship] * (self.ship_mass[env, ship] + 1)[:, None]
+        self.missile_velocity[env, slot] = unit[env, ship] * \
+            self.ship_max_speed[env, ship][:, None]
+        self.missile_acceleration[env, slot] = 0
+        self.missile_alive[env, slot] = True
+        self.missile_owner[env, slot] = ship
+
+
+
+    def _remove_objects(self, rewards):
+        """
+        Remove missiles that left the screen or flew into a planet and
+        spaceships that got hit, together with the missile that hit them.
+        Hits are tested continuously along the paths of the last step (like
+        World.remove_objects), so fast missiles can not pass through a
+        spaceship or a planet in between two steps.
+        """
+        pos = self.missile_position
+        gone = ~((pos[..., 0] >= 0) & (pos[..., 0] <= self.width) &
+                    (pos[..., 1] >= 0) & (pos[..., 1] <= self.height))
+
+        # when every missile would enter a planet along its last step
+        absorb_toi = np.full(self.missile_alive.shape, np.inf)
+        if self.num_planets:
+            env, slot, planet = np.nonzero(np.broadcast_to(
+                self.missile_alive[..., None], self.missile_alive.shape +
+                (self.num_planets,)))
+            toi = segment_circle(self.missile_previous_position[env, slot],
+                                    pos[env, slot],
+                                    self.planet_position[env, planet],
+                                    self.planet_mass[env, planet] / 2 +
+                                    self.missile_mass[env, slot] / 10)
+            np.minimum.at(absorb_toi, (env, slot), toi)
+        gone |= absorb_toi <= 1
+
+        # every pair of a living spaceship and missile of an environment
+        env, ship, slot = np.nonzero(self.ship_alive[..., None] &
+                                        self.missile_alive[:, None, :])
+        ship_start = self.ship_previous_position[env, ship]
+        missile_start = self.missile_previous_position[env, slot]
+        toi = swept_circle_circle(ship_start,
+                                    self.ship_position[env, ship] -
+                                    ship_start, missile_start,
+                                    pos[env, slot] - missile_start,
+                                    self.ship_mass[env, ship])
+        # a missile absorbed by a planet before can not hit anymore
+        hit = (toi <= 1) & (toi < absorb_toi[env, slot])
+        self.missile_alive &= ~gone
+        if not hit.any():
+            return
+        env, ship, slot, toi = env[hit], ship[hit], slot[hit], toi[hit]
+        # every spaceship that got hit takes the missile which hit it first
+        # with it
+        order = np.lexsort((slot, toi, ship, env))
+        env, ship, slot = env[order], ship[order], slot[order]
+        first = np.flatnonzero(np.diff(env * self.num_spaceships + ship,
+                                        prepend=-1) != 0)
+        env, ship, slot = env[first], ship[first], slot[first]
+        self.missile_alive[env, slot] = False
+        self.ship_alive[env, ship] = False
+        self.ship_velocity[env, ship] = 0
+
+        shooter = self.missile_owner[env, slot]
+        np.add.at(rewards, (env, ship), -1)
+        killed_other = shooter != ship
+        np.add.at(rewards, (env[killed_other], shooter[killed_other]), 1)
+
+
+
+    def _touch_circles(self):
+        """
+        Let living spaceships collide with each other and with planets, with
+        the contact solver of the World (see contacts.py): the circles of all
+        environments are solved at once, pairs only ever lie within one
+        environment. Planets do not move.
+        """
+        K, S, P = self.num_envs, self.num_spaceships, self.num_planets
+        # all circles, the spaceships of all environments first; circle i
+        # of environment k is k * S + i, planet p is K * S + k * P + p
+        position = np.concatenate((self.ship_position.reshape(K * S, 2),
+                                    self.planet_position.reshape(K * P, 2)))
+        velocity = np.concatenate((self.ship_velocity.reshape(K * S, 2),
+                                    np.zeros((K * P, 2))))
+        radius = np.concatenate((self.ship_mass.ravel(),
+                                    self.planet_mass.ravel() / 2))
+        inv_mass = np.zeros(len(position))
+        inv_mass[:K * S] = 1 / self.ship_mass.ravel()
+
+        alive = self.ship_alive
+        # every pair of living spaceships once, and every living spaceship
+        # with every planet
+        upper = np.triu(np.ones((S, S), dtype=bool), 1)
+        env, a, b = np.nonzero(alive[:, :, None] & alive[:, None, :] & upper)
+        rows = [env * S + a]
+        others = [env * S + b]
+        env, a, planet = np.nonzero(np.broadcast_to(alive[..., None],
+                                                    (K, S, P)))
+        rows.append(env * S + a)
+        others.append(K * S + env * P + planet)
+        rows, others = np.concatenate(rows), np.concatenate(others)
+
+        move = velocity * self.dt
+        toi = swept_circle_circle(position[rows], move[rows],
+                                    position[others], move[others],
+                                    radius[rows] + radius[others])
+        touching = toi <= 1
+        resolve_contacts(position, velocity, inv_mass, radius,
+                            rows[touching], others[touching], self.dt,
+                            self.restitution, self.contact_iterations)
+        self.ship_position[...] = position[:K * S].reshape(K, S, 2)
+        self.ship_velocity[...] = velocity[:K * S].reshape(K, S, 2)
+
+
+
+    def step(self, actions):
+        """
+        Advance all environments by one step
+        args
+            actions         (ndarray)   (K, S) integer action per spaceship
+        returns
+            observations    (ndarray)   (K, S, OBS_SIZE) after the step,
+                                            for finished environments the
+                                            first of the next episode
+            rewards         (ndarray)   (K, S) float32
+            dones           (ndarray)   (K,) bool, episode finished
+            infos           (dict)      "terminal_observation" holds the last
+                                            observations of the finished
+                                            environments (before reset)
+        """
+        actions = np.asarray(actions).reshape(self.num_envs,
+                                                self.num_spaceships)
+        rewards = np.zeros((self.num_envs, self.num_spaceships),
+                            dtype=np.float32)
+
+        self._apply_actions(actions)
+        self.ship_previous_position[...] = self.ship_position
+        self.missile_previous_position[...] = self.missile_position
+
+        self.missile_acceleration += grav_force(
+            self.missile_position, self.missile_mass, self.planet_position,
+            self.planet_mass, self.grav_const, self.softening)
+        update_missiles(self.missile_position, self.missile_velocity,
+                        self.missile_acceleration, self.dt)
+
+        self.ship_acceleration += grav_force(
+            self.ship_position, self.ship_mass, self.planet_position,
+            self.planet_mass, self.grav_const, self.softening)
+        # destroyed spaceships stay where they are
+        dead = ~self.ship_alive
+        self.ship_acceleration[dead] = 0
+        self.ship_velocity[dead] = 0
+        update_spaceships(self.ship_position, self.ship_velocity,
+                            self.ship_acceleration, self.ship_mass,
+                            self.ship_damping, self.ship_max_speed, self.width,
+                            self.height, self.wall_thickness, self.dt)
+        self._remove_objects(rewards)
+        self._touch_circles()
+
+        self.steps += 1
+        n_alive = self.ship_alive.sum(axis=1)
+        dones = (n_alive <= min(1, self.num_spaceships - 1)) | \
+            (self.steps >= self.max_steps)
+
+        observations = self.observe()
+        infos = {"terminal_observation": observations[dones]}
+        if dones.any():
+            observations = self.reset(dones)
+        return observations, rewards, dones, infos
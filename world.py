@@ -0,0 +1,808 @@
+__author__ = "Devrim Celik"
+
+import numpy as np
+from classes import Spaceship, Missile, Planet
+from physics import grav_force
+from profiler import Profiler
+from integrators import SCHEMES, integrate_missiles, integrate_spaceships, \
+    substep_counts
+from barnes_hut import BarnesHutTree
+from gravity_field import GravityField
+from broadphase import UniformGrid, candidate_pairs
+from collision import swept_circle_circle, segment_circle
+from contacts import resolve_contacts
+from events import EventBus, EVENT_HIT, EVENT_SHIP_BOUNCE, \
+    EVENT_PLANET_BOUNCE, EVENT_ABSORBED, EVENT_SHIP_CREATED, \
+    EVENT_PLANET_CREATED, EVENT_INPUT, INPUT_KEYS
+from snapshot import SnapshotRing, take_snapshot, restore_snapshot
+from sound import SoundManager
+from state import EntityStore, EntityPool, BODY_FIELDS, SHIP_FIELDS
+
+
+class World():
+    """
+    Headless simulation core. The world owns all spaceships, missiles and
+    planets and advances them without p5, a window or any drawing, so it can
+    be stepped as fast as the physics allows. The p5 sketch only renders
+    whatever the world holds after each step.
+
+    The state of every kind of entity lives in an EntityStore (one array per
+    attribute), so each step updates all entities of a kind at once. The
+    Spaceship, Missile and Planet objects are only handles into these arrays.
+    """
+    def __init__(self, width=1080, height=720, wall_thickness=10,
+        grav_const=1, softening=0.0, gravity_mode="exact", theta=0.5,
+        dt=1.0, integrator="euler", max_substeps=1, courant=0.25,
+        missile_capacity=4096, audio=False, seed=None, rewind_depth=0,
+        profile=False, restitution=1.0, contact_iterations=4,
+        log_events=False, field_cell=4, field_cache=None, fused=False):
+        """
+        args
+            width           (float)     width of the world in pixel
+            height          (float)     height of the world in pixel
+            wall_thickness  (int)       thickness of walls on map
+            grav_const      (float)     gravitational constant
+            softening       (float)     softening length of gravity, keeps
+                                            the pull finite close to (and on)
+                                            a planet centre
+            gravity_mode    (str)       "exact" sums up the pull of every
+                                            planet, "barnes_hut" approximates
+                                            it with a quadtree, which scales
+                                            to many thousands of planets,
+                                            "field" samples a grid baked from
+                                            the planets, see GravityField
+            theta           (float)     opening angle of the barnes_hut mode
+            dt              (float)     length of one step, where 1 is one
+                                            frame of the original sketch
+            integrator      (str)       integration scheme, "euler" or
+                                            "verlet", see integrators.py
+            max_substeps    (int)       bodies close to a planet are split
+                                            into up to this many substeps,
+                                            1 disables substepping
+            courant         (float)     fraction of the distance to the
+                                            closest planet surface a
+                                            (sub)step may travel
+            missile_capacity (int)      maximal number of missiles at once,
+                                            further shots are dropped
+            audio           (bool)      play sounds, if False simpleaudio
+                                            is never imported
+            seed            (int)       seed of the random generator
+            rewind_depth    (int)       number of steps that can be undone
+                                            with rewind(), 0 keeps no history
+            profile         (bool)      time the stages of every step, see
+                                            World.profiler
+            restitution     (float)     bounciness of collisions in between
+                                            spaceships and with planets, 1
+                                            is elastic
+            contact_iterations (int)    impulse passes of the contact solver
+            log_events      (bool)      write the events into the log (in
+                                            a background thread), they are
+                                            counted in any case, see
+                                            World.event_bus
+            field_cell      (float)     node distance of the "field" mode
+            field_cache     (str)       directory the baked fields of the
+                                            "field" mode are cached in
+            fused           (bool)      advance bodies with the fused loop
+                                            of fused.py (compiled if numba
+                                            is installed) when the gravity is
+                                            exact and no substeps are needed
+        """
+        if gravity_mode not in ("exact", "barnes_hut", "field"):
+            raise ValueError("unknown gravity mode {}".format(gravity_mode))
+        if integrator not in SCHEMES:
+            raise ValueError("unknown integrator {}".format(integrator))
+        self.width = width
+        self.height = height
+        self.wall_thickness = wall_thickness
+        self.grav_const = grav_const
+        self.softening = softening
+        self.gravity_mode = gravity_mode
+        self.theta = theta
+        self.dt = dt
+        self.integrator = integrator
+        self.max_substeps = max_substeps
+        self.courant = courant
+        self.restitution = restitution
+        self.contact_iterations = contact_iterations
+        self.fused = fused
+
+        self.ship_state = EntityStore(SHIP_FIELDS)
+        self.missile_state = EntityPool(BODY_FIELDS, missile_capacity)
+        self.planet_state = EntityStore(BODY_FIELDS)
+
+        # every random decision of the world uses this generator, so it is
+        # part of the snapshots
+        self.rng = np.random.Generator(np.random.PCG64(seed))
+        # snapshots of the last steps, for rewind()
+        self.history = SnapshotRing(rewind_depth) if rewind_depth else None
+
+        # stage timings, the sketch adds its drawing stages and ends the
+        # frames, headless users call profiler.end_frame() themselves
+        self.profiler = Profiler(enabled=profile)
+
+        # counts the events and logs them in batches
+        self.event_bus = EventBus(log=log_events)
+
+        # plays the sounds of all spaceships in the background
+        self.sounds = SoundManager(enabled=audio)
+
+        # quadtree of the planets for the barnes_hut mode, together with the
+        # planet state it was built from
+        self._tree = None
+        self._tree_key = None
+        # baked gravity of the planets for the field mode
+        self.gravity_field = GravityField(width, height, field_cell,
+                                            grav_const, softening,
+                                            field_cache) \
+            if gravity_mode == "field" else None
+
+        # broadphase indices, rebuilt every step
+        self._missile_grid = UniformGrid(width, height)
+        self._circle_grid = UniformGrid(width, height)
+        self._planet_grid = UniformGrid(width, height)
+
+        # number of steps advanced since creation
+        self.frame_count = 0
+        # (kind, id, other id) arrays of the events of the current step
+        self._events = []
+        # missiles that left the world, if the fused loop found out already
+        self._offscreen = None
+        # verlet: store -> (ids, positions, masses, planet state, gravity) at
+        # the end of the last step, the gravity the next step starts with
+        self._end_gravity = {}
+
+
+
+    @property
+    def events(self):
+        """
+        Everything that happened during the last step
+        returns
+            events      (ndarray)   (E, 3) rows of (EVENT_*, id, other id),
+                                        see events.py
+        """
+        if not self._events:
+            return np.zeros((0, 3), dtype=np.int64)
+        return np.concatenate(self._events)
+
+
+
+    @property
+    def spaceships(self):
+        """
+        Handles of all spaceships, in storage order
+        """
+        return [Spaceship(self, eid) for eid in self.ship_state.ids]
+
+    @property
+    def missiles(self):
+        """
+        Handles of all missiles, in storage order
+        """
+        return [Missile(self, eid) for eid in self.missile_state.ids]
+
+    @property
+    def planets(self):
+        """
+        Handles of all planets, in storage order
+        """
+        return [Planet(self, eid) for eid in self.planet_state.ids]
+
+
+
+    def add_spaceship(self, x, y, direction=None, mass=None, damping=None,
+        max_speed=None, enable_audio=None):
+        """
+        Create a spaceship inside of the world
+        args
+            x               (float)     x value of starting coordinates
+            y               (float)     y value of starting coordinates
+            direction       (float)     starting direction, in radiant, where
+                                            pointing to the right of the 2D
+                                            plane represents 0
+            mass            (float)     radius of circle of animation and mass
+            damping         (float)     value higher than 0 and maximal 1,
+                                            applied to velocity so it
+                                        reaches 0 if no acceleration is applied
+            max_speed       (float)     maximum speed
+            enable_audio    (bool)      should audio be enabled (if the world
+                                            plays sounds at all)
+        returns
+            the created Spaceship object
+        """
+        if direction is None:
+            direction = 0
+        if mass is None:
+            mass = 30
+        if damping is None:
+            damping = 0.99
+        if max_speed is None:
+            max_speed = 10
+        if enable_audio is None:
+            enable_audio = True
+
+        eid = self.ship_state.add(position=(x, y), previous_position=(x, y),
+                                    direction=direction,
+                                    mass=mass, radius=mass, damping=damping,
+                                    max_speed=max_speed, audio=enable_audio)
+
+        self.event_bus.emit(EVENT_SHIP_CREATED, self.frame_count, eid)
+        return Spaceship(self, eid)
+
+
+
+    def add_missile(self, x, y, direction, speed=None, mass=None):
+        """
+        Create a missile inside of the world
+        args
+            x           (float)     x position of spawning location
+            y           (float)     y position of spawning location
+            direction   (float)     angle (in radians) of current direction
+            speed       (float)     magnitude of velocity (speed)
+            mass        (float)     mass of the missile, its radius is mass/10
+        returns
+            the created Missile object, None if there are already
+            missile_capacity missiles
+        """
+        if speed is None:
+            speed = 10
+        if mass is None:
+            mass = 20
+        eid = self.missile_state.add(position=(x, y),
+            previous_position=(x, y),
+            velocity=(speed*np.cos(direction), speed*np.sin(direction)),
+            direction=direction, mass=mass, radius=mass/10)
+        if eid is None:
+            return None
+        return Missile(self, eid)
+
+
+
+    def add_planet(self, x, y, mass=None):
+        """
+        Create a planet inside of the world
+        args
+            x           (float)     x position of spawning location
+            y           (float)     y position of spawning location
+            mass        (float)     mass of the planet
+        returns
+            the created Planet object
+        """
+        if mass is None:
+            mass = 30
+        eid = self.planet_state.add(position=(x, y),
+                                    previous_position=(x, y), mass=mass,
+                                    radius=mass/2)
+        self.event_bus.emit(EVENT_PLANET_CREATED, self.frame_count, eid)
+        return Planet(self, eid)
+
+
+
+    def shoot(self, spaceship):
+        """
+        Let a spaceship shoot
+        args
+            spaceship   (Spaceship) the shooting spaceship
+        returns
+            the created Missile object
+        """
+        return spaceship.shoot()
+
+
+
+    def fire(self, rows=None):
+        """
+        Let many spaceships shoot at once, without creating any objects
+        args
+            rows        (ndarray)   rows of the shooting spaceships in
+                                        ship_state, all spaceships if None
+        returns
+            eids        (ndarray)   ids of the created missiles
+        """
+        ships = self.ship_state
+        rows = np.arange(ships.count) if rows is None else np.asarray(rows)
+        direction = ships.direction[rows]
+        unit = np.stack((np.cos(direction), np.sin(direction)), axis=-1)
+        # spawn just outside of the forcefield, see Spaceship.shoot
+        position = ships.position[rows] + \
+            unit * (ships.mass[rows] + 1)[:, np.newaxis]
+        eids = self.missile_state.add_many(len(rows), position=position,
+            previous_position=position,
+            velocity=unit * ships.max_speed[rows][:, np.newaxis],
+            direction=direction, mass=20, radius=2)
+
+        # play laser sound
+        if ships.audio[rows[:len(eids)]].any():
+            self.sounds.play("laser")
+        return eids
+
+
+
+    def apply_actions(self, eids, masks):
+        """
+        Apply the input of many spaceships at once, with the same effect as
+        the keys of the sketch: turns first, then boosts, brakes and shots
+        args
+            eids        (ndarray)   (C,) spaceship ids, unknown and
+                                        destroyed spaceships are ignored
+            masks       (ndarray)   (C,) bit i is set if INPUT_KEYS[i] is
+                                        pressed, several masks of one
+                                        spaceship are combined
+        """
+        ships = self.ship_state
+        eids = np.asarray(eids, dtype=np.int64)
+        masks = np.asarray(masks, dtype=np.int64)
+        if not len(eids) or not ships.count:
+            return
+        rows = np.minimum(np.searchsorted(ships.ids, eids), ships.count - 1)
+        known = ships.ids[rows] == eids
+        pressed = np.zeros(ships.count, dtype=np.int64)
+        np.bitwise_or.at(pressed, rows[known], masks[known])
+        pressed[~ships.alive] = 0
+        rows = np.flatnonzero(pressed)
+        if not len(rows):
+            return
+        keys = (pressed[rows, np.newaxis] >> np.arange(len(INPUT_KEYS))) & 1
+        key_rows, key = np.nonzero(keys)
+        self.event_bus.emit(EVENT_INPUT, self.frame_count,
+                            ships.ids[rows[key_rows]], key)
+
+        down = {name: rows[keys[:, i] == 1]
+                for i, name in enumerate(INPUT_KEYS)}
+        ships.direction[down["LEFT"]] -= 0.4
+        ships.direction[down["RIGHT"]] += 0.4
+        boost = down["UP"]
+        ships.acceleration[boost] += 3 * np.stack(
+            (np.cos(ships.direction[boost]), np.sin(ships.direction[boost])),
+            axis=-1)
+        ships.acceleration[down["DOWN"]] = 0
+        ships.velocity[down["DOWN"]] *= 0.5
+        if len(down["SPACE"]):
+            self.fire(down["SPACE"])
+
+
+
+    def remove_objects(self):
+        """
+        Remove some objects (depending on the context):
+            * spaceship will be removed, if they get hits by a missile
+            * missile will be removed, if it hits a spacheship
+            * missile will be removed, if it leaves the screen
+            * missile will be removed, if it flies into a planet #4
+        Hits are tested continuously along the paths of the last step, so
+        fast missiles can not pass through a spaceship or a planet in between
+        two steps.
+        """
+        ships = self.ship_state
+        missiles = self.missile_state
+        planets = self.planet_state
+
+        # check which missiles are still on the screen
+        m_pos = missiles.position
+        if self._offscreen is not None:
+            gone = self._offscreen
+            self._offscreen = None
+        else:
+            gone = ~((m_pos[:, 0] >= 0) & (m_pos[:, 0] <= self.width) &
+                        (m_pos[:, 1] >= 0) & (m_pos[:, 1] <= self.height))
+
+        # when every missile would enter a planet along its last step
+        absorb_toi = np.full(missiles.count, np.inf)
+        absorber = np.zeros(missiles.count, dtype=np.intp)
+        if missiles.count and planets.count:
+            m_move = m_pos - missiles.previous_position
+            reach = planets.radius.max() + missiles.radius.max() + \
+                np.hypot(m_move[:, 0], m_move[:, 1]).max()
+            m_rows, p_rows = candidate_pairs(self._planet_grid, m_pos,
+                                                planets.position, reach)
+            toi = segment_circle(missiles.previous_position[m_rows],
+                                    m_pos[m_rows], planets.position[p_rows],
+                                    planets.radius[p_rows] +
+                                    missiles.radius[m_rows])
+            entered = toi <= 1
+            m_rows, p_rows, toi = m_rows[entered], p_rows[entered], \
+                toi[entered]
+            np.minimum.at(absorb_toi, m_rows, toi)
+            # keep the planet that was entered first
+            first = toi == absorb_toi[m_rows]
+            absorber[m_rows[first]] = p_rows[first]
+
+        if ships.count and missiles.count:
+            m_move = m_pos - missiles.previous_position
+            s_move = ships.position - ships.previous_position
+            # only pairs in neighbouring cells of the broadphase can be close
+            # enough for a hit, the reach covers how far both moved
+            reach = ships.mass.max() + \
+                np.hypot(m_move[:, 0], m_move[:, 1]).max() + \
+                np.hypot(s_move[:, 0], s_move[:, 1]).max()
+            s_rows, m_rows = candidate_pairs(self._missile_grid,
+                                                ships.position, m_pos, reach)
+            toi = swept_circle_circle(ships.previous_position[s_rows],
+                                        s_move[s_rows],
+                                        missiles.previous_position[m_rows],
+                                        m_move[m_rows], ships.mass[s_rows])
+            # a missile absorbed by a planet before can not hit anymore
+            hit = (toi <= 1) & (toi < absorb_toi[m_rows])
+            s_rows, m_rows, toi = s_rows[hit], m_rows[hit], toi[hit]
+            # every spaceship that got hit takes the missile which hit it
+            # first with it
+            order = np.lexsort((m_rows, toi, s_rows))
+            s_rows, m_rows = s_rows[order], m_rows[order]
+            first = np.flatnonzero(np.diff(s_rows, prepend=-1) != 0)
+            hit_ships = s_rows[first]
+            gone[m_rows[first]] = True
+            ships.alive[hit_ships] = False
+            self._add_events(EVENT_HIT, ships.ids[hit_ships],
+                                missiles.ids[m_rows[first]])
+            if ships.audio[hit_ships].any():
+                # play explosion sound
+                self.sounds.play("explosion")
+            ships.remove_dead()
+
+        absorbed = np.flatnonzero((absorb_toi <= 1) & ~gone)
+        gone[absorbed] = True
+        self._add_events(EVENT_ABSORBED, missiles.ids[absorbed],
+                            planets.ids[absorber[absorbed]])
+        missiles.remove(gone)
+
+
+
+    def _gravity(self, masses):
+        """
+        Build the gravity function for bodies of the given masses, which maps
+        their positions onto the total gravitational force of all planets
+        upon them (added directly to their acceleration)
+        args
+            masses      (ndarray)       (N,) masses of the bodies
+        returns
+            function of a (N, 2) position array
+        """
+        planets = self.planet_state
+        if self.gravity_mode == "barnes_hut":
+            with self.profiler.stage("gravity"):
+                tree = self._planet_tree()
+            gravity = lambda position: tree.grav_force(position, masses,
+                                                        self.grav_const,
+                                                        self.softening,
+                                                        self.theta)
+        elif self.gravity_mode == "field":
+            with self.profiler.stage("gravity"):
+                self.gravity_field.update(planets.position, planets.mass)
+            gravity = lambda position: self.gravity_field.sample(position,
+                                                                    masses)
+        else:
+            gravity = lambda position: grav_force(position, masses,
+                                                    planets.position,
+                                                    planets.mass,
+                                                    self.grav_const,
+                                                    self.softening)
+        return self.profiler.wrap("gravity", gravity)
+
+
+
+    def _planet_tree(self):
+        """
+        Return the quadtree over the current planets, it is only rebuilt if
+        planets were added, removed, moved or changed their mass
+        """
+        planets = self.planet_state
+        key = hash(planets.position.tobytes() + planets.mass.tobytes())
+        if self._tree is None or key != self._tree_key:
+            self._tree = BarnesHutTree(planets.position, planets.mass)
+            self._tree_key = key
+        return self._tree
+
+
+
+    def _start_gravity(self, store):
+        """
+        Gravity upon the entities of a store at their current positions, as
+        far as it is known from the end of the last verlet step. Entities
+        that moved since (e.g. in a collision), are new or changed their mass
+        are not known.
+        returns
+            gravity     (ndarray)       (N, 2) known gravity
+            known       (ndarray)       (N,) whether a row is known
+        """
+        planets = self.planet_state
+        planet_key = (planets.ids.tobytes(), planets.position.tobytes(),
+                        planets.mass.tobytes())
+        gravity = np.zeros((store.count, 2))
+        known = np.zeros(store.count, dtype=bool)
+        if store not in self._end_gravity or not store.count:
+            return gravity, known
+        ids, position, mass, key, end = self._end_gravity[store]
+        if key != planet_key or not len(ids):
+            return gravity, known
+        order = np.argsort(ids)
+        rows = order[np.minimum(np.searchsorted(ids, store.ids,
+                                                sorter=order), len(ids) - 1)]
+        known = (ids[rows] == store.ids) & \
+            (position[rows] == store.position).all(axis=1) & \
+            (mass[rows] == store.mass)
+        gravity[known] = end[rows[known]]
+        return gravity, known
+
+
+
+    def _keep_end_gravity(self, store, gravity):
+        planets = self.planet_state
+        self._end_gravity[store] = (store.ids.copy(), store.position.copy(),
+                                    store.mass.copy(),
+                                    (planets.ids.tobytes(),
+                                        planets.position.tobytes(),
+                                        planets.mass.tobytes()),
+                                    gravity)
+
+
+
+    def _integrate(self, store, integrate, *limits):
+        """
+        Advance all entities of a store by dt with the configured integrator.
+        Entities which get too close to a planet for a single step are
+        advanced in several substeps, all others in one. With verlet, the
+        gravity at the end of a step is kept for the start of the next.
+        args
+            store       (EntityStore)   entities to advance
+            integrate   (function)      integrate_missiles or
+                                            integrate_spaceships
+            *limits                     additional per entity arrays and
+                                            world sizes for integrate
+        """
+        planets = self.planet_state
+        store.previous_position = store.position
+        counts = substep_counts(store.position, store.velocity,
+                                planets.position, planets.radius, self.dt,
+                                self.max_substeps, self.courant)
+        fine = counts > 1
+        verlet = self.integrator == "verlet"
+        if verlet:
+            start_gravity, known = self._start_gravity(store)
+            end_gravity = np.empty((store.count, 2))
+        if self.fused and self.gravity_mode == "exact" and not fine.any():
+            # gravity, the update and the screen check in one loop; fused.py
+            # (and with it numba) is only imported by worlds that use it
+            from fused import integrate_fused
+            ship = store is self.ship_state
+            limits = dict(damping=store.damping, max_speed=store.max_speed,
+                            wall_thickness=self.wall_thickness) if ship \
+                else {}
+            if verlet:
+                limits.update(start_gravity=start_gravity, known=known)
+            offscreen, end_gravity = integrate_fused(
+                store.position, store.velocity, store.acceleration,
+                store.mass, planets.position, planets.mass, self.grav_const,
+                self.softening, self.dt, self.width, self.height,
+                self.integrator, **limits)
+            if not ship:
+                self._offscreen = offscreen
+            if verlet:
+                self._keep_end_gravity(store, end_gravity)
+            store.acceleration = 0
+            return
+        if fine.any():
+            groups = [(np.flatnonzero(~fine), 1),
+                        (np.flatnonzero(fine), int(counts.max()))]
+        else:
+            groups = [(slice(None), 1)]
+
+        for rows, n_sub in groups:
+            position = store.position[rows]
+            velocity = store.velocity[rows]
+            thrust = store.acceleration[rows]
+            gravity = self._gravity(store.mass[rows])
+            per_row = [l[rows] if isinstance(l, np.ndarray) else l
+                        for l in limits]
+            at_start = None
+            if verlet:
+                at_start = start_gravity[rows]
+                stale = ~known[rows]
+                if stale.any():
+                    at_start[stale] = self._gravity(
+                        store.mass[rows][stale])(position[stale])
+            for _ in range(n_sub):
+                at_start = integrate(position, velocity, thrust, gravity,
+                                        self.dt / n_sub, *per_row,
+                                        scheme=self.integrator,
+                                        start_gravity=at_start)
+            store.position[rows] = position
+            store.velocity[rows] = velocity
+            if verlet:
+                end_gravity[rows] = at_start
+        if verlet:
+            self._keep_end_gravity(store, end_gravity)
+        # if there is no external force applying onto an object, the
+        # acceleration is zero by default
+        store.acceleration = 0
+
+
+
+    def _update_missiles(self):
+        """
+        Given the current position velocity and acceleration,
+        calculate new position of every missile
+        """
+        self._integrate(self.missile_state, integrate_missiles)
+
+
+
+    def _update_spaceships(self):
+        """
+        update velocity and position of every spaceship and set acceleration
+        to 0
+        """
+        s = self.ship_state
+        self._integrate(s, integrate_spaceships, s.mass, s.damping,
+                        s.max_speed, self.width, self.height,
+                        self.wall_thickness)
+
+
+
+    def interpolate(self, store, alpha):
+        """
+        Positions of all entities of a store in between the last two steps,
+        so rendering can run at a different rate than the physics
+        args
+            store       (EntityStore)   entities to interpolate
+            alpha       (float)         0 is the previous step, 1 the current
+        returns
+            (N, 2) interpolated positions
+        """
+        return store.previous_position + \
+            alpha * (store.position - store.previous_position)
+
+
+
+    def _touch_circles(self):
+        """
+        Let spaceships collide with each other and with planets: every pair
+        of circles that touches now or during the next step is handed to the
+        contact solver once, which bounces them with mass-weighted impulses
+        and pushes overlapping ones apart, see contacts.py. Planets do not
+        move.
+        """
+        s = self.ship_state
+        p = self.planet_state
+        if not s.count:
+            return
+        # all circles, spaceships first
+        position = np.concatenate((s.position, p.position))
+        velocity = np.concatenate((s.velocity, p.velocity))
+        radius = np.concatenate((s.radius, p.radius))
+        inv_mass = np.zeros(len(position))
+        inv_mass[:s.count] = np.where(s.mass > 0, 1 / np.where(s.mass > 0,
+                                        s.mass, 1), 0)
+        move = velocity * self.dt
+        speed = np.hypot(move[:, 0], move[:, 1])
+
+        # only pairs in neighbouring cells of the broadphase can touch
+        reach = s.radius.max() + radius.max() + 2 * speed.max()
+        rows, others = candidate_pairs(self._circle_grid, s.position,
+                                        position, reach)
+        # every pair of spaceships once, without yourself
+        once = (others >= s.count) | (rows < others)
+        rows, others = rows[once], others[once]
+        toi = swept_circle_circle(position[rows], move[rows],
+                                    position[others], move[others],
+                                    radius[rows] + radius[others])
+        touching = toi <= 1
+        rows, others = rows[touching], others[touching]
+
+        impact = resolve_contacts(position, velocity, inv_mass, radius, rows,
+                                    others, self.dt, self.restitution,
+                                    self.contact_iterations)
+        s.position = position[:s.count]
+        s.velocity = velocity[:s.count]
+
+        # only actual collisions are reported, not circles resting on each
+        # other
+        rows, others = rows[impact], others[impact]
+        is_ship = others < s.count
+        self._add_events(EVENT_SHIP_BOUNCE, s.ids[rows[is_ship]],
+                            s.ids[others[is_ship]])
+        self._add_events(EVENT_PLANET_BOUNCE, s.ids[rows[~is_ship]],
+                            p.ids[others[~is_ship] - s.count])
+
+
+
+    def _add_events(self, kind, ids, other_ids):
+        """
+        Note events of the current step and publish them on the event bus
+        args
+            kind        (int)       one of the EVENT_* constants
+            ids         (ndarray)   (E,) id of the spaceship of every event
+            other_ids   (ndarray)   (E,) id of the other entity
+        """
+        if len(ids):
+            self._events.append(np.column_stack(
+                (np.full(len(ids), kind), ids, other_ids)).astype(np.int64))
+            self.event_bus.emit(kind, self.frame_count, ids, other_ids)
+
+
+
+    def step(self, n=1):
+        """
+        Advance the simulation
+        args
+            n           (int)       number of steps to advance
+        """
+        for _ in range(n):
+            if self.history is not None:
+                self.history.push(self.snapshot())
+            self._events = []
+            # integration does not include the gravity evaluations, they are
+            # timed as a stage of their own
+            with self.profiler.stage("integration"):
+                self._update_missiles()
+                self._update_spaceships()
+            with self.profiler.stage("remove_objects"):
+                self.remove_objects()
+            with self.profiler.stage("collision"):
+                self._touch_circles()
+            self.frame_count += 1
+            self.event_bus.maybe_flush()
+
+
+
+    def close(self):
+        """
+        Write the remaining logged events and stop the background threads
+        """
+        self.event_bus.close()
+        self.sounds.close()
+
+
+
+    def snapshot(self):
+        """
+        Capture the complete dynamic state of the world (including its random
+        generator) in a compact binary buffer, see snapshot.py
+        returns
+            snapshot    (bytes)
+        """
+        return take_snapshot(self)
+
+
+
+    def restore(self, snapshot):
+        """
+        Return to a state captured by snapshot(). Handles stay valid for all
+        entities that exist in the restored state.
+        args
+            snapshot    (bytes)     created by snapshot()
+        """
+        restore_snapshot(self, snapshot)
+
+
+
+    def rewind(self, steps=1):
+        """
+        Undo the last steps, which requires a rewind_depth of at least steps
+        args
+            steps       (int)       number of steps to undo
+        """
+        if self.history is None:
+            raise RuntimeError("world keeps no history, set rewind_depth")
+        self.restore(self.history.pop(steps))
+
+
+
+
+
+def step_worlds(worlds, n=1, executor=None):
+    """
+    Advance several independent worlds. Worlds share no state, so they can
+    be stepped concurrently, e.g. by a concurrent.futures.ThreadPoolExecutor
+    (numpy releases the GIL inside its larger operations).
+    args
+        worlds      (list)      of World
+        n           (int)       number of steps to advance every world
+        executor    (Executor)  runs the worlds concurrently, one after the
+                                    other if None
+    """
+    if executor is None:
+        for world in worlds:
+            world.step(n)
+        return
+    for future in [executor.submit(world.step, n) for world in worlds]:
+        future.result()